@@ -4,15 +4,51 @@ import threading
 import time
 import datetime
 import random
-import tkinter as tk
-from tkinter import messagebox, filedialog
-import customtkinter as ctk
+try:
+    import tkinter as tk
+    from tkinter import messagebox, filedialog
+    import customtkinter as ctk
+except ImportError:  # Headless installs (CI, embedding): everything except the GUI works
+    tk = messagebox = filedialog = ctk = None
+try:
+    import fcntl
+except ImportError:  # Windows: no send-queue depth in client observation
+    fcntl = None
 import re
 import argparse
 import os
 import json
+import sys
+import atexit
+import signal
+import operator
+import heapq
+import itertools
+import collections
+import collections.abc
+import csv
+import sqlite3
+import bisect
+import struct
+import stat
+import http.server
+import multiprocessing
+import urllib.parse
+from array import array
 
 CONTROLLERS_DIR = "controllers"
+CONTROLLERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), CONTROLLERS_DIR)
+MAX_SPINDLES = 99  # MID 0101 field 01 (number of spindles) is two digits
+MAX_MESSAGE_LENGTH = 9999  # Four-digit length field
+MAX_MESSAGE_PARTS = 9  # One-digit "number of message parts" header field
+DEFAULT_LINK_TIMEOUT = 15.0  # Seconds without any message before the controller drops the link
+LINK_LEVEL_MIDS = (b"9997", b"9998")  # Link-level acks are never sequenced or acknowledged
+LINK_NAK_INVALID_SEQUENCE = 2  # MID 9998 error code for an unreadable header sequence number
+
+
+def _require_gui():
+    if ctk is None:
+        raise RuntimeError("The GUI needs tkinter and customtkinter (pip install customtkinter)")
 
 # Helper: Build an Open Protocol message.
 def build_message(mid: int, rev: int = 1, data: str = "", no_ack: bool = False,
@@ -37,7 +73,1906 @@ def build_message(mid: int, rev: int = 1, data: str = "", no_ack: bool = False,
     message = f"{length_str}{body}\x00"
     return message.encode('ascii')
 
+def build_message_parts(mid: int, rev: int = 1, data: bytes = b"", no_ack: bool = False,
+                        station: str = "00", spindle: str = "00") -> list:
+    """
+    Construct an Open Protocol message whose data field may contain binary data.
+    Data longer than one frame allows is split into up to 9 parts, numbered in
+    header bytes 19-20 (number of message parts, message part number).
+    Returns a list of bytes objects, one per part.
+    """
+    max_data = MAX_MESSAGE_LENGTH - 20
+    num_parts = max(1, -(-len(data) // max_data))
+    if num_parts > MAX_MESSAGE_PARTS:
+        raise ValueError(f"Data too large: {len(data)} bytes needs {num_parts} parts (max {MAX_MESSAGE_PARTS})")
+    prefix = f"{mid:04d}{rev:03d}{'1' if no_ack else '0'}{station}{spindle}"
+    view = memoryview(data)
+    parts = []
+    for part_num in range(1, num_parts + 1):
+        chunk = view[(part_num - 1) * max_data:part_num * max_data]
+        spare = "    " if num_parts == 1 else f"  {num_parts}{part_num}"
+        header = f"{20 + len(chunk):04d}{prefix}{spare}".encode('ascii')
+        parts.append(b"".join((header, chunk, b"\x00")))
+    return parts
+
+class VirtualClock:
+    """
+    Controller time for timestamps and simulation timers: wall-clock time, moved by
+    set_time() (MID 0082) and running `speed` times faster than real time, so an
+    8-hour shift of auto-loop cadence can be simulated in minutes. timestamp() formats
+    each virtual second once. Link-level timers (keep-alive, acks) stay in real time.
+    """
+    FORMAT = "%Y-%m-%d:%H:%M:%S"
+
+    def __init__(self, speed: float = 1.0):
+        self._lock = threading.Lock()
+        self._anchor_mono = time.monotonic()
+        self._anchor_virtual = time.time()
+        self.speed = 1.0
+        self._cache = (None, "")
+        self.set_speed(speed)
+
+    def now(self) -> float:
+        """Virtual time as seconds since the epoch."""
+        return self._anchor_virtual + (time.monotonic() - self._anchor_mono) * self.speed
+
+    def _reanchor(self, virtual_now: float, speed: float):
+        with self._lock:
+            self._anchor_mono = time.monotonic()
+            self._anchor_virtual = virtual_now
+            self.speed = speed
+            self._cache = (None, "")
+
+    def set_speed(self, speed: float) -> None:
+        """Change the time-warp factor without a jump in virtual time."""
+        if speed <= 0:
+            raise ValueError(f"Clock speed must be > 0, got {speed}")
+        self._reanchor(self.now(), float(speed))
+
+    def set_time(self, when: datetime.datetime) -> None:
+        """Jump virtual time to `when` (local time), keeping the speed."""
+        self._reanchor(when.timestamp(), self.speed)
+
+    def datetime(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.now())
+
+    def timestamp(self) -> str:
+        """Current virtual time as YYYY-MM-DD:HH:MM:SS, formatted once per virtual second."""
+        second = int(self.now())
+        cached = self._cache
+        if cached[0] != second:
+            cached = self._cache = (second, time.strftime(self.FORMAT, time.localtime(second)))
+        return cached[1]
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep for `seconds` of virtual time."""
+        time.sleep(seconds / self.speed)
+
+
+class LinkWatchdog:
+    """
+    Shared timer that expires connections idle for longer than their link timeout.
+    Recording activity is a single dict write; deadlines live in a heap served by one
+    daemon thread, and entries whose connection saw traffic are re-armed lazily when due.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []        # (deadline, key)
+        self._watched = {}     # key -> (timeout, on_expire)
+        self._activity = {}    # key -> monotonic time of last activity
+        self._keys = itertools.count(1)
+        self._thread = None
+
+    def watch(self, timeout: float, on_expire) -> int:
+        """Start watching a connection. on_expire(idle_seconds) runs on the watchdog thread."""
+        key = next(self._keys)
+        now = time.monotonic()
+        with self._cond:
+            self._watched[key] = (timeout, on_expire)
+            self._activity[key] = now
+            heapq.heappush(self._heap, (now + timeout, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return key
+
+    def touch(self, key: int) -> None:
+        """Record activity on a watched connection."""
+        self._activity[key] = time.monotonic()
+
+    def unwatch(self, key: int) -> None:
+        """Stop watching a connection (its heap entry is discarded when it comes due)."""
+        with self._cond:
+            self._watched.pop(key, None)
+            self._activity.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, key = self._heap[0]
+                now = time.monotonic()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+                heapq.heappop(self._heap)
+                entry = self._watched.get(key)
+                if entry is None:
+                    continue
+                timeout, on_expire = entry
+                last = self._activity.get(key, now)
+                if now - last < timeout:
+                    heapq.heappush(self._heap, (last + timeout, key))
+                    continue
+                del self._watched[key]
+                self._activity.pop(key, None)
+            try:
+                on_expire(now - last)
+            except Exception as e:
+                print(f"[Watchdog] Expiry callback failed: {e}")
+
+
+LINK_WATCHDOG = LinkWatchdog()
+
+class ClientObserver:
+    """
+    Per-connection view of how the client behaves: intervals between its keep-alives
+    and periodic kernel samples of the socket (TCP_INFO RTT, retransmits and unacked
+    segments on Linux, plus unacknowledged bytes in the send queue). The client is
+    flagged as the bottleneck while data is queued and the kernel is backing off
+    (zero receive window or losses) or the queue fills half the send buffer, i.e. the
+    client, or its network, does not take data as fast as the emulator writes.
+    """
+    TCP_INFO_FORMAT = "8B24I"  # struct tcp_info up to tcpi_total_retrans
+    SIOCOUTQ = 0x5411  # Linux ioctl: bytes in the send queue not yet acknowledged by the peer
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._lock = threading.Lock()
+        self.keepalives = 0
+        self._last_keepalive = None
+        self._interval_total = 0.0
+        self._interval_last = None
+        self._interval_max = 0.0
+        self.samples = 0
+        self.tcp = None  # Latest kernel sample
+        self.rtt_max_ms = 0.0
+        self.client_limited = False
+        self.limited_samples = 0  # Samples in which the client was the bottleneck
+
+    def keepalive(self) -> None:
+        """Record a MID 9999 from the client."""
+        now = time.monotonic()
+        with self._lock:
+            if self._last_keepalive is not None:
+                interval = now - self._last_keepalive
+                self._interval_total += interval
+                self._interval_last = interval
+                self._interval_max = max(self._interval_max, interval)
+            self._last_keepalive = now
+            self.keepalives += 1
+
+    def sample(self) -> dict:
+        """Read TCP_INFO and the send-queue depth from the socket; returns the sample."""
+        sample = {}
+        tcp_info = getattr(socket, "TCP_INFO", None)
+        if tcp_info is not None and self.sock.family in (socket.AF_INET, socket.AF_INET6):
+            try:
+                raw = self.sock.getsockopt(socket.IPPROTO_TCP, tcp_info, struct.calcsize(self.TCP_INFO_FORMAT))
+                info = struct.unpack(self.TCP_INFO_FORMAT, raw.ljust(struct.calcsize(self.TCP_INFO_FORMAT), b"\0"))
+                sample.update(rtt_ms=info[8 + 15] / 1000, rttvar_ms=info[8 + 16] / 1000, backoff=info[4],
+                              unacked=info[8 + 4], retransmits=info[8 + 23], cwnd=info[8 + 18])
+            except (OSError, struct.error):
+                pass
+        sndbuf = 0
+        if fcntl is not None:
+            try:
+                sample["send_queue"] = struct.unpack("i", fcntl.ioctl(self.sock.fileno(), self.SIOCOUTQ, b"\0" * 4))[0]
+                sndbuf = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)  # Auto-tuned, so read each time
+            except OSError:
+                pass
+        queued = sample.get("send_queue", 0)
+        with self._lock:
+            self.samples += 1
+            self.tcp = sample or None
+            self.rtt_max_ms = max(self.rtt_max_ms, sample.get("rtt_ms", 0.0))
+            self.client_limited = queued > 0 and (sample.get("backoff", 0) > 0 or bool(sndbuf) and queued * 2 >= sndbuf)
+            self.limited_samples += self.client_limited
+        return sample
+
+    def stats(self) -> dict:
+        with self._lock:
+            intervals = self.keepalives - 1
+            return {
+                "keepalives": self.keepalives,
+                "keepalive_interval_s": {
+                    "last": self._interval_last,
+                    "avg": self._interval_total / intervals if intervals > 0 else None,
+                    "max": self._interval_max if intervals > 0 else None},
+                "tcp": dict(self.tcp) if self.tcp else None,
+                "rtt_max_ms": self.rtt_max_ms,
+                "samples": self.samples,
+                "client_limited": self.client_limited,
+                "limited_samples": self.limited_samples,
+            }
+
+
+class ClientSampler:
+    """
+    One daemon thread that samples every registered ClientObserver at its interval,
+    with due times kept in a heap (same scheme as LinkWatchdog). on_sample runs on the
+    sampler thread after each sample.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []      # (due, key)
+        self._entries = {}   # key -> (observer, interval, on_sample)
+        self._keys = itertools.count(1)
+        self._thread = None
+
+    def register(self, observer: ClientObserver, interval: float, on_sample=None) -> int:
+        key = next(self._keys)
+        with self._cond:
+            self._entries[key] = (observer, interval, on_sample)
+            heapq.heappush(self._heap, (time.monotonic() + interval, key))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return key
+
+    def unregister(self, key: int) -> None:
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, key = self._heap[0]
+                now = time.monotonic()
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._heap)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                observer, interval, on_sample = entry
+                heapq.heappush(self._heap, (max(due + interval, now), key))
+            observer.sample()
+            if on_sample is not None:
+                try:
+                    on_sample()
+                except Exception as e:
+                    print(f"[Observe] Sample callback failed: {e}")
+
+
+CLIENT_SAMPLER = ClientSampler()
+
+class ProfileCatalogue:
+    """
+    Controller profiles from the controllers folder, parsed once and indexed by name.
+    The folder is re-scanned only when its mtime changes and a profile is re-parsed
+    only when its file's mtime changes; stat checks are throttled to one per
+    `check_interval` seconds so listing and switching profiles stays off the disk.
+    """
+
+    def __init__(self, directory: str, check_interval: float = 1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._profiles = {}    # Name -> parsed profile (revisions keyed by int MID)
+        self._mtimes = {}      # Name -> file mtime when parsed
+        self._dir_mtime = None
+        self._checked = None   # Monotonic time of the last stat pass
+
+    @staticmethod
+    def parse(profile_data: dict, default_name: str) -> dict:
+        """Validate a profile JSON object and normalise its revision keys to int MIDs."""
+        if "revisions" not in profile_data:
+            raise ValueError("Invalid profile file: missing 'revisions' key")
+        profile = {
+            "name": profile_data.get("name", default_name),
+            "description": profile_data.get("description", f"Custom profile: {default_name}"),
+            "revisions": {int(mid): int(rev) for mid, rev in profile_data["revisions"].items()},
+        }
+        if "relay_mappings" in profile_data:
+            profile["relay_mappings"] = dict(profile_data["relay_mappings"])
+        if "impairment" in profile_data:
+            profile["impairment"] = dict(profile_data["impairment"])
+        return profile
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def refresh(self, force: bool = False) -> list:
+        """Pick up added, removed and modified profiles. Returns names that were (re)loaded."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return []
+            self._checked = now
+            try:
+                dir_mtime = os.stat(self.directory).st_mtime_ns
+            except OSError:
+                self._profiles.clear()
+                self._mtimes.clear()
+                self._dir_mtime = None
+                return []
+            if force or dir_mtime != self._dir_mtime:
+                names = [f[:-5] for f in os.listdir(self.directory) if f.endswith('.json')]
+                self._dir_mtime = dir_mtime
+            else:
+                names = list(self._mtimes)
+            changed = []
+            for name in names:
+                try:
+                    mtime = os.stat(self.path(name)).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if mtime is None:
+                    self._profiles.pop(name, None)
+                    self._mtimes.pop(name, None)
+                    continue
+                if self._mtimes.get(name) == mtime:
+                    continue
+                self._mtimes[name] = mtime
+                try:
+                    with open(self.path(name), 'r') as f:
+                        self._profiles[name] = self.parse(json.load(f), name)
+                    changed.append(name)
+                except (OSError, ValueError, AttributeError) as e:
+                    self._profiles.pop(name, None)
+                    print(f"[Profile] Skipping invalid profile '{name}': {e}")
+            for name in set(self._mtimes) - set(names):
+                self._profiles.pop(name, None)
+                del self._mtimes[name]
+            return changed
+
+    def names(self) -> list:
+        self.refresh()
+        with self._lock:
+            return sorted(self._profiles)
+
+    def get(self, name: str):
+        """Parsed profile by name, or None."""
+        self.refresh()
+        with self._lock:
+            return self._profiles.get(name)
+
+    def get_versioned(self, name: str) -> tuple:
+        """(parsed profile, version) by name, or (None, None). The version changes whenever the file is re-parsed."""
+        self.refresh()
+        with self._lock:
+            profile = self._profiles.get(name)
+            return (profile, self._mtimes.get(name)) if profile is not None else (None, None)
+
+
+PROFILE_CATALOGUE = ProfileCatalogue(CONTROLLERS_PATH)
+
+class PsetStore(collections.abc.MutableMapping):
+    """
+    Parameter sets keyed by three-digit Pset ID ("001"-"999"). Values live in typed
+    columns (array per field) with a dict index from ID to row, so lookups are O(1)
+    and thousands of Psets cost a few bytes each. Behaves like a dict of parameter
+    dicts; `version` changes on every edit so encoders can cache per version.
+    """
+    FIELDS = (("batch_size", 'l', 5), ("target_torque", 'd', 50.00), ("torque_min", 'd', 47.00),
+              ("torque_max", 'd', 53.00), ("target_angle", 'l', 90), ("angle_min", 'l', 80),
+              ("angle_max", 'l', 100))
+    CSV_COLUMNS = ("pset_id", "name") + tuple(name for name, _, _ in FIELDS)
+    MAX_PSET_ID = 999  # Pset IDs are three digits in MID 0011/0013/0018
+
+    def __init__(self):
+        self._index = {}   # Pset ID -> row
+        self._ids = []     # Row -> Pset ID
+        self._names = []
+        self._columns = tuple(array(code) for _, code, _ in self.FIELDS)
+        self.version = 0
+
+    @classmethod
+    def normalize_id(cls, pset_id) -> str:
+        """Return the three-digit form of a Pset ID, raising ValueError if it is out of range."""
+        try:
+            num = int(str(pset_id).strip())
+        except ValueError:
+            raise ValueError(f"Invalid Pset ID: {pset_id!r}") from None
+        if not 1 <= num <= cls.MAX_PSET_ID:
+            raise ValueError(f"Pset ID must be 1-{cls.MAX_PSET_ID}, got {pset_id!r}")
+        return f"{num:03d}"
+
+    def __getitem__(self, pset_id) -> dict:
+        row = self._index[pset_id]
+        params = {name: col[row] for (name, _, _), col in zip(self.FIELDS, self._columns)}
+        if self._names[row]:
+            params["name"] = self._names[row]
+        return params
+
+    def __setitem__(self, pset_id, params: dict) -> None:
+        row = self._index.get(pset_id)
+        if row is None:
+            row = self._index[pset_id] = len(self._ids)
+            self._ids.append(pset_id)
+            self._names.append(str(params.get("name", "")))
+            for (name, code, default), col in zip(self.FIELDS, self._columns):
+                value = params.get(name, default)
+                col.append(float(value) if code == 'd' else int(value))
+        else:
+            if "name" in params:
+                self._names[row] = str(params["name"])
+            for (name, code, _), col in zip(self.FIELDS, self._columns):
+                if name in params:
+                    col[row] = float(params[name]) if code == 'd' else int(params[name])
+        self.version += 1
+
+    def __delitem__(self, pset_id) -> None:
+        row = self._index.pop(pset_id)
+        last = len(self._ids) - 1
+        if row != last:  # Move the last row into the hole
+            moved = self._ids[last]
+            self._ids[row] = moved
+            self._names[row] = self._names[last]
+            for col in self._columns:
+                col[row] = col[last]
+            self._index[moved] = row
+        self._ids.pop()
+        self._names.pop()
+        for col in self._columns:
+            col.pop()
+        self.version += 1
+
+    def __iter__(self):
+        return iter(list(self._ids))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, pset_id) -> bool:
+        return pset_id in self._index
+
+    def sorted_ids(self) -> list:
+        return sorted(self._ids)
+
+    def name(self, pset_id) -> str:
+        return self._names[self._index[pset_id]]
+
+    def limits(self, pset_id):
+        """(target_torque, torque_min, torque_max, target_angle, angle_min, angle_max, batch_size) or None."""
+        row = self._index.get(pset_id)
+        if row is None:
+            return None
+        batch, target_t, t_min, t_max, target_a, a_min, a_max = self._columns
+        return (target_t[row], t_min[row], t_max[row], target_a[row], a_min[row], a_max[row], batch[row])
+
+
+class JsonWriteBehind:
+    """
+    Debounced background writer for a JSON file. mark_dirty() only sets a flag; a
+    daemon thread waits until no change has arrived for `delay` seconds (at most
+    `max_delay` after the first one), takes a snapshot and writes it to a temp file
+    that is fsynced and renamed over the target, so the file is always complete.
+    """
+
+    def __init__(self, path: str, snapshot, delay: float = 0.5, max_delay: float = 5.0):
+        self.path = path
+        self.snapshot = snapshot  # Callable returning a JSON-serialisable copy of the state
+        self.delay = delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._dirty_since = None  # Monotonic time of the first unsaved change
+        self._last_change = None
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self.writes = 0
+        self.last_error = None
+
+    def mark_dirty(self, key=None) -> None:
+        """Record a change (key is ignored; the whole file is rewritten); never blocks on disk I/O."""
+        now = time.monotonic()
+        with self._cond:
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_change = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._dirty_since is None:
+                    if not self._cond.wait(self.max_delay) and self._dirty_since is None:
+                        self._thread = None  # Idle: exit; the next mark_dirty() starts a new thread
+                        return
+                now = time.monotonic()
+                due = min(self._last_change + self.delay, self._dirty_since + self.max_delay)
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+            self.flush()
+
+    def flush(self) -> bool:
+        """Write pending changes now. Returns True if the file is up to date."""
+        with self._write_lock:
+            with self._cond:
+                if self._dirty_since is None:
+                    return True
+                self._dirty_since = self._last_change = None
+            try:
+                self._write(self.snapshot())
+                self.writes += 1
+                self.last_error = None
+                return True
+            except (OSError, TypeError, ValueError) as e:
+                self.last_error = str(e)
+                print(f"[Persist] Error writing {self.path}: {e}")
+                with self._cond:
+                    if self._dirty_since is None:
+                        self._dirty_since = self._last_change = time.monotonic()
+                return False
+
+    def _write(self, data) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+
+class OutboundQueue:
+    """
+    Outbound frames for one connection, drained by a single writer thread.
+    Each subscribed event MID has its own bounded queue with an overflow policy:
+    "block" waits up to `block_timeout` for space and then drops the new frame,
+    "drop_oldest" discards the oldest queued frame, and "coalesce" replaces a queued
+    frame for the same status (per relay for MID 0217) with the latest one. Keep-alives
+    and command replies have unbounded queues of their own. The writer serves priority
+    classes strictly (link/keep-alive, then command replies, then events) and in
+    submission order within a class; queueing delay is measured per class.
+    """
+    POLICIES = ("block", "drop_oldest", "coalesce")
+    CLASSES = ("link", "reply", "event")
+    LINK_MIDS = (b"9999",) + LINK_LEVEL_MIDS
+
+    def __init__(self, policies: dict, block_timeout: float):
+        self.policies = policies  # Event MID -> (policy, limit); shared with the emulator
+        self.block_timeout = block_timeout
+        self._event_mids = {f"{mid:04d}".encode('ascii'): mid for mid in policies}
+        self._cond = threading.Condition()
+        self._queues = {}     # "link", "reply" or event MID -> deque of [order, frame, coalesce key, queued at]
+        self._classes = tuple({} for _ in self.CLASSES)  # Priority -> {queue key: deque}
+        self._delays = [[0, 0.0, 0.0] for _ in self.CLASSES]  # Priority -> [frames, total s, max s]
+        self._coalesce = {}   # Coalesce key -> queued entry
+        self._order = itertools.count()
+        self._unfinished = 0  # Queued frames plus the one the writer is sending
+        self._closed = False
+        self._stats = {}
+
+    def _stat(self, mid) -> dict:
+        st = self._stats.get(mid)
+        if st is None:
+            st = self._stats[mid] = {"enqueued": 0, "sent": 0, "dropped": 0, "coalesced": 0,
+                                     "block_timeouts": 0, "max_depth": 0}
+        return st
+
+    def _classify(self, frame: bytes):
+        """Queue key and priority class of a frame."""
+        mid = self._event_mids.get(frame[4:8])
+        if mid is not None:
+            return mid, 2
+        if frame[4:8] in self.LINK_MIDS:
+            return "link", 0
+        return "reply", 1
+
+    def put(self, frame: bytes) -> bool:
+        """Queue a frame according to its MID's policy. Returns False if it was dropped."""
+        with self._cond:
+            queued = self._put_locked(frame)
+            self._cond.notify_all()
+            return queued
+
+    def put_many(self, frames) -> int:
+        """Queue a batch of frames under one lock acquisition. Returns how many were dropped."""
+        dropped = 0
+        with self._cond:
+            for frame in frames:
+                if not self._put_locked(frame):
+                    dropped += 1
+            self._cond.notify_all()
+        return dropped
+
+    def _put_locked(self, frame: bytes) -> bool:
+        if self._closed:
+            return False
+        key, priority = self._classify(frame)
+        mid = key if priority == 2 else None
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = self._classes[priority][key] = collections.deque()
+        st = self._stat(key)
+        st["enqueued"] += 1
+        coalesce_key = None
+        if mid is not None:
+            policy, limit = self.policies[mid]
+            if policy == "coalesce":
+                coalesce_key = (mid, frame[20:25]) if mid == 217 else mid
+                entry = self._coalesce.get(coalesce_key)
+                if entry is not None:
+                    entry[1] = frame
+                    st["coalesced"] += 1
+                    return True
+            if len(queue) >= limit:
+                if policy == "block":
+                    self._cond.notify_all()  # The writer may not have seen earlier frames of a batch
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(queue) >= limit and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            st["block_timeouts"] += 1
+                            st["dropped"] += 1
+                            return False
+                        self._cond.wait(remaining)
+                    if self._closed:
+                        return False
+                else:
+                    old = queue.popleft()
+                    if old[2] is not None:
+                        self._coalesce.pop(old[2], None)
+                    st["dropped"] += 1
+                    self._unfinished -= 1
+        entry = [next(self._order), frame, coalesce_key, time.monotonic()]
+        queue.append(entry)
+        self._unfinished += 1
+        if coalesce_key is not None:
+            self._coalesce[coalesce_key] = entry
+        if len(queue) > st["max_depth"]:
+            st["max_depth"] = len(queue)
+        return True
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def get(self, timeout: float = None):
+        """
+        Block until a frame is available and return (frame, monotonic enqueue time).
+        Returns None once closed or when `timeout` seconds pass without a frame.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                head_key = None
+                head_order = None
+                for priority, queues in enumerate(self._classes):
+                    for key, queue in queues.items():
+                        if queue and (head_order is None or queue[0][0] < head_order):
+                            head_key, head_order = key, queue[0][0]
+                    if head_order is not None:
+                        break
+                if head_order is not None:
+                    break
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+            entry = self._queues[head_key].popleft()
+            if entry[2] is not None:
+                self._coalesce.pop(entry[2], None)
+            self._stat(head_key)["sent"] += 1
+            delay = time.monotonic() - entry[3]
+            totals = self._delays[priority]
+            totals[0] += 1
+            totals[1] += delay
+            if delay > totals[2]:
+                totals[2] = delay
+            self._cond.notify_all()
+            return entry[1], entry[3]
+
+    def task_done(self):
+        """Called by the writer after a frame from get() has been written."""
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def wait_empty(self, timeout: float) -> bool:
+        """Wait until every queued frame has been written."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._unfinished > 0 and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self):
+        """Discard queued frames and release the writer and any blocked producers."""
+        with self._cond:
+            self._closed = True
+            self._queues.clear()
+            for queues in self._classes:
+                queues.clear()
+            self._coalesce.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Per queue ("link", "reply" or event MID): counters and current depth."""
+        with self._cond:
+            return {key: dict(st, depth=len(self._queues.get(key, ())))
+                    for key, st in self._stats.items()}
+
+    def delay_stats(self) -> dict:
+        """Per priority class: frames sent, average and maximum queueing delay (ms), current depth."""
+        with self._cond:
+            return {name: {"sent": count,
+                           "avg_ms": round(total * 1000.0 / count, 3) if count else 0.0,
+                           "max_ms": round(peak * 1000.0, 3),
+                           "depth": sum(len(q) for q in self._classes[priority].values())}
+                    for priority, (name, (count, total, peak)) in enumerate(zip(self.CLASSES, self._delays))}
+
+
+class LinkImpairment:
+    """
+    Latency, jitter and bandwidth shaping for one connection, applied by its writer
+    thread so a slow link never holds up producers or other connections. Each frame
+    is released no earlier than its enqueue time plus a sampled delay (never ahead of
+    the previous frame, as on a real TCP stream), and no faster than `bandwidth_bps`.
+    Config: {"latency_ms", "jitter_ms", "distribution", "bandwidth_bps", "seed",
+    "mids": {"0061": {"latency_ms", "jitter_ms", "distribution"}, ...}}.
+    """
+    DISTRIBUTIONS = ("uniform", "normal", "exponential")
+
+    def __init__(self, config: dict = None):
+        self._stop = threading.Event()
+        self.frames_delayed = 0
+        self.added_delay = 0.0
+        self.configure(config or {})
+
+    @classmethod
+    def validate(cls, config: dict) -> dict:
+        """Normalise an impairment config; raises ValueError on bad values."""
+        def delay_spec(spec, where):
+            latency = float(spec.get("latency_ms", 0))
+            jitter = float(spec.get("jitter_ms", 0))
+            distribution = spec.get("distribution", "uniform")
+            if latency < 0 or jitter < 0:
+                raise ValueError(f"{where}: latency_ms and jitter_ms must be >= 0")
+            if distribution not in cls.DISTRIBUTIONS:
+                raise ValueError(f"{where}: distribution must be one of {', '.join(cls.DISTRIBUTIONS)}")
+            return (latency / 1000.0, jitter / 1000.0, distribution)
+
+        bandwidth = float(config.get("bandwidth_bps", 0))
+        if bandwidth < 0:
+            raise ValueError("bandwidth_bps must be >= 0")
+        mids = {}
+        for mid, spec in config.get("mids", {}).items():
+            mids[f"{int(mid):04d}".encode('ascii')] = delay_spec(spec, f"MID {mid}")
+        return {"default": delay_spec(config, "impairment"), "mids": mids,
+                "bandwidth_bps": bandwidth, "seed": config.get("seed")}
+
+    def configure(self, config: dict) -> None:
+        """Replace the settings; takes effect from the next frame."""
+        settings = self.validate(config)
+        self._default = settings["default"]
+        self._mids = settings["mids"]
+        self._bandwidth = settings["bandwidth_bps"]
+        self._rng = random.Random(settings["seed"])
+        self.active = bool(self._bandwidth or self._mids or self._default[:2] != (0.0, 0.0))
+        self._release = 0.0    # Release time of the previous frame
+        self._line_free = 0.0  # When the shaped line has finished the previous frame
+
+    def _sample(self, mid: bytes) -> float:
+        latency, jitter, distribution = self._mids.get(mid, self._default)
+        if not jitter:
+            return latency
+        if distribution == "normal":
+            delay = self._rng.gauss(latency, jitter)
+        elif distribution == "exponential":
+            delay = latency + self._rng.expovariate(1.0 / jitter)
+        else:
+            delay = latency + self._rng.uniform(-jitter, jitter)
+        return max(0.0, delay)
+
+    def wait(self, frame: bytes, queued_at: float) -> bool:
+        """Sleep until the frame may be written. Returns False if the connection is closing."""
+        if not self.active:
+            return True
+        now = time.monotonic()
+        release = max(queued_at + self._sample(frame[4:8]), self._release, now)
+        if self._bandwidth:  # Store-and-forward: the frame is out once fully serialised on the line
+            release = max(release, self._line_free) + len(frame) * 8 / self._bandwidth
+            self._line_free = release
+        self._release = release
+        if release > now:
+            self.frames_delayed += 1
+            self.added_delay += release - now
+            return not self._stop.wait(release - now)
+        return True
+
+    def close(self):
+        self._stop.set()
+
+
+class FrameSegmenter:
+    """
+    How frames are cut into socket writes for one connection. "whole" writes each
+    frame with one sendall. "fragment" splits every frame into writes of
+    `min_bytes`-`max_bytes` at random boundaries, optionally `gap_ms` apart.
+    "coalesce" gathers frames and writes them as one segment once `coalesce_bytes`
+    are buffered or the oldest has waited `coalesce_ms`. The RNG is seedable.
+    """
+    MODES = ("whole", "fragment", "coalesce")
+
+    def __init__(self, config: dict = None):
+        self._buffer = []
+        self._buffered = 0
+        self._since = None
+        self.writes = 0
+        self.configure(config or {})
+
+    @classmethod
+    def validate(cls, config: dict) -> dict:
+        """Normalise a segmentation config; raises ValueError on bad values."""
+        settings = {
+            "mode": config.get("mode", "whole"),
+            "min_bytes": int(config.get("min_bytes", 1)),
+            "max_bytes": int(config.get("max_bytes", 16)),
+            "gap_ms": float(config.get("gap_ms", 0)),
+            "coalesce_bytes": int(config.get("coalesce_bytes", 65536)),
+            "coalesce_ms": float(config.get("coalesce_ms", 10)),
+            "seed": config.get("seed"),
+        }
+        if settings["mode"] not in cls.MODES:
+            raise ValueError(f"Segmentation mode must be one of {', '.join(cls.MODES)}, got {settings['mode']!r}")
+        if not 1 <= settings["min_bytes"] <= settings["max_bytes"]:
+            raise ValueError("Fragment sizes must satisfy 1 <= min_bytes <= max_bytes")
+        if settings["gap_ms"] < 0 or settings["coalesce_ms"] < 0 or settings["coalesce_bytes"] < 1:
+            raise ValueError("gap_ms and coalesce_ms must be >= 0 and coalesce_bytes >= 1")
+        return settings
+
+    def configure(self, config: dict) -> None:
+        settings = self.validate(config)
+        self.mode = settings["mode"]
+        self.min_bytes = settings["min_bytes"]
+        self.max_bytes = settings["max_bytes"]
+        self.gap = settings["gap_ms"] / 1000.0
+        self.coalesce_bytes = settings["coalesce_bytes"]
+        self.coalesce_hold = settings["coalesce_ms"] / 1000.0
+        self._rng = random.Random(settings["seed"])
+
+    def write(self, sock: socket.socket, frame: bytes, hold: bool = False) -> None:
+        """Write a frame; in coalesce mode `hold` lets it wait in the buffer for more frames."""
+        if self._buffer and self.mode != "coalesce":  # Mode changed while frames were held
+            self.flush(sock)
+        if self.mode == "fragment":
+            view = memoryview(frame)
+            pos = 0
+            while pos < len(frame):
+                size = self._rng.randint(self.min_bytes, self.max_bytes)
+                sock.sendall(view[pos:pos + size])
+                self.writes += 1
+                pos += size
+                if self.gap and pos < len(frame):
+                    time.sleep(self.gap)
+        elif self.mode == "coalesce":
+            if not self._buffer:
+                self._since = time.monotonic()
+            self._buffer.append(frame)
+            self._buffered += len(frame)
+            if not hold or self._buffered >= self.coalesce_bytes:
+                self.flush(sock)
+        else:
+            sock.sendall(frame)
+            self.writes += 1
+
+    def flush(self, sock: socket.socket) -> None:
+        """Write any coalesced frames as one segment."""
+        if self._buffer:
+            data = b"".join(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            self._since = None
+            sock.sendall(data)
+            self.writes += 1
+
+    def flush_timeout(self):
+        """Seconds until buffered frames must be written, or None if nothing is buffered."""
+        if self._since is None:
+            return None
+        return max(0.0, self._since + self.coalesce_hold - time.monotonic())
+
+
+class IODeviceSnapshot:
+    """
+    Encoded MID 0215 data for one I/O device in revisions 1 and 2. Every relay and
+    digital input owns a fixed status byte in each encoding, so a change patches one
+    byte in place; the finished frame per revision is cached until the next change.
+    Revision 1 reports the first 8 relays and inputs padded to 32 characters;
+    revision 2 reports up to 99 of each.
+    """
+    MAX_POINTS = 99  # Two-digit relay/input counts in revision 2
+
+    def __init__(self, device_num: str, device: dict):
+        self.device_num = device_num
+        relays, inputs = device["relays"], device["digital_inputs"]
+        if len(relays) > self.MAX_POINTS or len(inputs) > self.MAX_POINTS:
+            raise ValueError(f"I/O device {device_num}: at most {self.MAX_POINTS} relays and digital inputs")
+        self._lock = threading.Lock()
+        self._data = {1: bytearray(), 2: bytearray()}
+        self._relay_pos = []  # Relay index -> [(revision, byte offset), ...]
+        self._input_pos = []
+        rev1, rev2 = self._data[1], self._data[2]
+        rev1 += f"01{device_num}02".encode('ascii')
+        self._encode(rev1, relays[:8], self._relay_pos, 1, pad_to=8)
+        rev1 += b"03"
+        self._encode(rev1, inputs[:8], self._input_pos, 1, pad_to=8)
+        rev2 += f"01{device_num}02{len(relays):02d}03".encode('ascii')
+        self._encode(rev2, relays, self._relay_pos, 2)
+        rev2 += f"04{len(inputs):02d}05".encode('ascii')
+        self._encode(rev2, inputs, self._input_pos, 2)
+        self._frames = {}
+
+    @staticmethod
+    def _encode(buf: bytearray, points: list, positions: list, revision: int, pad_to: int = 0):
+        for i, point in enumerate(points):
+            buf += f"{point['function']:03d}{point['status']}".encode('ascii')
+            if i == len(positions):
+                positions.append([])
+            positions[i].append((revision, len(buf) - 1))
+        buf += b"0000" * max(0, pad_to - len(points))
+
+    def _patch(self, positions: list, index: int, status: int):
+        if index >= len(positions):
+            return
+        with self._lock:
+            for revision, offset in positions[index]:
+                self._data[revision][offset] = 48 + status  # ASCII digit
+            self._frames.clear()
+
+    def set_relay(self, index: int, status: int):
+        self._patch(self._relay_pos, index, status)
+
+    def set_input(self, index: int, status: int):
+        self._patch(self._input_pos, index, status)
+
+    def frame(self, revision: int) -> bytes:
+        """MID 0215 frame for revision 1 or 2 (2 for anything higher)."""
+        revision = 1 if revision <= 1 else 2
+        frame = self._frames.get(revision)
+        if frame is None:
+            with self._lock:
+                frame = self._frames[revision] = build_message_parts(215, revision, bytes(self._data[revision]))[0]
+        return frame
+
+
+class ResultPipeline:
+    """
+    Pre-encoded MID 0061 result outcomes. For the current Pset limits and NOK probability
+    a producer thread keeps `depth` outcomes drawn ahead, each already encoded as fields
+    09-19 (statuses, the Pset's torque x100 and angle limits, final torque and angle).
+    Random, forced-OK and forced-NOK outcomes have separate queues; take() pops one, or
+    draws it inline when the queue has run dry. New limits discard everything queued.
+    Each queue draws from its own RNG, derived from the seed given to reseed(), so a
+    seeded run gets the same outcomes whatever the producer thread's timing.
+    """
+
+    def __init__(self, depth: int = 64):
+        self.depth = depth
+        self._cond = threading.Condition()
+        self._key = None  # (limits, nok_probability) the queued outcomes were drawn for
+        self._limit_fields = None  # Pre-encoded fields 12-14 and 16-18
+        self._queues = {}  # force_nok (None/False/True) -> deque of (encoded, is_nok, torque, angle)
+        self._rngs = {}  # force_nok -> random.Random for that queue
+        self._seed = None
+        self._epoch = 0  # Bumped whenever queues are dropped, so RNGs restart from a known state
+        self._filling = None  # (force_nok, queue) the producer is drawing for outside the lock
+        self._thread = None
+        self.produced = 0
+        self.misses = 0  # Outcomes drawn inline by take()
+
+    def configure(self, limits: tuple, nok_probability: float) -> None:
+        """Switch to new Pset limits or NOK probability; queued outcomes are dropped."""
+        key = (limits, nok_probability)
+        with self._cond:
+            if key == self._key:
+                return
+            target_torque, torque_min, torque_max, target_angle, angle_min, angle_max, _ = limits
+            self._key = key
+            self._limit_fields = (
+                f"12{int(torque_min * 100):06d}13{int(torque_max * 100):06d}14{int(target_torque * 100):06d}",
+                f"16{int(angle_min):05d}17{int(angle_max):05d}18{int(target_angle):05d}")
+            self._reset()
+            self._wake()
+
+    def reseed(self, seed) -> None:
+        """Restart outcome draws from `seed` (None: unseeded); queued outcomes are dropped."""
+        with self._cond:
+            self._seed = seed
+            self._epoch = 0
+            self._reset()
+            self._wake()
+
+    def _reset(self) -> None:
+        # Called with self._cond held
+        self._epoch += 1
+        self._queues = {None: collections.deque()}
+        self._rngs = {}
+        self._filling = None
+
+    def _rng(self, force_nok) -> random.Random:
+        # Called with self._cond held
+        rng = self._rngs.get(force_nok)
+        if rng is None:
+            rng = random.Random() if self._seed is None else random.Random(f"{self._seed}/{self._epoch}/{force_nok}")
+            self._rngs[force_nok] = rng
+        return rng
+
+    def set_depth(self, depth: int) -> None:
+        # Outcomes above a smaller depth are kept, not dropped, so the drawn sequence is unchanged
+        with self._cond:
+            self.depth = depth
+            self._wake()
+
+    def take(self, force_nok: bool = None) -> tuple:
+        """Return (encoded fields 09-19, is_nok, torque, angle) for the next result."""
+        with self._cond:
+            queue = self._queues.get(force_nok)
+            if queue is None:
+                queue = self._queues[force_nok] = collections.deque()
+            while not queue and self._filling is not None and self._filling[1] is queue:
+                self._cond.wait()  # The producer is drawing this queue's next outcomes
+            entry = queue.popleft() if queue else None
+            if len(queue) <= self.depth // 2:
+                self._wake()
+            if entry is not None:
+                return entry
+            self.misses += 1
+            return self._make(self._key, self._limit_fields, force_nok, self._rng(force_nok))
+
+    def _wake(self) -> None:
+        # Called with self._cond held
+        if self.depth <= 0 or self._key is None:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _run(self):
+        batch = 8  # Small batches so a refill never holds the GIL for long
+        while True:
+            with self._cond:
+                short = None
+                while short is None:
+                    short = next(((f, q) for f, q in self._queues.items() if len(q) < self.depth), None)
+                    if short is None and not self._cond.wait(5.0):
+                        self._thread = None  # Idle: exit; the next take() starts a new thread
+                        return
+                force_nok, queue = short
+                key, limit_fields, rng = self._key, self._limit_fields, self._rng(force_nok)
+                count = min(batch, self.depth - len(queue))
+                self._filling = short
+            entries = [self._make(key, limit_fields, force_nok, rng) for _ in range(count)]
+            with self._cond:
+                if self._filling is short:
+                    self._filling = None
+                    queue.extend(entries)
+                    self.produced += len(entries)
+                    self._cond.notify_all()
+
+    @staticmethod
+    def draw(limits: tuple, nok_probability: float, force_nok: bool = None, rng=random) -> tuple:
+        """Draw (status, torque_status, angle_status, torque, angle) for one result from `rng`."""
+        _, torque_min, torque_max, _, angle_min, angle_max, _ = limits
+        is_nok = rng.random() < nok_probability if force_nok is None else force_nok
+        status = "0" if is_nok else "1"
+        torque_status = "1"
+        angle_status = "1"
+        actual_torque = rng.uniform(torque_min, torque_max)
+        actual_angle = rng.uniform(angle_min, angle_max)
+
+        if is_nok:
+            if rng.choice(["torque", "angle"]) == "torque":
+                torque_status = rng.choice(["0", "2"])
+                actual_torque = rng.uniform(torque_min - 5, torque_min - 0.1) if torque_status == "0" else rng.uniform(torque_max + 0.1, torque_max + 5)
+            else:
+                angle_status = rng.choice(["0", "2"])
+                actual_angle = rng.uniform(angle_min - 20, angle_min - 1) if angle_status == "0" else rng.uniform(angle_max + 1, angle_max + 20)
+        return status, torque_status, angle_status, actual_torque, actual_angle
+
+    @staticmethod
+    def _make(key: tuple, limit_fields: tuple, force_nok, rng: random.Random) -> tuple:
+        limits, nok_probability = key
+        status, torque_status, angle_status, torque, angle = ResultPipeline.draw(limits, nok_probability, force_nok, rng)
+        encoded = (f"09{status}10{torque_status}11{angle_status}{limit_fields[0]}15{int(torque * 100):06d}"
+                   f"{limit_fields[1]}19{int(angle):05d}").encode('ascii')
+        return encoded, status == "0", torque, angle
+
+
+class EventAckTracker:
+    """
+    Application-level acknowledgement tracking for subscribed events.
+    Each event MID keeps a FIFO of unacknowledged send times; an ack completes the
+    oldest one and its latency goes into a histogram. Events not acknowledged within
+    `timeout` seconds are counted as missing. With `hold` set, the next event of a MID
+    is queued until the previous one is acknowledged or declared missing, as real
+    controllers do.
+    """
+    EVENT_ACKS = {62: 61, 53: 52, 16: 15, 218: 217, 102: 101}  # Ack MID -> event MID
+    EVENT_MIDS = {f"{mid:04d}".encode('ascii'): mid for mid in EVENT_ACKS.values()}
+    HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, timeout: float = 10.0, hold: bool = False):
+        self.timeout = timeout
+        self.hold = hold
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget in-flight events and statistics (called at session start)."""
+        with self._lock:
+            self._in_flight = {mid: collections.deque() for mid in self.EVENT_ACKS.values()}
+            self._held = {mid: collections.deque() for mid in self.EVENT_ACKS.values()}
+            self._stats = {mid: {"sent": 0, "acked": 0, "missing": 0, "unexpected_acks": 0,
+                                 "latency_total": 0.0, "latency_max": 0.0,
+                                 "histogram": [0] * (len(self.HISTOGRAM_BOUNDS_MS) + 1)}
+                           for mid in self.EVENT_ACKS.values()}
+
+    def submit(self, event_mid: int, frame: bytes) -> list:
+        """Record an event that requires an ack; returns the frames to send now."""
+        with self._lock:
+            if self.hold and (self._in_flight[event_mid] or self._held[event_mid]):
+                self._held[event_mid].append(frame)
+                return []
+            self._in_flight[event_mid].append(time.monotonic())
+            self._stats[event_mid]["sent"] += 1
+            return [frame]
+
+    def _release(self, event_mid: int, now: float) -> list:
+        held = self._held[event_mid]
+        if held and not self._in_flight[event_mid]:
+            self._in_flight[event_mid].append(now)
+            self._stats[event_mid]["sent"] += 1
+            return [held.popleft()]
+        return []
+
+    def acknowledge(self, event_mid: int) -> tuple:
+        """Complete the oldest in-flight event. Returns (latency seconds or None, frames released)."""
+        with self._lock:
+            now = time.monotonic()
+            stats = self._stats[event_mid]
+            in_flight = self._in_flight[event_mid]
+            if not in_flight:
+                stats["unexpected_acks"] += 1
+                return None, []
+            latency = now - in_flight.popleft()
+            stats["acked"] += 1
+            stats["latency_total"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+            stats["histogram"][bisect.bisect_left(self.HISTOGRAM_BOUNDS_MS, latency * 1000)] += 1
+            return latency, self._release(event_mid, now)
+
+    def expire(self) -> tuple:
+        """Declare overdue events missing. Returns ([(event_mid, age)], frames released)."""
+        with self._lock:
+            now = time.monotonic()
+            missing = []
+            released = []
+            for event_mid, in_flight in self._in_flight.items():
+                while in_flight and now - in_flight[0] >= self.timeout:
+                    missing.append((event_mid, now - in_flight.popleft()))
+                    self._stats[event_mid]["missing"] += 1
+                released.extend(self._release(event_mid, now))
+            return missing, released
+
+    def stats(self) -> dict:
+        """Per event MID: counts, pending/held events, latency average/max and histogram."""
+        labels = [f"<={b}ms" for b in self.HISTOGRAM_BOUNDS_MS] + [f">{self.HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        with self._lock:
+            result = {}
+            for event_mid, st in self._stats.items():
+                result[event_mid] = {
+                    "sent": st["sent"],
+                    "acked": st["acked"],
+                    "missing": st["missing"],
+                    "unexpected_acks": st["unexpected_acks"],
+                    "pending": len(self._in_flight[event_mid]),
+                    "held": len(self._held[event_mid]),
+                    "latency_avg_ms": 1000 * st["latency_total"] / st["acked"] if st["acked"] else 0.0,
+                    "latency_max_ms": 1000 * st["latency_max"],
+                    "histogram": dict(zip(labels, st["histogram"])),
+                }
+            return result
+
+class LinkLevelSession:
+    """
+    Link-level acknowledgement state for one session (MID 9997/9998).
+    Outbound frames are stamped with header sequence numbers 01-99; at most `window`
+    frames are unacknowledged at a time and later frames wait in order. Frames not
+    acknowledged within `ack_timeout` seconds are retransmitted up to `max_retries` times.
+    Methods return the frames that must be written now; the caller owns the socket.
+    """
+
+    def __init__(self, window: int = 1, ack_timeout: float = 3.0, max_retries: int = 3):
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.last_rx_seq = None
+        self._lock = threading.Lock()
+        self._next_seq = 1
+        self._in_flight = {}  # seq -> [frame, first_sent, last_sent, retries]
+        self._pending = collections.deque()
+        self._started = time.monotonic()
+        self.frames_sent = 0
+        self.frames_acked = 0
+        self.retransmits = 0
+        self.naks_received = 0
+        self.duplicates_received = 0
+        self.max_in_flight = 0
+        self._rtt_total = 0.0
+        self.rtt_max = 0.0
+
+    @staticmethod
+    def stamp(frame: bytes, seq: int) -> bytes:
+        """Return the frame with header bytes 17-18 set to a sequence number."""
+        return b"".join((frame[:16], f"{seq:02d}".encode('ascii'), frame[18:]))
+
+    def _fill_window(self) -> list:
+        ready = []
+        now = time.monotonic()
+        while self._pending and len(self._in_flight) < self.window:
+            seq = self._next_seq
+            self._next_seq = seq % 99 + 1
+            frame = self.stamp(self._pending.popleft(), seq)
+            self._in_flight[seq] = [frame, now, now, 0]
+            ready.append(frame)
+        self.frames_sent += len(ready)
+        self.max_in_flight = max(self.max_in_flight, len(self._in_flight))
+        return ready
+
+    def submit(self, frame: bytes) -> list:
+        """Queue an outbound frame; returns the frames the window allows to send now."""
+        with self._lock:
+            self._pending.append(frame)
+            return self._fill_window()
+
+    def acknowledge(self, seq: int) -> list:
+        """Handle MID 9997 for a sequence number; returns frames released from the queue."""
+        with self._lock:
+            entry = self._in_flight.pop(seq, None)
+            if entry is not None:
+                rtt = time.monotonic() - entry[1]
+                self.frames_acked += 1
+                self._rtt_total += rtt
+                self.rtt_max = max(self.rtt_max, rtt)
+            return self._fill_window()
+
+    def reject(self, seq: int) -> list:
+        """Handle MID 9998 for a sequence number; returns the frame to retransmit."""
+        with self._lock:
+            self.naks_received += 1
+            entry = self._in_flight.get(seq)
+            if entry is None:
+                return []
+            entry[2] = time.monotonic()
+            entry[3] += 1
+            self.retransmits += 1
+            return [entry[0]]
+
+    def expired(self) -> tuple:
+        """Return (frames to retransmit, True if a frame ran out of retries)."""
+        with self._lock:
+            now = time.monotonic()
+            resend = []
+            for entry in self._in_flight.values():
+                if now - entry[2] < self.ack_timeout:
+                    continue
+                if entry[3] >= self.max_retries:
+                    return resend, True
+                entry[2] = now
+                entry[3] += 1
+                self.retransmits += 1
+                resend.append(entry[0])
+            return resend, False
+
+    def stats(self) -> dict:
+        """Return counters plus acknowledged throughput and ack round-trip times."""
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            return {
+                "frames_sent": self.frames_sent,
+                "frames_acked": self.frames_acked,
+                "retransmits": self.retransmits,
+                "naks_received": self.naks_received,
+                "duplicates_received": self.duplicates_received,
+                "in_flight": len(self._in_flight),
+                "queued": len(self._pending),
+                "max_in_flight": self.max_in_flight,
+                "acked_per_second": self.frames_acked / elapsed if elapsed > 0 else 0.0,
+                "ack_rtt_avg_ms": 1000 * self._rtt_total / self.frames_acked if self.frames_acked else 0.0,
+                "ack_rtt_max_ms": 1000 * self.rtt_max,
+            }
+
+class SqliteStateStore:
+    """
+    SQLite database (WAL mode) shared by many controllers: Pset parameters, counters
+    and VIN state, and tightening result history, all keyed by controller name.
+    Writers only queue changes in memory; a background thread commits everything
+    pending in one transaction every `flush_interval` seconds. Pset and state
+    changes are coalesced per key, so only the latest value is written. Reads use
+    a separate connection and are not blocked by the writer.
+    """
+    _shared = {}
+    _shared_lock = threading.Lock()
+    PSET_COLUMNS = tuple(name for name, _, _ in PsetStore.FIELDS)
+
+    def __init__(self, path: str, flush_interval: float = 0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._write_conn = self._connect()
+        self._read_conn = self._connect()
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending_psets = {}    # (controller, Pset ID) -> parameter dict
+        self._pending_state = {}    # (controller, key) -> value
+        self._pending_results = []  # Rows for the results table
+        self.transactions = 0
+        self.rows_written = 0
+        with self._write_lock:
+            columns = ", ".join(f"{name} {'REAL' if code == 'd' else 'INTEGER'}" for name, code, _ in PsetStore.FIELDS)
+            self._write_conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS psets (
+                    controller TEXT NOT NULL, pset_id TEXT NOT NULL, name TEXT NOT NULL DEFAULT '',
+                    {columns}, PRIMARY KEY (controller, pset_id)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS controller_state (
+                    controller TEXT NOT NULL, key TEXT NOT NULL, value TEXT,
+                    PRIMARY KEY (controller, key)) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS results (
+                    id INTEGER PRIMARY KEY, controller TEXT NOT NULL, tightening_id INTEGER,
+                    timestamp TEXT, pset_id TEXT, vin TEXT, status INTEGER, torque REAL,
+                    angle REAL, batch_counter INTEGER);
+                CREATE INDEX IF NOT EXISTS results_by_controller ON results (controller, id);
+            """)
+        placeholders = ", ".join("?" * (len(self.PSET_COLUMNS) + 3))
+        self._pset_sql = (f"INSERT OR REPLACE INTO psets (controller, pset_id, name, {', '.join(self.PSET_COLUMNS)}) "
+                          f"VALUES ({placeholders})")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls, path: str) -> "SqliteStateStore":
+        """One store (and writer thread) per database file in this process."""
+        key = os.path.abspath(path)
+        with cls._shared_lock:
+            store = cls._shared.get(key)
+            if store is None:
+                store = cls._shared[key] = cls(path)
+            return store
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def put_pset(self, controller: str, pset_id: str, params: dict) -> None:
+        with self._cond:
+            self._pending_psets[(controller, pset_id)] = params
+            self._cond.notify()
+
+    def put_state(self, controller: str, state: dict) -> None:
+        with self._cond:
+            for key, value in state.items():
+                self._pending_state[(controller, key)] = str(value)
+            self._cond.notify()
+
+    def add_result(self, controller: str, tightening_id: int, timestamp: str, pset_id: str, vin: str,
+                   status: int, torque: float, angle: float, batch_counter: int) -> None:
+        with self._cond:
+            self._pending_results.append((controller, tightening_id, timestamp, pset_id, vin, status,
+                                          torque, angle, batch_counter))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._pending_psets or self._pending_state or self._pending_results):
+                    self._cond.wait()
+            time.sleep(self.flush_interval)  # Let a burst of changes join the same transaction
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[StateDB] Write to {self.path} failed: {e}")
+
+    def flush(self) -> bool:
+        """Commit all pending changes in one transaction."""
+        with self._write_lock:
+            with self._cond:
+                psets, self._pending_psets = self._pending_psets, {}
+                state, self._pending_state = self._pending_state, {}
+                results, self._pending_results = self._pending_results, []
+            if not (psets or state or results):
+                return True
+            conn = self._write_conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(self._pset_sql, [
+                    (controller, pset_id, params.get("name", "")) + tuple(params[name] for name in self.PSET_COLUMNS)
+                    for (controller, pset_id), params in psets.items()])
+                conn.executemany("INSERT OR REPLACE INTO controller_state (controller, key, value) VALUES (?, ?, ?)",
+                                 [(controller, key, value) for (controller, key), value in state.items()])
+                conn.executemany("INSERT INTO results (controller, tightening_id, timestamp, pset_id, vin, status, "
+                                 "torque, angle, batch_counter) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", results)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                with self._cond:  # Keep the changes for the next attempt, newer values win
+                    for key, value in psets.items():
+                        self._pending_psets.setdefault(key, value)
+                    for key, value in state.items():
+                        self._pending_state.setdefault(key, value)
+                    self._pending_results[:0] = results
+                raise
+            self.transactions += 1
+            self.rows_written += len(psets) + len(state) + len(results)
+            return True
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def load_psets(self, controller: str) -> dict:
+        """Pset ID -> parameter dict for one controller."""
+        rows = self._query(f"SELECT pset_id, name, {', '.join(self.PSET_COLUMNS)} FROM psets WHERE controller = ?",
+                           (controller,))
+        return {row[0]: dict(zip(self.PSET_COLUMNS, row[2:]), name=row[1]) for row in rows}
+
+    def load_state(self, controller: str) -> dict:
+        return dict(self._query("SELECT key, value FROM controller_state WHERE controller = ?", (controller,)))
+
+    def query_results(self, controller: str, limit: int = 100, after_id: int = 0) -> list:
+        """Results for one controller with row id > after_id, oldest first."""
+        rows = self._query("SELECT id, tightening_id, timestamp, pset_id, vin, status, torque, angle, batch_counter "
+                           "FROM results WHERE controller = ? AND id > ? ORDER BY id LIMIT ?",
+                           (controller, after_id, limit))
+        keys = ("id", "tightening_id", "timestamp", "pset_id", "vin", "status", "torque", "angle", "batch_counter")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def result_summary(self) -> dict:
+        """Controller -> (results, OK results) across the whole fleet."""
+        rows = self._query("SELECT controller, COUNT(*), SUM(status) FROM results GROUP BY controller")
+        return {controller: (count, ok or 0) for controller, count, ok in rows}
+
+
+class SqlitePsetWriter:
+    """Drop-in for JsonWriteBehind that stores a controller's changed Psets in a SqliteStateStore."""
+
+    def __init__(self, store: SqliteStateStore, controller: str, psets: PsetStore, lock):
+        self.store = store
+        self.controller = controller
+        self.psets = psets
+        self.lock = lock
+        self.path = store.path
+        self.last_error = None
+
+    @property
+    def writes(self) -> int:
+        return self.store.transactions
+
+    def mark_dirty(self, pset_id=None) -> None:
+        """Queue one Pset (or all of them when pset_id is None) for the next transaction."""
+        with self.lock:
+            pset_ids = [pset_id] if pset_id is not None else list(self.psets)
+            for pid in pset_ids:
+                self.store.put_pset(self.controller, pid, self.psets[pid])
+
+    def flush(self) -> bool:
+        try:
+            return self.store.flush()
+        except sqlite3.Error as e:
+            self.last_error = str(e)
+            print(f"[StateDB] Flush failed: {e}")
+            return False
+
+
+class ScenarioRunner:
+    """
+    Plays a scenario file against one or more emulators from a single scheduler thread.
+    A scenario is JSON: {"name", "seed", "duration", "events": [...], "controllers":
+    {"<controller name>": [...]}}. Top-level events apply to every controller. Each
+    event has an "action" and either "at" (seconds) or "every"/"rate" with optional
+    "from", "until" and "count". Actions: "result" (optional "status": "ok"/"nok" and
+    "repeat"), "nok_burst" ("count"), "multi_spindle", "vin" ("vin"), "pset" ("pset"),
+    "relay" ("relay": function number or mapping name, "status"), "relays" ("relays":
+    {relay: status}), "tool" ("enabled"), "settings" (see apply_settings), "pset_params"
+    ("pset", "params"), "profile" ("profile").
+    Due events sit in one heap for all controllers; `speed` compresses the timeline.
+    """
+    ACTIONS = ("result", "nok_burst", "multi_spindle", "vin", "pset", "relay", "relays", "tool",
+               "settings", "pset_params", "profile")
+    REQUIRED_KEYS = {"vin": ("vin",), "pset": ("pset",), "relay": ("relay", "status"), "relays": ("relays",),
+                     "tool": ("enabled",), "nok_burst": ("count",), "pset_params": ("pset", "params"),
+                     "profile": ("profile",)}
+    OBJECT_KEYS = {"relays": "relays", "pset_params": "params"}  # Keys that must hold a JSON object
+
+    def __init__(self, scenario: dict, emulators: list, speed: float = 1.0, wait_for_session: bool = True):
+        if speed <= 0:
+            raise ValueError(f"Scenario speed must be > 0, got {speed}")
+        self.scenario = self.validate(scenario)
+        self.emulators = list(emulators)
+        self.speed = speed
+        self.wait_for_session = wait_for_session
+        self._stop = threading.Event()
+        self._thread = None
+        self.executed = collections.Counter()
+        self.errors = 0
+        self.skipped = collections.Counter()  # Results not sent (tool disabled or not subscribed), per action
+        self.max_lag = 0.0
+        self.elapsed = None
+
+    @classmethod
+    def load(cls, path: str) -> dict:
+        with open(path, 'r') as f:
+            return cls.validate(json.load(f))
+
+    @classmethod
+    def validate(cls, scenario: dict) -> dict:
+        """Check a scenario and fill in defaults. Raises ValueError on the first bad event."""
+        events = list(scenario.get("events", []))
+        per_controller = scenario.get("controllers", {})
+        for where, event_list in [("events", events)] + [(f"controllers.{n}", e) for n, e in per_controller.items()]:
+            for i, event in enumerate(event_list):
+                label = f"{where}[{i}]"
+                cls.check_action(event, label)
+                if "rate" in event:
+                    if event["rate"] <= 0:
+                        raise ValueError(f"{label}: rate must be > 0")
+                    event["every"] = 1.0 / event["rate"]
+                if "every" in event:
+                    if event["every"] <= 0:
+                        raise ValueError(f"{label}: every must be > 0")
+                    event.setdefault("from", 0.0)
+                elif "at" not in event:
+                    raise ValueError(f"{label}: needs 'at', 'every' or 'rate'")
+        return scenario
+
+    @classmethod
+    def check_action(cls, event: dict, label: str) -> None:
+        """Raise ValueError if an event's action is unknown or lacks a required key."""
+        if not isinstance(event, dict) or event.get("action") not in cls.ACTIONS:
+            raise ValueError(f"{label}: action must be one of {', '.join(cls.ACTIONS)}")
+        for key in cls.REQUIRED_KEYS.get(event["action"], ()):
+            if key not in event:
+                raise ValueError(f"{label}: '{event['action']}' needs '{key}'")
+        key = cls.OBJECT_KEYS.get(event["action"])
+        if key is not None and not isinstance(event[key], dict):
+            raise ValueError(f"{label}: '{event['action']}' needs '{key}' to be an object")
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait for the scenario to finish. Returns False on timeout."""
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def _schedule(self) -> tuple:
+        """Initial heap of (due offset, seq, emulator, event, occurrence) and the sequence counter."""
+        heap = []
+        seq = itertools.count()
+        controllers = self.scenario.get("controllers", {})
+        for emulator in self.emulators:
+            name = emulator.controller_name.strip()
+            for event in list(self.scenario.get("events", [])) + list(controllers.get(name, [])):
+                first = event["from"] if "every" in event else event["at"]
+                heapq.heappush(heap, (first, next(seq), emulator, event, 0))
+        return heap, seq
+
+    def _run(self):
+        name = self.scenario.get("name", "scenario")
+        if self.wait_for_session:
+            print(f"[Scenario] '{name}' waiting for {len(self.emulators)} controller session(s)...")
+            while not all(e.session_active for e in self.emulators):
+                if self._stop.wait(0.1):
+                    return
+        if "seed" in self.scenario:
+            random.seed(self.scenario["seed"])  # Multi-spindle results and traces
+            for emulator in self.emulators:
+                emulator.result_pipeline.reseed(f"{self.scenario['seed']}/{emulator.controller_name.strip()}")
+        duration = self.scenario.get("duration")
+        heap, seq = self._schedule()
+        print(f"[Scenario] '{name}' started at {self.speed:g}x with {len(heap)} event stream(s).")
+        start = time.monotonic()
+        while heap and not self._stop.is_set():
+            offset, _, emulator, event, occurrence = heap[0]
+            if duration is not None and offset > duration:
+                break
+            delay = start + offset / self.speed - time.monotonic()
+            if delay > 0:
+                if self._stop.wait(delay):
+                    break
+                continue
+            heapq.heappop(heap)
+            self.max_lag = max(self.max_lag, -delay)
+            try:
+                skipped = self.execute(emulator, event)
+                self.executed[event["action"]] += 1
+                if skipped:
+                    self.skipped[event["action"]] += skipped
+            except (ValueError, KeyError, TypeError) as e:
+                self.errors += 1
+                print(f"[Scenario] {emulator.controller_name.strip()}: {event['action']} failed: {e}")
+            if "every" in event:
+                occurrence += 1
+                nxt = event["from"] + occurrence * event["every"]
+                if ("count" not in event or occurrence < event["count"]) and nxt <= event.get("until", float("inf")):
+                    heapq.heappush(heap, (nxt, next(seq), emulator, event, occurrence))
+        self.elapsed = time.monotonic() - start
+        print(f"[Scenario] '{name}' finished in {self.elapsed:.2f}s: {sum(self.executed.values())} actions "
+              f"({', '.join(f'{k} {v}' for k, v in sorted(self.executed.items()))}), {self.errors} errors, "
+              f"{sum(self.skipped.values())} results not sent, "
+              f"max lag {self.max_lag * 1000:.1f} ms")
+
+    @staticmethod
+    def execute(emulator, event: dict) -> int:
+        """
+        Run one action against an emulator (also used by the HTTP control API). Returns the
+        number of results that could not be sent (tool disabled or no subscription).
+        """
+        action = event["action"]
+        if action == "result":
+            status = event.get("status")
+            force_nok = None if status is None else status == "nok"
+            return ScenarioRunner._send_results(emulator, int(event.get("repeat", 1)), force_nok)
+        elif action == "nok_burst":
+            return ScenarioRunner._send_results(emulator, int(event["count"]), True)
+        elif action == "multi_spindle":
+            return 0 if emulator.send_multi_spindle_result() else 1
+        elif action == "vin":
+            emulator.set_vin(str(event["vin"]))
+        elif action == "pset":
+            pset_id = str(event["pset"])
+            if not emulator.select_pset(pset_id if pset_id in ("0", "000") else PsetStore.normalize_id(pset_id)):
+                raise ValueError(f"unknown Pset {pset_id}")
+        elif action == "relay":
+            function = ScenarioRunner._relay_function(emulator, event["relay"])
+            if not emulator.set_relay_status(function, 1 if event["status"] else 0):
+                raise ValueError(f"unknown relay function {function}")
+        elif action == "relays":
+            emulator.set_relays({ScenarioRunner._relay_function(emulator, relay): 1 if status else 0
+                                 for relay, status in event["relays"].items()})
+        elif action == "tool":
+            emulator.tool_enabled = bool(event["enabled"])
+            print(f"[Tool] Tool {'enabled' if emulator.tool_enabled else 'disabled'} by scenario.")
+        elif action == "settings":
+            emulator.apply_settings({k: v for k, v in event.items() if k not in ("action", "at", "every", "rate",
+                                                                               "from", "until", "count")})
+        elif action == "pset_params":
+            pset_id = PsetStore.normalize_id(str(event["pset"]))
+            current = emulator.pset_parameters.get(pset_id) or {}
+            emulator.set_pset_parameters(pset_id, {**current, **event["params"]})
+        elif action == "profile":
+            emulator.apply_profile(str(event["profile"]))
+        return 0
+
+    @staticmethod
+    def _relay_function(emulator, relay) -> int:
+        """Resolve a relay given as a function number (int or numeric string) or a mapping name."""
+        if isinstance(relay, int) or str(relay).isdigit():
+            return int(relay)
+        if relay not in emulator.relay_mappings:
+            raise ValueError(f"unknown relay {relay!r}")
+        return emulator.relay_mappings[relay]
+
+    @staticmethod
+    def _send_results(emulator, count: int, force_nok) -> int:
+        """Send `count` results; returns how many could not be sent."""
+        sent = 0
+        while sent < count and emulator.send_single_tightening_result(force_nok=force_nok):
+            sent += 1
+        return count - sent
+
+    def stats(self) -> dict:
+        return {"executed": dict(self.executed), "errors": self.errors, "skipped": dict(self.skipped),
+                "max_lag_ms": self.max_lag * 1000, "elapsed": self.elapsed}
+
+
+class ControlServer:
+    """
+    Local HTTP/JSON control API for driving one or more emulators without the GUI.
+      GET  /controllers           -> {"<name>": status, ...} (see get_status)
+      GET  /controllers/<name>    -> status of one controller
+      GET  /metrics               -> totals and per-process counters
+      POST /actions               -> {"controllers": "*" or [names], "actions": [action, ...]}
+    Actions are scenario actions without timing (ScenarioRunner.execute), so one request
+    can send 10,000 results ({"action": "result", "repeat": 10000}) or apply settings to
+    every controller. Each controller runs the list in order and stops at its first
+    failing action. With `fleet` (a FleetSupervisor) requests are fanned out to its
+    worker processes instead. There is no authentication, so the server binds to localhost.
+    """
+
+    def __init__(self, emulators: list = (), host: str = "127.0.0.1", port: int = 8080, fleet=None):
+        self.emulators = {e.controller_name.strip(): e for e in emulators}
+        self.fleet = fleet
+        self._lock = threading.Lock()  # One action batch at a time
+        self.httpd = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> tuple:
+        return self.httpd.server_address[:2]
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"[Control] HTTP control API on http://{self.address[0]}:{self.address[1]}/")
+        return self._thread
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def select(names, controllers) -> list:
+        """Controller names addressed by a request's "controllers" ("*"/None, a name or a list)."""
+        if controllers in (None, "*"):
+            return list(names)
+        if isinstance(controllers, str):
+            controllers = [controllers]
+        unknown = [name for name in controllers if name not in names]
+        if unknown:
+            raise ValueError(f"Unknown controller(s): {', '.join(map(str, unknown))}")
+        return list(controllers)
+
+    @staticmethod
+    def check_request(request: dict) -> list:
+        """Return the request's action list; raises ValueError if it is malformed."""
+        if not isinstance(request, dict) or not isinstance(request.get("actions"), list):
+            raise ValueError("Request body must be an object with an 'actions' list")
+        actions = request["actions"]
+        for i, action in enumerate(actions):
+            ScenarioRunner.check_action(action, f"actions[{i}]")
+        return actions
+
+    @staticmethod
+    def execute_batch(emulators: list, actions: list) -> dict:
+        """
+        Run checked actions in order on each emulator: {name: {"executed": n, "error": str or None}}.
+        A result action that could not send all its results is an error here, unlike in scenarios.
+        """
+        results = {}
+        for emulator in emulators:
+            done, error = 0, None
+            for i, action in enumerate(actions):
+                try:
+                    skipped = ScenarioRunner.execute(emulator, action)
+                except (ValueError, KeyError, TypeError) as e:
+                    error = f"actions[{i}] ({action['action']}): {e}"
+                    break
+                if skipped:
+                    error = (f"actions[{i}] ({action['action']}): {skipped} result(s) not sent "
+                             f"(tool disabled or not subscribed)")
+                    break
+                done += 1
+            results[emulator.controller_name.strip()] = {"executed": done, "error": error}
+        return results
+
+    @staticmethod
+    def local_metrics(emulators) -> dict:
+        """Counters for the emulators of this process."""
+        frames = 0
+        clients = []
+        for emulator in emulators:
+            stats = emulator.get_outbound_stats() or {}
+            frames += sum(st["sent"] for st in stats.values())
+            if emulator.client_observer is not None:
+                clients.append(emulator.get_client_stats())
+        return {"pid": os.getpid(), "controllers": len(emulators),
+                "sessions": sum(1 for e in emulators if e.session_active),
+                "results": sum(e.tightening_id_counter for e in emulators),
+                "frames_sent": frames, "prefetch_misses": sum(e.result_pipeline.misses for e in emulators),
+                "client_limited": sum(1 for s in clients if s["client_limited"]),
+                "client_retransmits": sum((s["tcp"] or {}).get("retransmits", 0) for s in clients),
+                "client_rtt_max_ms": max((s["rtt_max_ms"] for s in clients), default=0.0),
+                "cpu_s": round(time.process_time(), 3)}
+
+    def statuses(self) -> dict:
+        if self.fleet is not None:
+            return self.fleet.statuses()
+        return {name: e.get_status() for name, e in self.emulators.items()}
+
+    def metrics(self) -> dict:
+        if self.fleet is not None:
+            return self.fleet.metrics()
+        return self.local_metrics(list(self.emulators.values()))
+
+    def run_actions(self, request: dict) -> dict:
+        """Validate and run an action batch; raises ValueError for a malformed request."""
+        if self.fleet is not None:
+            return self.fleet.run_actions(request)
+        actions = self.check_request(request)
+        targets = [self.emulators[name] for name in self.select(self.emulators, request.get("controllers"))]
+        start = time.perf_counter()
+        with self._lock:
+            results = self.execute_batch(targets, actions)
+        return {"controllers": results, "elapsed": time.perf_counter() - start}
+
+    def _make_handler(self):
+        control = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _reply(self, code: int, body):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                parts = [urllib.parse.unquote(p) for p in urllib.parse.urlsplit(self.path).path.split("/") if p]
+                if parts == ["metrics"]:
+                    self._reply(200, control.metrics())
+                    return
+                statuses = control.statuses() if parts[:1] == ["controllers"] else {}
+                if parts == ["controllers"]:
+                    self._reply(200, statuses)
+                elif len(parts) == 2 and parts[1] in statuses:
+                    self._reply(200, statuses[parts[1]])
+                else:
+                    self._reply(404, {"error": f"Not found: {self.path}"})
+
+            def do_POST(self):
+                if urllib.parse.urlsplit(self.path).path.rstrip("/") != "/actions":
+                    self._reply(404, {"error": f"Not found: {self.path}"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                    self._reply(200, control.run_actions(request))
+                except (ValueError, TypeError) as e:  # json.JSONDecodeError is a ValueError
+                    self._reply(400, {"error": str(e)})
+
+            def log_message(self, format, *args):
+                pass  # Keep the emulator console for protocol traffic
+
+        return Handler
+
+
 class OpenProtocolEmulator:
+    DEFAULT_PSET_IDS = ("001", "002", "003", "004", "005",
+                        "010", "011", "012", "013", "014", "015",
+                        "050", "051", "052", "053", "054", "055",
+                        "100", "101", "102", "103", "104", "105")
+
     DEFAULT_RELAY_MAPPINGS = {
         "trigger": 20,
         "forward": 21,
@@ -80,22 +2015,47 @@ class OpenProtocolEmulator:
         }
     }
 
+    # Trace curve types (MID 0900): trace type code -> (unit code, coefficient per raw sample)
+    TRACE_TYPES = {
+        1: ("002", 0.1),   # Angle, 0.1 degree per count
+        2: ("001", 0.01),  # Torque, 0.01 Nm per count
+    }
+    # PIDs used in MID 0900 parameter fields and MID 0901 plot parameters
+    TRACE_PID_TIME_INTERVAL = 2213
+    TRACE_PID_COEFFICIENT = 2214
+    TRACE_PLOT_PIDS = {
+        "torque_min": 2241,
+        "torque_max": 2242,
+        "torque_target": 2243,
+        "angle_min": 2244,
+        "angle_max": 2245,
+        "angle_target": 2246,
+    }
+
     # Added port and name to constructor with defaults
-    def __init__(self, host='0.0.0.0', port=4545, controller_name="OpenProtocolSim"):
+    def __init__(self, host='0.0.0.0', port=4545, controller_name="OpenProtocolSim", data_dir: str = None,
+                 unix_path: str = None):
         self.host = host
-        self.port = port # Use passed-in port
+        self.port = port # Use passed-in port; 0 picks a free port when the server starts
+        self.unix_path = unix_path  # Listen on this Unix domain socket instead of TCP
         self.controller_name = controller_name.ljust(25)[:25] # Use passed-in name, ensure length
+        self.data_dir = data_dir  # Where the Pset JSON file lives (default: working directory)
+        self.server_socket = None
+        self._server_stop = threading.Event()
+        self._server_thread = None
+        self._client_thread = None
 
+        self._state_listeners = []  # Called (from any thread) after status-panel state may have changed
         self.state_lock = threading.RLock()
 
         self._session_active = False
         self._tool_enabled = True
         self._auto_send_loop_active = True
         self.current_pset = None
-        self.available_psets = {"001", "002", "003", "004", "005",
-                                "010", "011", "012", "013", "014", "015", 
-                                "050", "051", "052", "053", "054", "055", 
-                                "100", "101", "102", "103", "104", "105"}
+        self.pset_parameters = PsetStore()
+        self.available_psets = self.pset_parameters  # Every Pset with parameters can be selected
+        self._pset_frames = {}  # (reply MID, rev[, Pset ID]) -> pre-encoded MID 0011/0013 frames
+        self._pset_frames_version = None
         self.current_pset = None
         # --- VIN and Batch State ---
         self.current_vin = "AB123000"
@@ -122,7 +2082,16 @@ class OpenProtocolEmulator:
         self.multi_spindle_requested_rev = 1
         self.sync_tightening_id = 0
         self.num_spindles = 2
+        self.spindle_psets = {}  # Spindle number -> Pset ID whose limits override the current Pset
+        self._spindle_layouts = {}  # Spindle count -> pre-encoded "spindle+channel" prefixes
         # --- End Multi-spindle State ---
+        # --- Trace Curve State ---
+        self.trace_subscriptions = {}  # Subscribed MID (900/901) -> (revision, no_ack)
+        self.trace_num_samples = 500
+        self.trace_sample_interval_ms = 1
+        self._trace_templates = {}  # (trace_type, samples, limits) -> template samples
+        self._trace_noise = None
+        # --- End Trace Curve State ---
         # --- I/O Device and Relay State ---
         self.io_devices = {
             "00": {
@@ -149,6 +2118,10 @@ class OpenProtocolEmulator:
             }
         }
         self.relay_subscriptions = {}
+        self._relay_frames = {}  # (function, status, no_ack) -> encoded MID 0217 frame
+        self._rebuild_relay_index()
+        self._relay_stream_stop = None
+        self.relay_stream_stats = None
         # --- End I/O Device and Relay State ---
 
         # --- Revision Configuration ---
@@ -157,14 +2130,20 @@ class OpenProtocolEmulator:
         self.revision_config = {
             2: 6,     # MID 0002 - Communication start ack
             4: 3,     # MID 0004 - Communication negative ack
+            11: 1,    # MID 0011 - Pset ID upload reply
+            13: 2,    # MID 0013 - Pset data upload reply
             15: 2,    # MID 0015 - Pset selected
             41: 5,    # MID 0041 - Tool data reply
             52: 2,    # MID 0052 - VIN number
             61: 7,    # MID 0061 - Tightening result
             101: 5,   # MID 0101 - Multi-spindle result
             215: 2,   # MID 0215 - I/O device status reply
+            900: 1,   # MID 0900 - Trace curve data
+            901: 1,   # MID 0901 - Trace plot parameters
         }
         self.current_profile = "pf6000-full"  # Default profile name
+        self.profile_catalogue = PROFILE_CATALOGUE
+        self._profile_source = None  # (catalogue name, version) of the installed profile, for hot reload
         self.relay_mappings = self.DEFAULT_RELAY_MAPPINGS.copy()
         # --- End Revision Configuration ---
         # Extended tightening result data (for MID 0061 rev 3+)
@@ -179,8 +2158,48 @@ class OpenProtocolEmulator:
         self.pset_ok_counter = 0
         self.client_socket = None
         self.send_lock = threading.Lock()
+        self.link_timeout = DEFAULT_LINK_TIMEOUT  # 0 disables idle connection reaping
+        self.reaped_connections = 0
+        self.client_sample_interval = 1.0  # Seconds between TCP_INFO samples of the client socket; 0 disables
+        self.client_observer = None
+        self.last_client_stats = None
+        self.session_generation = 0
+        # Link-level acknowledgement (MID 9997/9998), activated by MID 0001 revision 7+
+        self.link_window = 1
+        self.link_ack_timeout = 3.0
+        self.link_max_retries = 3
+        self.link_session = None
+        self.last_link_stats = None
+        # Application-level event acknowledgement tracking (MID 0062/0053/0016/0218/0102)
+        self.ack_tracker = EventAckTracker()
+        self.last_ack_stats = None
+        self._ack_tracking_open = False
+        # Outbound queues: per-event-MID overflow policy and limit, drained by a writer thread
+        self.outbound_policies = {
+            61: ("block", 1000),
+            101: ("block", 1000),
+            52: ("block", 1000),
+            900: ("block", 1000),
+            901: ("block", 1000),
+            15: ("coalesce", 1000),
+            217: ("coalesce", 1000),
+        }
+        self.outbound_block_timeout = 2.0
+        self.send_timeout = 5.0  # 0 waits indefinitely for a client that stops reading
+        self.outbound_queue = None
+        self.last_outbound_stats = None
+        self.last_queue_delays = None
+        self.impairment = {}  # LinkImpairment config for new connections (see set_impairment)
+        self.link_impairment = None
+        self.segmentation = {}  # FrameSegmenter config for new connections (see set_segmentation)
+        self.frame_segmenter = None
         self.tightening_id_counter = 0
+        self.last_result = None  # (status, torque, angle, tightening ID) of the last MID 0061 sent
+        self.result_pipeline = ResultPipeline()  # Outcomes for the next MID 0061 results, encoded ahead
+        self._result_template = None  # (key, pieces) cached by _get_result_template
+        self.command_errors = 0  # MID 0004 replies sent
         self.controller_time = None
+        self.clock = VirtualClock()  # Timestamps and simulation timers; MID 0082 sets it
 
         # --- Controller Info for MID 0002 Revisions 2+ ---
         self.supplier_code = 1
@@ -191,8 +2210,8 @@ class OpenProtocolEmulator:
         self.ctrl_serial = "SN12345678"
         self.system_type = "PF6000    "
         self.system_subtype = "          "
-        self.seq_num_support = 0
-        self.link_support = 0
+        self.seq_num_support = 1
+        self.link_support = 1
         self.station_id = "0001      "
         self.station_name = "Station                  "
         self.client_id = 1
@@ -213,8 +2232,9 @@ class OpenProtocolEmulator:
         # --- End Tool Info ---
 
         # --- Pset Parameters Storage ---
-        self.pset_parameters = {}
         self._load_pset_parameters(self.controller_name) # Attempt to load from file using controller name
+        self.pset_writer = JsonWriteBehind(self._get_pset_filename(self.controller_name), self._snapshot_pset_parameters)
+        self.state_store = None  # Optional SqliteStateStore (see use_state_store)
         # --- End Pset Parameters Storage ---
 
         self._parse_vin(self.current_vin)
@@ -233,6 +2253,7 @@ class OpenProtocolEmulator:
     def session_active(self, value):
         with self.state_lock:
             self._session_active = value
+        self._state_changed()
 
     @property
     def tool_enabled(self):
@@ -243,6 +2264,7 @@ class OpenProtocolEmulator:
     def tool_enabled(self, value):
         with self.state_lock:
             self._tool_enabled = value
+        self._state_changed()
 
     @property
     def auto_send_loop_active(self):
@@ -253,6 +2275,19 @@ class OpenProtocolEmulator:
     def auto_send_loop_active(self, value):
         with self.state_lock:
             self._auto_send_loop_active = value
+        self._state_changed()
+
+    def add_state_listener(self, callback) -> None:
+        """
+        Register callback() to run after session, subscription, Pset, VIN, batch or result
+        state may have changed. It is called on the thread that made the change, so it
+        should only flag or schedule work (the GUI coalesces these into one refresh).
+        """
+        self._state_listeners.append(callback)
+
+    def _state_changed(self):
+        for callback in self._state_listeners:
+            callback()
 
     def _register_mid_handlers(self):
         self.mid_handlers = {
@@ -260,7 +2295,13 @@ class OpenProtocolEmulator:
             3: self._handle_mid_0003,
             4: self._handle_mid_0004,
             5: self._handle_mid_0005,
+            8: self._handle_mid_0008,
+            9: self._handle_mid_0009,
+            9997: self._handle_mid_9997,
+            9998: self._handle_mid_9998,
             9999: self._handle_mid_9999,
+            10: self._handle_mid_0010,
+            12: self._handle_mid_0012,
             14: self._handle_mid_0014,
             16: self._handle_mid_0016,
             17: self._handle_mid_0017,
@@ -291,6 +2332,150 @@ class OpenProtocolEmulator:
         max_supported = self.revision_config.get(mid, 1)
         return min(requested_rev, max_supported)
 
+    def set_link_ack_params(self, window: int = None, ack_timeout: float = None, max_retries: int = None) -> None:
+        """Configure link-level acknowledgement for sessions started after the call."""
+        if window is not None:
+            if not 1 <= window <= 98:
+                raise ValueError(f"Link window must be 1-98, got {window}")
+            self.link_window = window
+        if ack_timeout is not None:
+            if ack_timeout <= 0:
+                raise ValueError(f"Link ack timeout must be > 0, got {ack_timeout}")
+            self.link_ack_timeout = ack_timeout
+        if max_retries is not None:
+            if max_retries < 0:
+                raise ValueError(f"Link retries must be >= 0, got {max_retries}")
+            self.link_max_retries = max_retries
+
+    def set_event_ack_params(self, timeout: float = None, hold: bool = None) -> None:
+        """Configure application-level ack tracking (missing-ack timeout, hold-until-ack)."""
+        if timeout is not None:
+            if timeout <= 0:
+                raise ValueError(f"Ack timeout must be > 0, got {timeout}")
+            self.ack_tracker.timeout = timeout
+        if hold is not None:
+            self.ack_tracker.hold = hold
+
+    def get_ack_stats(self) -> dict:
+        """Application-level ack statistics per event MID for the current (or last) session."""
+        return self.ack_tracker.stats() if self._ack_tracking_open or self.last_ack_stats is None else self.last_ack_stats
+
+    def set_outbound_policy(self, mid: int, policy: str, limit: int = None) -> None:
+        """Set the overflow policy ("block", "drop_oldest", "coalesce") and queue limit for an event MID."""
+        if mid not in self.outbound_policies:
+            raise ValueError(f"MID {mid:04d} has no outbound event queue")
+        if policy not in OutboundQueue.POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if limit is None:
+            limit = self.outbound_policies[mid][1]
+        if limit < 1:
+            raise ValueError(f"Queue limit must be >= 1, got {limit}")
+        self.outbound_policies[mid] = (policy, limit)
+
+    def set_send_timeouts(self, send_timeout: float = None, block_timeout: float = None) -> None:
+        """Configure the socket send timeout and how long producers wait on a full "block" queue."""
+        if send_timeout is not None:
+            if send_timeout < 0:
+                raise ValueError(f"Send timeout must be >= 0, got {send_timeout}")
+            self.send_timeout = send_timeout
+        if block_timeout is not None:
+            if block_timeout < 0:
+                raise ValueError(f"Block timeout must be >= 0, got {block_timeout}")
+            self.outbound_block_timeout = block_timeout
+            if self.outbound_queue is not None:
+                self.outbound_queue.block_timeout = block_timeout
+
+    def get_outbound_stats(self):
+        """Outbound queue counters (enqueued/sent/dropped/coalesced) for the current or last connection."""
+        queue = self.outbound_queue
+        return queue.stats() if queue is not None else self.last_outbound_stats
+
+    def set_impairment(self, config: dict) -> None:
+        """
+        Set latency/jitter/bandwidth shaping (LinkImpairment config) for new connections
+        and the current one. An empty dict removes all impairment.
+        """
+        LinkImpairment.validate(config)
+        self.impairment = dict(config)
+        shaper = self.link_impairment
+        if shaper is not None:
+            shaper.configure(self.impairment)
+        print(f"[Impair] Impairment set to {self.impairment or 'none'}")
+
+    def set_segmentation(self, config: dict) -> None:
+        """
+        Set the transmit mode (FrameSegmenter config: "whole", "fragment" or "coalesce"
+        with sizes and seed) for new connections and the current one.
+        """
+        FrameSegmenter.validate(config)
+        self.segmentation = dict(config)
+        segmenter = self.frame_segmenter
+        if segmenter is not None:
+            segmenter.configure(self.segmentation)
+            if segmenter.mode != "whole" and self.client_socket:
+                try: self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except OSError: pass
+        print(f"[Segment] Transmit mode set to {self.segmentation or 'whole'}")
+
+    def get_queue_delays(self):
+        """Outbound queueing delay per priority class (link, reply, event) for the current or last connection."""
+        queue = self.outbound_queue
+        return queue.delay_stats() if queue is not None else self.last_queue_delays
+
+    def get_link_stats(self):
+        """Link-level ack counters for the current session, or the last one if none is active."""
+        link = self.link_session
+        return link.stats() if link is not None else self.last_link_stats
+
+    def set_time_warp(self, speed: float) -> None:
+        """Run the controller clock (result timestamps, auto-loop interval) `speed` times faster than real time."""
+        self.clock.set_speed(speed)
+        print(f"[Time] Clock speed set to {speed:g}x.")
+
+    def set_link_timeout(self, seconds: float) -> None:
+        """Set the link timeout for new connections (0 disables idle reaping)."""
+        if seconds < 0:
+            raise ValueError(f"Link timeout must be >= 0, got {seconds}")
+        self.link_timeout = seconds
+
+    def set_client_sample_interval(self, seconds: float) -> None:
+        """Set how often new connections' sockets are sampled for TCP_INFO and send-queue depth (0 disables)."""
+        if seconds < 0:
+            raise ValueError(f"Client sample interval must be >= 0, got {seconds}")
+        self.client_sample_interval = seconds
+
+    def get_client_stats(self):
+        """
+        Client responsiveness for the current or last connection: keep-alive intervals,
+        event-to-ack latency over all acknowledged event MIDs, and the latest kernel TCP sample.
+        """
+        observer = self.client_observer
+        if observer is None:
+            return self.last_client_stats
+        stats = observer.stats()
+        acked = latency_total = latency_max = 0.0
+        for st in (self.get_ack_stats() or {}).values():
+            acked += st["acked"]
+            latency_total += st["latency_avg_ms"] * st["acked"]
+            latency_max = max(latency_max, st["latency_max_ms"])
+        stats["event_ack_ms"] = {"acked": int(acked), "avg": latency_total / acked if acked else None,
+                                 "max": latency_max if acked else None}
+        return stats
+
+    def _print_client_stats(self, stats: dict):
+        interval = stats["keepalive_interval_s"]
+        line = f"[Observe] Client: {stats['keepalives']} keep-alives"
+        if interval["avg"] is not None:
+            line += f" (interval avg {interval['avg']:.1f}s, max {interval['max']:.1f}s)"
+        ack = stats["event_ack_ms"]
+        if ack["acked"]:
+            line += f", event ack avg {ack['avg']:.1f} ms, max {ack['max']:.1f} ms"
+        if stats["tcp"] and "rtt_ms" in stats["tcp"]:
+            line += f", RTT max {stats['rtt_max_ms']:.2f} ms, {stats['tcp']['retransmits']} retransmits"
+        if stats["limited_samples"]:
+            line += f", client-limited in {stats['limited_samples']}/{stats['samples']} samples"
+        print(line)
+
     def get_max_revision(self, mid: int) -> int:
         """Get the maximum supported revision for a MID."""
         return self.revision_config.get(mid, 1)
@@ -305,33 +2490,162 @@ class OpenProtocolEmulator:
         """Get a copy of the full revision configuration."""
         return dict(self.revision_config)
 
+    def _rebuild_relay_index(self):
+        """
+        Index relay functions (function -> (relay, device snapshot, relay index); a function
+        lives on one device), keep each device's function set, and encode MID 0215 snapshots.
+        """
+        self._relay_index = {}
+        self._device_relay_functions = {}
+        self._io_snapshots = {}
+        for device_num, device in self.io_devices.items():
+            self._index_io_device(device_num, device)
+
+    def _index_io_device(self, device_num: str, device: dict):
+        snapshot = self._io_snapshots[device_num] = IODeviceSnapshot(device_num, device)
+        functions = self._device_relay_functions[device_num] = set()
+        for index, relay in enumerate(device["relays"]):
+            functions.add(relay["function"])
+            if relay["function"] not in self._relay_index:
+                self._relay_index[relay["function"]] = (relay, snapshot, index)
+
+    def add_io_device(self, device_num: str, relay_functions: list, input_functions: list) -> None:
+        """
+        Add (or replace) an I/O device with the given relay and digital input functions, all
+        off. Relay functions must be unique across devices, since relays are set by function.
+        """
+        if not re.fullmatch(r"\d\d", device_num):
+            raise ValueError(f"I/O device number must be two digits, got {device_num!r}")
+        device = {"relays": [{"function": int(f), "status": 0} for f in relay_functions],
+                  "digital_inputs": [{"function": int(f), "status": 0} for f in input_functions]}
+        IODeviceSnapshot(device_num, device)  # Validate before touching state
+        functions = [relay["function"] for relay in device["relays"]]
+        if len(set(functions)) != len(functions):
+            raise ValueError(f"I/O device {device_num}: duplicate relay functions")
+        with self.state_lock:
+            taken = set().union(*[used for num, used in self._device_relay_functions.items() if num != device_num])
+            clash = sorted(taken.intersection(functions))
+            if clash:
+                raise ValueError(f"I/O device {device_num}: relay function(s) {clash} already on another device")
+            self.io_devices[device_num] = device
+            self._rebuild_relay_index()
+
+    def add_io_devices(self, count: int, points: int) -> None:
+        """
+        Add devices 01..count, each with `points` relays and digital inputs. Relays get the
+        lowest function numbers not used by other devices (so each can be set by function);
+        digital inputs are functions 1..points on every device.
+        """
+        if not 0 <= count <= 99:
+            raise ValueError(f"I/O device count must be 0-99, got {count}")
+        if not 1 <= points <= IODeviceSnapshot.MAX_POINTS:
+            raise ValueError(f"I/O points per device must be 1-{IODeviceSnapshot.MAX_POINTS}, got {points}")
+        replaced = {f"{n:02d}" for n in range(1, count + 1)}
+        with self.state_lock:
+            used = set().union(*[f for num, f in self._device_relay_functions.items() if num not in replaced])
+        free = [f for f in range(1, 1000) if f not in used]  # Functions are three digits in MID 0215
+        if len(free) < count * points:
+            raise ValueError(f"Not enough free relay functions for {count} devices x {points} relays "
+                             f"({len(free)} of 999 free)")
+        inputs = list(range(1, points + 1))
+        with self.state_lock:
+            for device_num in replaced:  # Free their functions so the new ranges cannot clash
+                if self.io_devices.pop(device_num, None) is not None:
+                    self._rebuild_relay_index()
+        for n in range(1, count + 1):
+            self.add_io_device(f"{n:02d}", free[(n - 1) * points:n * points], inputs)
+        if count:
+            print(f"[IO] Added {count} I/O devices with {points} relays and inputs each.")
+
+    def set_digital_input(self, device_num: str, index: int, status: int) -> None:
+        """Set digital input `index` (0-based) of a device."""
+        device = self.io_devices.get(device_num)
+        if device is None or not 0 <= index < len(device["digital_inputs"]):
+            raise ValueError(f"Unknown digital input {index} on I/O device {device_num}")
+        device["digital_inputs"][index]["status"] = status
+        self._io_snapshots[device_num].set_input(index, status)
+
     def _ensure_relay_functions_exist(self):
         """Ensure all mapped relay functions exist in io_devices."""
-        for device in self.io_devices.values():
-            existing_functions = {r["function"] for r in device["relays"]}
-            for relay_name, relay_func in self.relay_mappings.items():
-                if relay_func not in existing_functions:
-                    device["relays"].append({"function": relay_func, "status": 0})
-                    print(f"[Relay] Added relay function {relay_func} ({relay_name}) to device")
+        added = False
+        device_num = "00" if "00" in self.io_devices else next(iter(self.io_devices), None)
+        if device_num is None:
+            return
+        device = self.io_devices[device_num]
+        for relay_name, relay_func in self.relay_mappings.items():
+            if relay_func not in self._relay_index:  # Mapped functions missing on every device go on 00
+                device["relays"].append({"function": relay_func, "status": 0})
+                self._relay_index[relay_func] = None  # Placeholder until the rebuild below
+                added = True
+                print(f"[Relay] Added relay function {relay_func} ({relay_name}) to device {device_num}")
+        if added:
+            # Re-index every device: index entries of existing relays point at the old snapshots
+            self._rebuild_relay_index()
+
+    def _install_profile(self, profile: dict, profile_name: str) -> None:
+        """
+        Swap in the revision config and relay mappings of a parsed profile. New dicts
+        are built aside and replaced in one step, so connected sessions keep running
+        and never see a half-applied profile.
+        """
+        revision_config = dict(self.revision_config)
+        revision_config.update(profile["revisions"])
+        relay_mappings = None
+        if "relay_mappings" in profile:
+            relay_mappings = dict(self.relay_mappings)
+            relay_mappings.update(profile["relay_mappings"])
+        with self.state_lock:
+            self.revision_config = revision_config
+            if relay_mappings is not None:
+                self.relay_mappings = relay_mappings
+                self._ensure_relay_functions_exist()
+            self.current_profile = profile_name
+        if "impairment" in profile:
+            self.set_impairment(profile["impairment"])
+        self._state_changed()
 
     def apply_profile(self, profile_name: str) -> None:
         """Apply a controller profile by name (built-in or from controllers folder)."""
         if profile_name in self.DEFAULT_PROFILES:
-            profile = self.DEFAULT_PROFILES[profile_name]
-            self.revision_config.update(profile["revisions"])
-            if "relay_mappings" in profile:
-                self.relay_mappings.update(profile["relay_mappings"])
-                self._ensure_relay_functions_exist()
-            self.current_profile = profile_name
+            self._install_profile(self.DEFAULT_PROFILES[profile_name], profile_name)
+            self._profile_source = None
             return
 
-        filepath = os.path.join(CONTROLLERS_DIR, f"{profile_name}.json")
-        if os.path.exists(filepath):
-            self.load_profile_from_file(filepath)
+        profile, version = self.profile_catalogue.get_versioned(profile_name)
+        if profile is not None:
+            self._install_profile(profile, profile["name"])
+            self._profile_source = (profile_name, version)
             return
 
         raise ValueError(f"Unknown profile: {profile_name}")
 
+    def reload_profiles(self) -> bool:
+        """
+        Hot-reload the active profile into the running emulator if the catalogue holds a
+        newer version of its file than the one installed. Each emulator compares its own
+        installed version, so it does not matter which caller refreshed the shared
+        catalogue first. Returns True if the active profile was reloaded.
+        """
+        source = self._profile_source
+        if source is None:
+            return False
+        name, installed = source
+        profile, version = self.profile_catalogue.get_versioned(name)
+        if profile is None or version == installed:
+            return False
+        self._install_profile(profile, profile["name"])
+        self._profile_source = (name, version)
+        print(f"[Profile] Hot-reloaded '{profile['name']}' from {self.profile_catalogue.path(name)}")
+        return True
+
+    def _profile_watch_loop(self, stop: threading.Event):
+        """Background thread: hot-reload the active profile when its file changes, until `stop` is set."""
+        while not stop.wait(self.profile_catalogue.check_interval):
+            try:
+                self.reload_profiles()
+            except OSError as e:
+                print(f"[Profile] Catalogue refresh failed: {e}")
+
     def get_current_profile(self) -> str:
         """Get the name of the currently active profile."""
         return self.current_profile
@@ -339,23 +2653,18 @@ class OpenProtocolEmulator:
     def get_available_profiles(self) -> list:
         """Get list of available profile names (built-in + controllers folder)."""
         profiles = list(self.DEFAULT_PROFILES.keys())
-        if os.path.exists(CONTROLLERS_DIR):
-            for filename in os.listdir(CONTROLLERS_DIR):
-                if filename.endswith('.json'):
-                    profile_name = filename[:-5]
-                    if profile_name not in profiles:
-                        profiles.append(profile_name)
+        for profile_name in self.profile_catalogue.names():
+            if profile_name not in self.DEFAULT_PROFILES:
+                profiles.append(profile_name)
         return profiles
 
     def get_profile_description(self, profile_name: str) -> str:
         """Get the description of a profile."""
         if profile_name in self.DEFAULT_PROFILES:
             return self.DEFAULT_PROFILES[profile_name]["description"]
-        filepath = os.path.join(CONTROLLERS_DIR, f"{profile_name}.json")
-        if os.path.exists(filepath):
-            with open(filepath, 'r') as f:
-                profile_data = json.load(f)
-            return profile_data.get("description", f"Custom profile: {profile_name}")
+        profile = self.profile_catalogue.get(profile_name)
+        if profile is not None:
+            return profile["description"]
         return "Unknown profile"
 
     def save_profile_to_file(self, filepath: str, profile_name: str) -> None:
@@ -370,11 +2679,12 @@ class OpenProtocolEmulator:
 
     def save_profile_to_controllers(self, profile_name: str) -> str:
         """Save current revision config to controllers folder. Returns filepath."""
-        if not os.path.exists(CONTROLLERS_DIR):
-            os.makedirs(CONTROLLERS_DIR)
-        filepath = os.path.join(CONTROLLERS_DIR, f"{profile_name}.json")
+        os.makedirs(self.profile_catalogue.directory, exist_ok=True)
+        filepath = self.profile_catalogue.path(profile_name)
         self.save_profile_to_file(filepath, profile_name)
+        self.profile_catalogue.refresh(force=True)
         self.current_profile = profile_name
+        self._profile_source = (profile_name, self.profile_catalogue.get_versioned(profile_name)[1])
         return filepath
 
     def load_profile_from_file(self, filepath: str) -> str:
@@ -383,22 +2693,11 @@ class OpenProtocolEmulator:
             raise FileNotFoundError(f"Profile file not found: {filepath}")
 
         with open(filepath, 'r') as f:
-            profile_data = json.load(f)
-
-        if "revisions" not in profile_data:
-            raise ValueError("Invalid profile file: missing 'revisions' key")
-
-        for mid_str, rev in profile_data["revisions"].items():
-            mid = int(mid_str)
-            self.revision_config[mid] = rev
+            profile = ProfileCatalogue.parse(json.load(f), "custom")
 
-        if "relay_mappings" in profile_data:
-            self.relay_mappings.update(profile_data["relay_mappings"])
-            self._ensure_relay_functions_exist()
-
-        profile_name = profile_data.get("name", "custom")
-        self.current_profile = profile_name
-        return profile_name
+        self._install_profile(profile, profile["name"])
+        self._profile_source = None
+        return profile["name"]
 
     def _build_mid0002_data(self, revision: int) -> str:
         """Build MID 0002 response data for given revision (1-6)."""
@@ -435,6 +2734,7 @@ class OpenProtocolEmulator:
 
     def _build_mid0004_data(self, revision: int, mid: int, error_code: int, extra_text: str = "") -> str:
         """Build MID 0004 error response data for given revision (1-3)."""
+        self.command_errors += 1
         fields = []
 
         fields.append(f"{mid:04d}")
@@ -459,20 +2759,40 @@ class OpenProtocolEmulator:
             response_rev = self._get_response_revision(2, requested_rev)
             data = self._build_mid0002_data(response_rev)
             resp = build_message(2, rev=response_rev, data=data)
-            self.session_active = True
+            with self.state_lock:
+                self.session_active = True
+                self.session_generation += 1
+                generation = self.session_generation
             print(f"[Session] Communication started (rev {response_rev}).")
-            threading.Thread(target=self.send_tightening_results_loop, daemon=True).start()
+            self.ack_tracker.reset()
+            self._ack_tracking_open = True
+            threading.Thread(target=self.send_tightening_results_loop, args=(generation,), daemon=True).start()
+            threading.Thread(target=self._ack_monitor_loop, args=(generation,), daemon=True).start()
+            if requested_rev >= 7 and self.seq_num_support and self.link_support:
+                link = LinkLevelSession(self.link_window, self.link_ack_timeout, self.link_max_retries)
+                self.link_session = link
+                self._accept_link_sequence(link, 1, msg)
+                threading.Thread(target=self._link_retransmit_loop, args=(link, generation), daemon=True).start()
+                print(f"[Link] Link-level acknowledgement active (window {self.link_window}, timeout {self.link_ack_timeout:g}s).")
         self.send_to_client(resp)
 
     def _handle_mid_0003(self, mid_int, rev, no_ack_flag, data_field, msg):
         resp = build_message(5, rev=1, data="0003")
         self.send_to_client(resp)
+        queue = self.outbound_queue
+        if queue is not None:
+            queue.wait_empty(self.outbound_block_timeout)
+        with self.send_lock:
+            self._flush_segments()
         print("[Session] Communication stop received. Ending session.")
         self.session_active = False
         self.vin_subscribed = False
         self.result_subscribed = False
         self.pset_subscribed = False
         self.pset_subscribed_rev = 1
+        self.trace_subscriptions = {}
+        self._end_link_session()
+        self._end_ack_tracking()
         try:
             if self.client_socket:
                 self.client_socket.close()
@@ -486,13 +2806,188 @@ class OpenProtocolEmulator:
     def _handle_mid_0005(self, mid_int, rev, no_ack_flag, data_field, msg):
         print(f"[Info] Received MID 0005 from client: Data='{data_field}' (ignored).")
 
+    def _handle_mid_9997(self, mid_int, rev, no_ack_flag, data_field, msg):
+        """MID 9997: Link level positive acknowledge."""
+        link = self.link_session
+        try:
+            seq = int(msg[16:18])
+        except ValueError:
+            print(f"[Link] MID 9997 with invalid sequence number: {msg[16:18]!r}")
+            return
+        if link is not None:
+            with self.send_lock:
+                for frame in link.acknowledge(seq):
+                    self._write_frame(frame)
+
+    def _handle_mid_9998(self, mid_int, rev, no_ack_flag, data_field, msg):
+        """MID 9998: Link level negative acknowledge (retransmit the rejected frame)."""
+        link = self.link_session
+        try:
+            seq = int(msg[16:18])
+        except ValueError:
+            print(f"[Link] MID 9998 with invalid sequence number: {msg[16:18]!r}")
+            return
+        print(f"[Link] Negative ack for MID {data_field[:4]} seq {seq:02d}, error {data_field[4:8]}.")
+        if link is not None:
+            with self.send_lock:
+                for frame in link.reject(seq):
+                    self._write_frame(frame)
+
+    def _accept_link_sequence(self, link: LinkLevelSession, mid_int: int, msg: bytes) -> bool:
+        """Acknowledge an inbound frame at link level. Returns False if it must not be processed."""
+        try:
+            seq = int(msg[16:18])
+        except ValueError:
+            nak = build_message(9998, rev=1, data=f"{mid_int:04d}{LINK_NAK_INVALID_SEQUENCE:04d}")
+            self._send_link_frame(nak)
+            print(f"[Link] Rejected MID {mid_int:04d}: invalid sequence number {msg[16:18]!r}.")
+            return False
+        self._send_link_frame(LinkLevelSession.stamp(build_message(9997, rev=1, data=f"{mid_int:04d}"), seq))
+        if seq == link.last_rx_seq:
+            link.duplicates_received += 1
+            print(f"[Link] Duplicate MID {mid_int:04d} seq {seq:02d} re-acknowledged, not processed.")
+            return False
+        link.last_rx_seq = seq
+        return True
+
+    def _on_event_ack(self, ack_mid: int):
+        """Match an application-level ack to its event and release any held event."""
+        event_mid = EventAckTracker.EVENT_ACKS[ack_mid]
+        latency, released = self.ack_tracker.acknowledge(event_mid)
+        if latency is None:
+            print(f"[Ack] MID {ack_mid:04d} received with no MID {event_mid:04d} awaiting ack.")
+        else:
+            print(f"[Ack] MID {event_mid:04d} acknowledged after {latency * 1000:.1f} ms.")
+        for frame in released:
+            self._transmit(frame)
+
+    def _ack_monitor_loop(self, generation):
+        """Flag events whose ack is overdue and release events held behind them."""
+        while self._session_is_current(generation):
+            time.sleep(0.25)
+            missing, released = self.ack_tracker.expire()
+            for event_mid, age in missing:
+                print(f"[Ack] Missing ack for MID {event_mid:04d} (no reply after {age:.1f}s).")
+            for frame in released:
+                self._transmit(frame)
+
+    def _print_ack_stats(self, stats: dict):
+        for event_mid, st in stats.items():
+            if not st["sent"]:
+                continue
+            buckets = ", ".join(f"{k}: {v}" for k, v in st["histogram"].items() if v)
+            print(f"[Ack] MID {event_mid:04d}: {st['sent']} sent, {st['acked']} acked, {st['missing']} missing, "
+                  f"avg {st['latency_avg_ms']:.1f} ms, max {st['latency_max_ms']:.1f} ms [{buckets}]")
+
+    def _send_link_frame(self, frame: bytes):
+        """Send a MID 9997/9998 frame outside the sequence window."""
+        if self.client_socket:
+            with self.send_lock:
+                self._write_frame(frame)
+
+    def _link_retransmit_loop(self, link: LinkLevelSession, generation):
+        """Retransmit unacknowledged frames; drop the connection when retries run out."""
+        interval = max(0.01, min(0.25, link.ack_timeout / 4))
+        while self.link_session is link and self._session_is_current(generation):
+            time.sleep(interval)
+            with self.send_lock:
+                resend, failed = link.expired()
+                for frame in resend:
+                    self._write_frame(frame)
+            if resend:
+                print(f"[Link] Retransmitted {len(resend)} unacknowledged frame(s).")
+            if failed:
+                print(f"[Link] No acknowledgement after {link.max_retries} retries. Closing connection.")
+                sock = self.client_socket
+                if sock:
+                    try: sock.shutdown(socket.SHUT_RDWR)
+                    except OSError: pass
+                return
+
     def _handle_mid_9999(self, mid_int, rev, no_ack_flag, data_field, msg):
         print("[KeepAlive] Received keep-alive message.")
+        observer = self.client_observer
+        if observer is not None:
+            observer.keepalive()
         resp = build_message(9999, rev=1)
         self.send_to_client(resp)
         print("[KeepAlive] Echo back keep-alive message.")
+
+    # === Application Data Subscription MID Handlers ===
+
+    def _handle_mid_0008(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
+        """MID 0008: Application data message subscription (trace curves MID 0900/0901)."""
+        try:
+            sub_mid = int(data_field[0:4])
+            wanted_rev = int(data_field[4:7]) if data_field[4:7].strip() else 1
+        except ValueError:
+            error_data = self._build_mid0004_data(1, 8, 1)
+            self.send_to_client(build_message(4, rev=1, data=error_data))
+            print(f"[Trace] Invalid subscription data: '{data_field}'")
+            return
+
+        if sub_mid not in (900, 901):
+            error_data = self._build_mid0004_data(1, 8, 99)
+            resp = build_message(4, rev=1, data=error_data)
+            print(f"[Trace] Subscription to MID {sub_mid:04d} not supported.")
+        elif sub_mid in self.trace_subscriptions:
+            error_data = self._build_mid0004_data(1, 8, 6)
+            resp = build_message(4, rev=1, data=error_data)
+            print(f"[Trace] Subscription to MID {sub_mid:04d} already exists.")
+        else:
+            sub_rev = self._get_response_revision(sub_mid, max(wanted_rev, 1))
+            self.trace_subscriptions[sub_mid] = (sub_rev, no_ack_flag == "1")
+            resp = build_message(5, rev=1, data="0008")
+            print(f"[Trace] Subscribed to MID {sub_mid:04d} (rev {sub_rev}).")
+        self.send_to_client(resp)
+
+    def _handle_mid_0009(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
+        """MID 0009: Application data message unsubscribe."""
+        try:
+            sub_mid = int(data_field[0:4])
+        except ValueError:
+            sub_mid = None
+
+        if sub_mid in self.trace_subscriptions:
+            del self.trace_subscriptions[sub_mid]
+            resp = build_message(5, rev=1, data="0009")
+            print(f"[Trace] Unsubscribed from MID {sub_mid:04d}.")
+        else:
+            error_data = self._build_mid0004_data(1, 9, 7)
+            resp = build_message(4, rev=1, data=error_data)
+            print(f"[Trace] Unsubscribe failed: not subscribed to '{data_field[0:4]}'.")
+        self.send_to_client(resp)
+
     # === Parameter Set MID Handlers ===
 
+    def _handle_mid_0010(self, mid_int, rev, no_ack_flag, data_field, msg):
+        """MID 0010: Parameter set ID upload request, answered from the pre-encoded MID 0011 page."""
+        requested_rev = int(rev) if rev.strip() else 1
+        response_rev = self._get_response_revision(11, requested_rev)
+        frames = self._get_pset_frames(
+            (11, response_rev),
+            lambda: build_message_parts(11, response_rev, self._build_mid0011_data(response_rev)))
+        for frame in frames:
+            self.send_to_client(frame)
+        print(f"[Pset] Sent Pset ID list (MID 0011 rev {response_rev}): {len(self.pset_parameters)} Psets.")
+
+    def _handle_mid_0012(self, mid_int, rev, no_ack_flag, data_field, msg):
+        """MID 0012: Parameter set data upload request, answered from pre-encoded MID 0013 frames."""
+        pset_id = data_field[0:3]
+        if pset_id not in self.pset_parameters:
+            error_data = self._build_mid0004_data(1, 12, 2)
+            self.send_to_client(build_message(4, rev=1, data=error_data))
+            print(f"[Pset] Pset data upload failed: unknown Pset '{pset_id}'.")
+            return
+        requested_rev = int(rev) if rev.strip() else 1
+        response_rev = self._get_response_revision(13, requested_rev)
+        frames = self._get_pset_frames(
+            (13, response_rev, pset_id),
+            lambda: build_message_parts(13, response_rev, self._build_mid0013_data(response_rev, pset_id)))
+        for frame in frames:
+            self.send_to_client(frame)
+        print(f"[Pset] Sent Pset {pset_id} data (MID 0013 rev {response_rev}).")
+
     def _handle_mid_0014(self, mid_int, rev, no_ack_flag, data_field, msg):
         if self.pset_subscribed:
             error_data = self._build_mid0004_data(1, 14, 6)
@@ -513,6 +3008,7 @@ class OpenProtocolEmulator:
 
     def _handle_mid_0016(self, mid_int, rev, no_ack_flag, data_field, msg):
         print("[Pset] Pset selected acknowledged by client (MID 0016).")
+        self._on_event_ack(mid_int)
 
     def _handle_mid_0017(self, mid_int, rev, no_ack_flag, data_field, msg):
         if self.pset_subscribed:
@@ -526,33 +3022,32 @@ class OpenProtocolEmulator:
         self.send_to_client(resp)
 
     def _handle_mid_0018(self, mid_int, rev, no_ack_flag, data_field, msg):
-        pset_id = data_field.strip()
-        if pset_id == "0" or pset_id == "000":
-            self.current_pset = "0"
-            self.pset_last_change = datetime.datetime.now()
-            self.pset_ok_counter = 0
-            resp = build_message(5, rev=1, data="0018")
-            print("[Pset] No Pset selected (Pset 0).")
-            if self.pset_subscribed:
-                mid15_data = self._build_mid0015_data(self.pset_subscribed_rev)
-                mid15_msg = build_message(15, rev=self.pset_subscribed_rev, data=mid15_data)
-                self.send_to_client(mid15_msg)
-                print(f"[Pset] Sent MID 0015 rev {self.pset_subscribed_rev}: Pset 0")
-        elif pset_id in self.available_psets:
-            self.current_pset = pset_id
-            self.pset_last_change = datetime.datetime.now()
-            self.pset_ok_counter = 0
+        if self.select_pset(data_field.strip()):
             resp = build_message(5, rev=1, data="0018")
-            print(f"[Pset] Pset {pset_id} selected.")
-            if self.pset_subscribed:
-                mid15_data = self._build_mid0015_data(self.pset_subscribed_rev)
-                mid15_msg = build_message(15, rev=self.pset_subscribed_rev, data=mid15_data)
-                self.send_to_client(mid15_msg)
-                print(f"[Pset] Sent MID 0015 rev {self.pset_subscribed_rev}: {self.current_pset}")
         else:
             error_data = self._build_mid0004_data(1, 18, 2)
             resp = build_message(4, rev=1, data=error_data)
         self.send_to_client(resp)
+
+    def select_pset(self, pset_id: str) -> bool:
+        """Select a Pset ("0"/"000" for none) as MID 0018 does; sends MID 0015 if subscribed."""
+        if pset_id == "0" or pset_id == "000":
+            pset_id = "0"
+            print("[Pset] No Pset selected (Pset 0).")
+        elif pset_id in self.available_psets:
+            print(f"[Pset] Pset {pset_id} selected.")
+        else:
+            return False
+        self.current_pset = pset_id
+        self.pset_last_change = self.clock.datetime()
+        self.pset_ok_counter = 0
+        if self.pset_subscribed:
+            mid15_data = self._build_mid0015_data(self.pset_subscribed_rev)
+            mid15_msg = build_message(15, rev=self.pset_subscribed_rev, data=mid15_data)
+            self.send_to_client(mid15_msg)
+            print(f"[Pset] Sent MID 0015 rev {self.pset_subscribed_rev}: {'Pset 0' if pset_id == '0' else pset_id}")
+        self._state_changed()
+        return True
     # === Tool Control MID Handlers ===
 
     def _handle_mid_0040(self, mid_int, rev, no_ack_flag, data_field, msg):
@@ -588,13 +3083,29 @@ class OpenProtocolEmulator:
     def _handle_mid_0050(self, mid_int, rev, no_ack_flag, data_field, msg):
         vin = data_field.strip()
         print(f"[VIN] Received VIN download: {vin}")
+        self._apply_vin(vin)
+        resp = build_message(5, rev=1, data="0050")
+        self.send_to_client(resp)
+        self._send_vin_update()
+
+    def set_vin(self, vin: str) -> bool:
+        """Apply a VIN with MID 0050 semantics (batch counter reset, MID 0052 to subscribers)."""
+        ok = self._apply_vin(vin)
+        self._send_vin_update()
+        self._state_changed()
+        return ok
+
+    def _apply_vin(self, vin: str) -> bool:
         if self._parse_vin(vin):
             self.current_vin = vin
             with self.state_lock:
                 self.batch_counter = 0
             print("[VIN] Batch counter reset due to new VIN.")
-        resp = build_message(5, rev=1, data="0050")
-        self.send_to_client(resp)
+            self._persist_state()
+            return True
+        return False
+
+    def _send_vin_update(self):
         if self.vin_subscribed:
             vin_data = self._build_mid0052_data(self.vin_subscribed_rev)
             vin_msg = build_message(52, rev=self.vin_subscribed_rev, data=vin_data, no_ack=self.vin_no_ack)
@@ -622,6 +3133,7 @@ class OpenProtocolEmulator:
 
     def _handle_mid_0053(self, mid_int, rev, no_ack_flag, data_field, msg):
         print("[VIN] VIN event acknowledged by client (MID 0053).")
+        self._on_event_ack(mid_int)
 
     def _handle_mid_0054(self, mid_int, rev, no_ack_flag, data_field, msg):
         if self.vin_subscribed:
@@ -650,6 +3162,7 @@ class OpenProtocolEmulator:
 
     def _handle_mid_0062(self, mid_int, rev, no_ack_flag, data_field, msg):
         print("[Tightening] Tightening result acknowledged by client (MID 0062).")
+        self._on_event_ack(mid_int)
 
     def _handle_mid_0063(self, mid_int, rev, no_ack_flag, data_field, msg):
         if self.result_subscribed:
@@ -667,7 +3180,7 @@ class OpenProtocolEmulator:
         time_str = data_field.strip()
         if len(time_str) == 19:
             try:
-                datetime.datetime.strptime(time_str, "%Y-%m-%d:%H:%M:%S")
+                self.clock.set_time(datetime.datetime.strptime(time_str, VirtualClock.FORMAT))
                 self.controller_time = time_str
                 resp = build_message(5, rev=1, data="0082")
                 print(f"[Time] Controller time set to: {time_str}")
@@ -715,6 +3228,7 @@ class OpenProtocolEmulator:
     def _handle_mid_0102(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
         """MID 0102: Multi-spindle result acknowledge."""
         print("[MultiSpindle] Result acknowledged by client (MID 0102).")
+        self._on_event_ack(mid_int)
 
     def _handle_mid_0103(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
         """MID 0103: Multi-spindle result unsubscribe."""
@@ -745,52 +3259,8 @@ class OpenProtocolEmulator:
             resp = build_message(4, rev=1, data=error_data)
             print(f"[IO] Device {device_num} not found.")
         else:
-            device = self.io_devices[device_num]
-            relays = device["relays"]
-            digital_inputs = device["digital_inputs"]
-
-            if req_rev == 1:
-                fields = []
-                fields.append(f"01{device_num}")
-
-                relay_data = ""
-                for relay in relays[:8]:
-                    relay_data += f"{relay['function']:03d}{relay['status']}"
-                while len(relay_data) < 32:
-                    relay_data += "0000"
-                fields.append(f"02{relay_data}")
-
-                din_data = ""
-                for din in digital_inputs[:8]:
-                    din_data += f"{din['function']:03d}{din['status']}"
-                while len(din_data) < 32:
-                    din_data += "0000"
-                fields.append(f"03{din_data}")
-
-                data = "".join(fields)
-                resp = build_message(215, rev=1, data=data)
-
-            else:
-                fields = []
-                fields.append(f"01{device_num}")
-                fields.append(f"02{len(relays):02d}")
-
-                relay_data = ""
-                for relay in relays:
-                    relay_data += f"{relay['function']:03d}{relay['status']}"
-                fields.append(f"03{relay_data}")
-
-                fields.append(f"04{len(digital_inputs):02d}")
-
-                din_data = ""
-                for din in digital_inputs:
-                    din_data += f"{din['function']:03d}{din['status']}"
-                fields.append(f"05{din_data}")
-
-                data = "".join(fields)
-                resp = build_message(215, rev=2, data=data)
-
-            print(f"[IO] Sent device {device_num} status (MID 0215 rev {req_rev}).")
+            resp = self._io_snapshots[device_num].frame(req_rev)
+            print(f"[IO] Sent device {device_num} status (MID 0215 rev {min(req_rev, 2)}).")
 
         self.send_to_client(resp)
 
@@ -824,6 +3294,7 @@ class OpenProtocolEmulator:
     def _handle_mid_0218(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
         """MID 0218: Relay function acknowledge."""
         print("[Relay] Relay function acknowledged by client (MID 0218).")
+        self._on_event_ack(mid_int)
 
     def _handle_mid_0219(self, mid_int: int, rev: str, no_ack_flag: str, data_field: str, msg: bytes):
         """MID 0219: Relay function unsubscribe."""
@@ -848,36 +3319,139 @@ class OpenProtocolEmulator:
 
         self.send_to_client(resp)
 
+    def set_relay_status(self, relay_function: int, status: int) -> bool:
+        """Set a relay function in io_devices and send MID 0217 if it is subscribed."""
+        entry = self._relay_index.get(relay_function)
+        if entry is None:
+            print(f"[Relay] Relay function {relay_function} not found in any device")
+            return False
+        relay, snapshot, index = entry
+        relay["status"] = status
+        snapshot.set_relay(index, status)
+        print(f"[Relay] Set relay function {relay_function} to {'ON' if status else 'OFF'}")
+        if relay_function in self.relay_subscriptions:
+            self._send_relay_status(relay_function)
+        return True
+
+    def set_relays(self, changes: dict) -> int:
+        """
+        Apply several relay changes ({function: status}) and send the resulting MID 0217
+        events to subscribers as one batch. Unchanged relays send nothing. Returns the
+        number of events queued; raises ValueError for an unknown function.
+        """
+        frames = []
+        for relay_function, status in changes.items():
+            frame = self._apply_relay_change(relay_function, status)
+            if frame is not None:
+                frames.append(frame)
+        if frames:
+            self.send_many_to_client(frames)
+        return len(frames)
+
+    def _apply_relay_change(self, relay_function: int, status: int):
+        """Set a relay's status; returns its MID 0217 frame if it changed and is subscribed."""
+        entry = self._relay_index.get(relay_function)
+        if entry is None:
+            raise ValueError(f"Relay function {relay_function} not found in any device")
+        relay, snapshot, index = entry
+        if relay["status"] == status:
+            return None
+        relay["status"] = status
+        snapshot.set_relay(index, status)
+        no_ack = self.relay_subscriptions.get(relay_function)
+        if no_ack is None:
+            return None
+        return self._relay_frame(relay_function, status, no_ack)
+
+    def _relay_frame(self, relay_func: int, status: int, no_ack: bool) -> bytes:
+        """Pre-encoded MID 0217 frame for a relay function status."""
+        key = (relay_func, status, no_ack)
+        frame = self._relay_frames.get(key)
+        if frame is None:
+            frame = self._relay_frames[key] = build_message(217, rev=1, data=f"01{relay_func:03d}02{status}",
+                                                            no_ack=no_ack)
+        return frame
+
     def _send_relay_status(self, relay_func: int):
         """Send MID 0217 relay function status for a subscribed relay."""
-        status = 0
-        for device in self.io_devices.values():
-            for relay in device["relays"]:
-                if relay["function"] == relay_func:
-                    status = relay["status"]
-                    break
-
+        entry = self._relay_index.get(relay_func)
+        status = entry[0]["status"] if entry is not None else 0
         no_ack = self.relay_subscriptions.get(relay_func, False)
-
-        data = f"01{relay_func:03d}02{status}"
-        msg = build_message(217, rev=1, data=data, no_ack=no_ack)
-        self.send_to_client(msg)
+        self.send_to_client(self._relay_frame(relay_func, status, no_ack))
         print(f"[Relay] Sent relay {relay_func} status: {status} (MID 0217)")
 
+    def start_relay_stream(self, rate_hz: float, direction_every: int = 100) -> None:
+        """
+        Drive the trigger relay (toggled every tick) and the forward/reverse direction
+        relays (swapped every `direction_every` ticks) at `rate_hz`, sending MID 0217 to
+        subscribers. Ticks that come due together are sent as one batch.
+        """
+        if rate_hz <= 0:
+            raise ValueError(f"Relay stream rate must be > 0, got {rate_hz}")
+        if direction_every < 1:
+            raise ValueError(f"Direction interval must be >= 1 tick, got {direction_every}")
+        self.stop_relay_stream()
+        stop = threading.Event()
+        self._relay_stream_stop = stop
+        threading.Thread(target=self._relay_stream_loop, args=(rate_hz, direction_every, stop), daemon=True).start()
+        print(f"[Relay] Streaming trigger/direction relays at {rate_hz:g} Hz.")
+
+    def stop_relay_stream(self) -> None:
+        stop = self._relay_stream_stop
+        if stop is not None:
+            stop.set()
+            self._relay_stream_stop = None
+
+    def _relay_stream_loop(self, rate_hz: float, direction_every: int, stop: threading.Event):
+        trigger = self.relay_mappings.get("trigger", 20)
+        forward = self.relay_mappings.get("forward", 21)
+        reverse = self.relay_mappings.get("reverse", 22)
+        max_batch = max(1, int(rate_hz / 10))  # Fall behind by at most 100 ms, then skip ticks
+        period = 1.0 / rate_hz
+        stats = self.relay_stream_stats = {"rate_hz": rate_hz, "ticks": 0, "skipped": 0, "events": 0,
+                                           "batches": 0, "elapsed": 0.0}
+        start = time.monotonic()
+        tick = 0
+        while not stop.is_set():
+            due = int((time.monotonic() - start) * rate_hz)
+            if due <= tick:
+                stop.wait(period)
+                continue
+            if due - tick > max_batch:
+                stats["skipped"] += due - tick - max_batch
+                tick = due - max_batch
+            frames = []
+            try:
+                for t in range(tick, due):
+                    frame = self._apply_relay_change(trigger, (t + 1) % 2)
+                    if frame is not None:
+                        frames.append(frame)
+                    if t % direction_every == 0:
+                        is_forward = (t // direction_every) % 2 == 0
+                        for function, status in ((forward, int(is_forward)), (reverse, int(not is_forward))):
+                            frame = self._apply_relay_change(function, status)
+                            if frame is not None:
+                                frames.append(frame)
+            except ValueError as e:
+                print(f"[Relay] Relay stream stopped: {e}")
+                break
+            stats["ticks"] += due - tick
+            tick = due
+            if frames and self.session_active:
+                self.send_many_to_client(frames)
+                stats["events"] += len(frames)
+                stats["batches"] += 1
+        stats["elapsed"] = time.monotonic() - start
+        achieved = stats["ticks"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        print(f"[Relay] Relay stream stopped: {stats['ticks']} ticks ({achieved:.0f} Hz), {stats['events']} events "
+              f"in {stats['batches']} batches, {stats['skipped']} ticks skipped.")
+
     def _initialize_default_pset_parameters(self):
-        """Initializes default parameters for available Psets."""
-        default_params = {
-            "batch_size": 5,
-            "target_torque": 50.00,
-            "torque_min": 47.00,
-            "torque_max": 53.00,
-            "target_angle": 90,
-            "angle_min": 80,
-            "angle_max": 100,
-        }
-        for pset_id in self.available_psets:
+        """Initializes default parameters for the built-in Psets."""
+        default_params = {name: default for name, _, default in PsetStore.FIELDS}
+        for pset_id in self.DEFAULT_PSET_IDS:
             if pset_id not in self.pset_parameters: # Only initialize if not loaded from file
-                self.pset_parameters[pset_id] = default_params.copy()
+                self.pset_parameters[pset_id] = default_params
         print("[Pset Params] Initialized default Pset parameters for new Psets.")
 
 
@@ -885,16 +3459,16 @@ class OpenProtocolEmulator:
         """Generates the filename for Pset parameters based on controller name."""
         # Sanitize the controller name to be safe for filenames (strip padding first)
         safe_name = re.sub(r'[^\w.-]', '_', controller_name.strip())
-        return f"pset_parameters_{safe_name}.json"
+        filename = f"pset_parameters_{safe_name}.json"
+        return os.path.join(self.data_dir, filename) if self.data_dir else filename
 
 
     def _load_pset_parameters(self, controller_name):
         """Loads Pset parameters from a JSON file based on controller name."""
-        import json
         filename = self._get_pset_filename(controller_name)
         try:
             with open(filename, 'r') as f:
-                self.pset_parameters = json.load(f)
+                self.pset_parameters.update(json.load(f))
             print(f"[Pset Params] Loaded parameters from {filename}")
             # Ensure all available_psets are in the loaded parameters, add defaults if missing
             self._initialize_default_pset_parameters()
@@ -909,23 +3483,188 @@ class OpenProtocolEmulator:
             self._initialize_default_pset_parameters()
 
 
+    def _snapshot_pset_parameters(self) -> dict:
+        """Copy of the Pset parameters for the background writer, sorted by Pset ID."""
+        with self.state_lock:
+            return {pset_id: self.pset_parameters[pset_id] for pset_id in self.pset_parameters.sorted_ids()}
+
     def _save_pset_parameters(self, controller_name):
         """Saves current Pset parameters to a JSON file based on controller name."""
-        import json
+        if self.state_store is not None:
+            self.pset_writer.flush()
+            return
         filename = self._get_pset_filename(controller_name)
-        try:
-            sorted_params = dict(sorted(self.pset_parameters.items()))
-            with open(filename, 'w') as f:
-                json.dump(sorted_params, f, indent=4)
+        if filename != self.pset_writer.path:
+            self.pset_writer.flush()
+            self.pset_writer = JsonWriteBehind(filename, self._snapshot_pset_parameters)
+        self.pset_writer.mark_dirty()
+        if self.pset_writer.flush():
             print(f"[Pset Params] Saved parameters to {filename}")
-        except Exception as e:
-            print(f"[Pset Params] Error saving parameters to {filename}: {e}")
+
+    @staticmethod
+    def _check_pset_parameters(params: dict) -> None:
+        """Raise ValueError if a complete Pset parameter dict is inconsistent."""
+        if params["batch_size"] < 0:
+            raise ValueError("Batch size must be >= 0")
+        if params["torque_min"] > params["torque_max"]:
+            raise ValueError("Min Torque > Max Torque")
+        if params["angle_min"] > params["angle_max"]:
+            raise ValueError("Min Angle > Max Angle")
+
+    def set_pset_parameters(self, pset_id: str, params: dict) -> None:
+        """Replace a Pset's parameters; the file is updated by the background writer."""
+        pset_id = PsetStore.normalize_id(pset_id)
+        self._check_pset_parameters(params)
+        with self.state_lock:
+            self.pset_parameters[pset_id] = params
+        self.pset_writer.mark_dirty(pset_id)
+        self._state_changed()
+
+    def use_state_store(self, path: str) -> None:
+        """
+        Keep Psets, counters, VIN state and result history in a shared SQLite database
+        instead of pset_parameters_<name>.json. Psets already in the database for this
+        controller replace the loaded ones; otherwise the current Psets are stored.
+        """
+        store = SqliteStateStore.shared(path)
+        controller = self.controller_name.strip()
+        psets = store.load_psets(controller)
+        state = store.load_state(controller)
+        self.pset_writer.flush()
+        with self.state_lock:
+            self.state_store = store
+            self.pset_writer = SqlitePsetWriter(store, controller, self.pset_parameters, self.state_lock)
+            if psets:
+                for pset_id in list(self.pset_parameters):
+                    if pset_id not in psets:
+                        del self.pset_parameters[pset_id]
+                self.pset_parameters.update(psets)
+            if state:
+                self.tightening_id_counter = int(state.get("tightening_id_counter", 0))
+                self.batch_counter = int(state.get("batch_counter", 0))
+                self.pset_ok_counter = int(state.get("pset_ok_counter", 0))
+                self.tool_number_of_tightenings = int(state.get("tool_number_of_tightenings", 0))
+                self.tool_tightenings_since_service = int(state.get("tool_tightenings_since_service", 0))
+                self.current_pset = state.get("current_pset") or None
+                if state.get("current_vin") and self._parse_vin(state["current_vin"]):
+                    self.current_vin = state["current_vin"]
+        if not psets:
+            self.pset_writer.mark_dirty()
+        print(f"[StateDB] Using {path} for controller '{controller}': {len(psets)} stored Psets, "
+              f"{'restored' if state else 'no stored'} counters.")
+
+    def _persist_state(self) -> None:
+        """Queue counters and VIN state for the state store (no-op without one)."""
+        if self.state_store is None:
+            return
+        with self.state_lock:
+            state = {
+                "tightening_id_counter": self.tightening_id_counter,
+                "batch_counter": self.batch_counter,
+                "pset_ok_counter": self.pset_ok_counter,
+                "tool_number_of_tightenings": self.tool_number_of_tightenings,
+                "tool_tightenings_since_service": self.tool_tightenings_since_service,
+                "current_pset": self.current_pset or "",
+                "current_vin": self.current_vin,
+            }
+        self.state_store.put_state(self.controller_name.strip(), state)
+
+    def get_result_history(self, limit: int = 100, after_id: int = 0) -> list:
+        """Stored tightening results for this controller (requires a state store)."""
+        if self.state_store is None:
+            raise ValueError("No state store configured")
+        return self.state_store.query_results(self.controller_name.strip(), limit, after_id)
+
+    def import_psets_csv(self, path: str) -> int:
+        """
+        Add or update Psets from a CSV file with a header row (pset_id required; name and
+        parameter columns optional). All rows are validated before any is applied.
+        Returns the number of Psets imported.
+        """
+        rows = []
+        merged = {}  # Pset ID -> parameters after the rows so far, for validation
+        with open(path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or "pset_id" not in reader.fieldnames:
+                raise ValueError(f"{path}: missing 'pset_id' column")
+            for line_num, row in enumerate(reader, start=2):
+                try:
+                    pset_id = PsetStore.normalize_id(row["pset_id"])
+                    params = {}
+                    if row.get("name"):
+                        params["name"] = row["name"].strip()[:25]
+                    for name, code, _ in PsetStore.FIELDS:
+                        value = (row.get(name) or "").strip()
+                        if value:
+                            params[name] = float(value) if code == 'd' else int(value)
+                    if pset_id not in merged:
+                        merged[pset_id] = self.pset_parameters.get(pset_id) or \
+                            {name: default for name, _, default in PsetStore.FIELDS}
+                    merged[pset_id] = {**merged[pset_id], **params}
+                    self._check_pset_parameters(merged[pset_id])
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_num}: {e}") from None
+                rows.append((pset_id, params))
+        with self.state_lock:
+            for pset_id, params in rows:
+                self.pset_parameters[pset_id] = params
+        self.pset_writer.mark_dirty()
+        print(f"[Pset Params] Imported {len(rows)} Psets from {path}")
+        return len(rows)
+
+    def export_psets_csv(self, path: str) -> int:
+        """Write all Psets to a CSV file, sorted by ID. Returns the number of Psets written."""
+        snapshot = self._snapshot_pset_parameters()
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=PsetStore.CSV_COLUMNS)
+            writer.writeheader()
+            for pset_id, params in snapshot.items():
+                writer.writerow(dict(params, pset_id=pset_id))
+        print(f"[Pset Params] Exported {len(snapshot)} Psets to {path}")
+        return len(snapshot)
+
+    def _get_pset_frames(self, key: tuple, build):
+        """Return cached frames for a Pset upload reply, rebuilding them after any Pset edit."""
+        with self.state_lock:
+            if self._pset_frames_version != self.pset_parameters.version:
+                self._pset_frames.clear()
+                self._pset_frames_version = self.pset_parameters.version
+            frames = self._pset_frames.get(key)
+            if frames is None:
+                frames = self._pset_frames[key] = build()
+            return frames
+
+    def _build_mid0011_data(self, revision: int) -> bytes:
+        """Build MID 0011 Pset ID upload reply data (rev 1)."""
+        pset_ids = self.pset_parameters.sorted_ids()
+        return f"{len(pset_ids):03d}{''.join(pset_ids)}".encode('ascii')
+
+    def _build_mid0013_data(self, revision: int, pset_id: str) -> bytes:
+        """Build MID 0013 Pset data upload reply data for given revision (1-2)."""
+        target_t, t_min, t_max, target_a, a_min, a_max, batch = self.pset_parameters.limits(pset_id)
+        name = self.pset_parameters.name(pset_id) or f"Pset {pset_id}"
+        fields = [
+            f"01{pset_id}",
+            f"02{name.ljust(25)[:25]}",
+            "031",  # Rotation direction: clockwise
+            f"04{min(max(batch, 0), 99):02d}",
+            f"05{round(t_min * 100):06d}",
+            f"06{round(t_max * 100):06d}",
+            f"07{round(target_t * 100):06d}",
+            f"08{a_min:05d}",
+            f"09{a_max:05d}",
+            f"10{target_a:05d}",
+        ]
+        if revision >= 2:
+            fields.append(f"11{0:06d}")  # First target
+            fields.append(f"12{0:06d}")  # Start final angle
+        return "".join(fields).encode('ascii')
 
 
     def _build_mid0015_data(self, revision: int) -> str:
         """Build MID 0015 Pset selected data for given revision (1-2)."""
         pset_id = (self.current_pset if self.current_pset else "0").rjust(3, '0')
-        date_str = self.pset_last_change.strftime("%Y-%m-%d:%H:%M:%S") if self.pset_last_change else datetime.datetime.now().strftime("%Y-%m-%d:%H:%M:%S")
+        date_str = self.pset_last_change.strftime(VirtualClock.FORMAT) if self.pset_last_change else self.clock.timestamp()
 
         if revision == 1:
             return pset_id + date_str
@@ -1015,6 +3754,12 @@ class OpenProtocolEmulator:
         fields.append(f"21{result_params['pset_change_time']}")
         fields.append(f"22{result_params['batch_status']}")
         fields.append(f"23{result_params['tightening_id']:010d}")
+        fields.append(self._build_mid0061_extension(revision))
+        return "".join(fields)
+
+    def _build_mid0061_extension(self, revision: int) -> str:
+        """MID 0061 fields 24-27, which only depend on the revision and controller settings."""
+        fields = []
 
         if revision >= 3:
             fields.append(f"24{self.strategy_code:04d}")
@@ -1030,6 +3775,142 @@ class OpenProtocolEmulator:
 
         return "".join(fields)
 
+    def _get_result_template(self, limits: tuple) -> tuple:
+        """
+        Return the cached MID 0061 pieces around the per-send fields for the current
+        subscription and Pset: (fields 01-03 + "04", fields 05-07 + "08", fields 24-27,
+        header after the length). Rebuilt, and the result pipeline re-primed, only when
+        the revision, Pset parameters or controller settings change.
+        """
+        revision = self.result_subscribed_rev
+        key = (revision, self.result_no_ack, self.current_pset, limits, self.controller_name,
+               self.strategy_code, self.strategy_options, self.tightening_error_status_2, self.stage_result_count)
+        if self._result_template is None or self._result_template[0] != key:
+            pset_id = (self.current_pset if self.current_pset else "0").rjust(3, '0')
+            template = (f"01{1:04d}02{1:02d}03{self.controller_name}04".encode('ascii'),
+                        f"05{0:02d}06{pset_id}07{limits[6]:04d}08".encode('ascii'),
+                        self._build_mid0061_extension(revision).encode('ascii'),
+                        f"0061{revision:03d}{'1' if self.result_no_ack else '0'}0000    ".encode('ascii'))
+            self._result_template = (key, template)
+            print(f"[Tightening] Result template for Pset {pset_id} (MID 0061 rev {revision}) prepared.")
+        self.result_pipeline.configure(limits, self.nok_probability)
+        return self._result_template[1]
+
+    @staticmethod
+    def _encode_result_frame(template: tuple, outcome: bytes, vin: str, batch_counter: int, timestamp_str: str,
+                             pset_change_ts: str, batch_status: str, tightening_id: int) -> bytes:
+        """Assemble a MID 0061 frame from a result template and a pre-encoded outcome."""
+        head, middle, extension, header = template
+        data = b"".join((head, vin.ljust(25)[:25].encode('ascii'), middle, b"%04d" % batch_counter, outcome,
+                         b"20", timestamp_str.encode('ascii'), b"21", pset_change_ts.encode('ascii'),
+                         b"22", batch_status.encode('ascii'), b"23%010d" % tightening_id, extension))
+        return b"".join((b"%04d" % (len(data) + 20), header, data, b"\x00"))
+
+    def set_result_prefetch(self, depth: int) -> None:
+        """Set how many MID 0061 outcomes are drawn and encoded ahead (0 draws each one on send)."""
+        if not 0 <= depth <= 100000:
+            raise ValueError(f"Result prefetch depth must be 0-100000, got {depth}")
+        self.result_pipeline.set_depth(depth)
+
+    def _encode_pid_field(self, pid: int, value: str, data_type: str, unit: str, step: int = 0) -> str:
+        """Encode one PID data field: PID, length, data type, unit, step number, value."""
+        return f"{pid:05d}{len(value):03d}{data_type}{unit}{step:04d}{value}"
+
+    def set_trace_samples(self, num_samples: int) -> None:
+        """Set the number of samples per trace curve (bounded by 9 message parts)."""
+        max_samples = (MAX_MESSAGE_PARTS * (MAX_MESSAGE_LENGTH - 20) - 200) // 2
+        if not 1 <= num_samples <= max_samples:
+            raise ValueError(f"Trace samples must be 1-{max_samples}, got {num_samples}")
+        self.trace_num_samples = num_samples
+
+    def _get_trace_template(self, trace_type: int, pset_id) -> array:
+        """Return the cached noise-free curve (raw sample counts) for a trace type and Pset."""
+        target_torque, _, _, target_angle, _, _, _ = self._get_pset_limits(pset_id)
+        num_samples = self.trace_num_samples
+        key = (trace_type, num_samples, target_torque, target_angle)
+        template = self._trace_templates.get(key)
+        if template is None:
+            coefficient = self.TRACE_TYPES[trace_type][1]
+            last = max(num_samples - 1, 1)
+            if trace_type == 1:
+                peak = target_angle / coefficient
+                values = (peak * i / last for i in range(num_samples))
+            else:
+                # Low rundown torque for the first 60% of the curve, then a quadratic tightening ramp
+                peak = target_torque / coefficient
+                rundown = 0.05 * peak
+                values = (rundown * (i / last) / 0.6 if i / last < 0.6
+                          else rundown + (peak - rundown) * ((i / last - 0.6) / 0.4) ** 2
+                          for i in range(num_samples))
+            template = array('h', (max(-32000, min(32000, int(v))) for v in values))
+            self._trace_templates[key] = template
+        return template
+
+    def _get_trace_noise(self) -> array:
+        """Return the shared Gaussian noise table (raw counts), built on first use."""
+        if self._trace_noise is None:
+            gauss = random.gauss
+            self._trace_noise = array('h', (int(gauss(0, 8)) for _ in range(65536)))
+        return self._trace_noise
+
+    def _build_mid0900_data(self, trace_type: int, result_id: int, timestamp_str: str, pset_id) -> bytes:
+        """Build MID 0900 trace curve data: ASCII header, NUL, then big-endian 16-bit samples."""
+        unit, coefficient = self.TRACE_TYPES[trace_type]
+        template = self._get_trace_template(trace_type, pset_id)
+        num_samples = len(template)
+        noise = self._get_trace_noise()
+        offset = random.randrange(len(noise) - num_samples + 1)
+        samples = array('h', map(operator.add, template, noise[offset:offset + num_samples]))
+        if sys.byteorder == 'little':
+            samples.byteswap()
+
+        params = (self._encode_pid_field(self.TRACE_PID_TIME_INTERVAL, str(self.trace_sample_interval_ms), "01", "200")
+                  + self._encode_pid_field(self.TRACE_PID_COEFFICIENT, str(coefficient), "03", unit))
+        fields = []
+        fields.append(f"{result_id:010d}")
+        fields.append(timestamp_str)
+        fields.append(f"{0:03d}")            # Number of PID data fields
+        fields.append(f"{trace_type:02d}")
+        fields.append(f"{1:02d}")            # Transducer type
+        fields.append(unit)
+        fields.append(f"{2:03d}{params}")    # Parameter data fields
+        fields.append(f"{0:03d}")            # Number of resolution fields
+        fields.append(f"{num_samples:05d}")
+        return b"".join(("".join(fields).encode('ascii'), b"\x00", samples.tobytes()))
+
+    def _build_mid0901_data(self, result_id: int, timestamp_str: str, pset_id) -> str:
+        """Build MID 0901 trace plot parameters (Pset limit lines) for a result."""
+        target_torque, torque_min, torque_max, target_angle, angle_min, angle_max, _ = \
+            self._get_pset_limits(pset_id)
+        values = {
+            "torque_min": (f"{torque_min:.2f}", "001"),
+            "torque_max": (f"{torque_max:.2f}", "001"),
+            "torque_target": (f"{target_torque:.2f}", "001"),
+            "angle_min": (f"{angle_min}", "002"),
+            "angle_max": (f"{angle_max}", "002"),
+            "angle_target": (f"{target_angle}", "002"),
+        }
+        pid_fields = "".join(self._encode_pid_field(self.TRACE_PLOT_PIDS[name], value, "03", unit)
+                             for name, (value, unit) in values.items())
+        return f"{result_id:010d}{timestamp_str}{len(values):03d}{pid_fields}"
+
+    def _send_trace_curves(self, result_id: int, timestamp_str: str) -> None:
+        """Send subscribed MID 0901 plot parameters and MID 0900 curves for a tightening result."""
+        pset_id = self.current_pset
+        plot_sub = self.trace_subscriptions.get(901)
+        if plot_sub:
+            rev, no_ack = plot_sub
+            data = self._build_mid0901_data(result_id, timestamp_str, pset_id)
+            self.send_to_client(build_message(901, rev=rev, data=data, no_ack=no_ack))
+        curve_sub = self.trace_subscriptions.get(900)
+        if curve_sub:
+            rev, no_ack = curve_sub
+            for trace_type in self.TRACE_TYPES:
+                data = self._build_mid0900_data(trace_type, result_id, timestamp_str, pset_id)
+                for part in build_message_parts(900, rev=rev, data=data, no_ack=no_ack):
+                    self.send_to_client(part)
+            print(f"[Trace] Sent {len(self.TRACE_TYPES)} curves ({self.trace_num_samples} samples) for result {result_id:010d}")
+
     def _parse_vin(self, vin_string):
         """Parses VIN into prefix and numeric parts."""
         match = re.match(r'^(.*?)(\d+)$', vin_string)
@@ -1066,77 +3947,316 @@ class OpenProtocolEmulator:
             print("[VIN Increment] Error: Could not increment VIN numeric part.")
 
     def start_server(self):
-        """Start the TCP server to accept connections."""
-        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # Bind using the configured port
+        """Start the TCP server and accept connections (blocks; see start() for a background server)."""
         try:
-            server_sock.bind((self.host, self.port))
+            self._bind()
         except OSError as e:
              print(f"[Server Error] Failed to bind to port {self.port}: {e}")
              print("Check if another application is using the port.")
              return # Exit if cannot bind
-        server_sock.listen(1)
-        print(f"[Server] Listening on {self.host}:{self.port} with name '{self.controller_name.strip()}'...")
+        threading.Thread(target=self._profile_watch_loop, args=(self._server_stop,), daemon=True).start()
+        self._accept_loop(self.server_socket)
+
+    def _bind(self):
+        """
+        Bind and listen on TCP, or on `unix_path` if set (a stale socket file is replaced).
+        With port 0 the OS picks a free port, which is stored in self.port.
+        """
+        if self.unix_path:
+            if not hasattr(socket, "AF_UNIX"):
+                raise OSError("Unix domain sockets are not supported on this platform")
+            if os.path.exists(self.unix_path) and stat.S_ISSOCK(os.stat(self.unix_path).st_mode):
+                os.unlink(self.unix_path)
+            server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.unix_path
+        else:
+            server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            address = (self.host, self.port)
+        try:
+            server_sock.bind(address)
+            server_sock.listen(1)
+        except OSError:
+            server_sock.close()
+            raise
+        if not self.unix_path:
+            self.port = server_sock.getsockname()[1]
+        self._server_stop = threading.Event()
+        self.server_socket = server_sock
+        print(f"[Server] Listening on {self.endpoint} with name '{self.controller_name.strip()}'...")
+
+    @property
+    def endpoint(self) -> str:
+        """Where the server listens: host:port or unix:<path>."""
+        return f"unix:{self.unix_path}" if self.unix_path else f"{self.host}:{self.port}"
+
+    def start(self) -> int:
+        """
+        Start the server in the background and return the bound port (pass port=0 to let
+        the OS choose; with unix_path the port is unused). Raises OSError if it cannot
+        bind. Stop with stop(), or use the emulator as a context manager.
+        """
+        self._bind()
+        threading.Thread(target=self._profile_watch_loop, args=(self._server_stop,), daemon=True).start()
+        self._server_thread = threading.Thread(target=self._accept_loop, args=(self.server_socket,), daemon=True)
+        self._server_thread.start()
+        return self.port
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop accepting, close the client connection, wait for the server threads and flush Pset edits."""
+        self._server_stop.set()
+        self.stop_relay_stream()
+        for sock in (self.server_socket, self.client_socket):
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # Wakes a thread blocked in accept()/recv()
+            except OSError:
+                pass
+        for thread in (self._server_thread, self._client_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+        if self.server_socket is not None:
+            self.server_socket.close()
+            self.server_socket = None
+            if self.unix_path:
+                try: os.unlink(self.unix_path)
+                except OSError: pass
+        self._server_thread = self._client_thread = None
+        self.pset_writer.flush()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _accept_loop(self, server_sock: socket.socket):
         while True:
             try:
                 client_sock, addr = server_sock.accept()
             except OSError:
-                print("[Server] Error accepting connection (server socket closed?).")
+                if self._server_stop.is_set():
+                    print(f"[Server] Stopped listening on {self.endpoint}.")
+                else:
+                    print("[Server] Error accepting connection (server socket closed?).")
                 break # Exit loop if server socket has issues
+            self._admit_client(client_sock, addr or self.endpoint)
 
-            if self.session_active:
-                print(f"[Server] Rejecting connection from {addr}: already connected.")
-                error_data = self._build_mid0004_data(1, 1, 96)
-                err_msg = build_message(4, rev=1, data=error_data)
-                try: client_sock.sendall(err_msg)
-                except (OSError, BrokenPipeError): pass
-                client_sock.close()
-                continue
+    def _admit_client(self, client_sock: socket.socket, addr):
+        """Reject the connection if a session is active, otherwise reset counters and serve it."""
+        if self.session_active:
+            print(f"[Server] Rejecting connection from {addr}: already connected.")
+            error_data = self._build_mid0004_data(1, 1, 96)
+            err_msg = build_message(4, rev=1, data=error_data)
+            try: client_sock.sendall(err_msg)
+            except (OSError, BrokenPipeError): pass
+            client_sock.close()
+            return
 
-            self.tightening_id_counter = 0
-            with self.state_lock:
-                self.batch_counter = 0
-            self.tool_enabled = True
-            self.auto_send_loop_active = True
-            print(f"[Server] New client connected from {addr}, resetting counters and enabling tool/loop.")
-            threading.Thread(target=self.handle_client, args=(client_sock, addr), daemon=True).start()
+        self.tightening_id_counter = 0
+        with self.state_lock:
+            self.batch_counter = 0
+        self.tool_enabled = True
+        self.auto_send_loop_active = True
+        print(f"[Server] New client connected from {addr}, resetting counters and enabling tool/loop.")
+        self._client_thread = threading.Thread(target=self.handle_client, args=(client_sock, addr), daemon=True)
+        self._client_thread.start()
+
+    def connect_pair(self) -> socket.socket:
+        """
+        Connect a client without a listener: returns one end of a socketpair whose other end
+        is served like an accepted connection (same framing and dispatch), so a client
+        library can be driven without TCP. The caller owns and closes the returned socket.
+        """
+        client_end, server_end = socket.socketpair()
+        self._admit_client(server_end, "socketpair")
+        return client_end
 
     def send_to_client(self, msg_bytes: bytes):
-        """Thread-safe send to the client."""
+        """Thread-safe, non-blocking send to the client through the connection's outbound queue."""
+        if not self.client_socket:
+            return
+        queue = self.outbound_queue
+        if queue is None:
+            self._dispatch_frame(msg_bytes)
+        elif not queue.put(msg_bytes):
+            print(f"[Queue] Dropped MID {msg_bytes[4:8].decode('ascii', errors='ignore')}: outbound queue full.")
+
+    def send_many_to_client(self, frames: list):
+        """Queue a batch of frames with one lock acquisition on the outbound queue."""
+        if not self.client_socket:
+            return
+        queue = self.outbound_queue
+        if queue is None:
+            for frame in frames:
+                self._dispatch_frame(frame)
+            return
+        dropped = queue.put_many(frames)
+        if dropped:
+            print(f"[Queue] Dropped {dropped} of {len(frames)} batched frames: outbound queue full.")
+
+    def _outbound_writer_loop(self, queue: OutboundQueue, shaper: LinkImpairment, segmenter: FrameSegmenter):
+        """Drain one connection's outbound queue onto the socket, applying any link impairment."""
+        while True:
+            item = queue.get(segmenter.flush_timeout())
+            if item is None:
+                if queue.closed:
+                    return
+                with self.send_lock:  # Coalesce hold time is up
+                    self._flush_segments()
+                continue
+            frame, queued_at = item
+            if shaper.wait(frame, queued_at):
+                self._dispatch_frame(frame, hold=True)
+            queue.task_done()
+
+    def _dispatch_frame(self, msg_bytes: bytes, hold: bool = False):
+        """Write a frame. Events that need an ack are tracked (and held if configured)."""
+        event_mid = EventAckTracker.EVENT_MIDS.get(msg_bytes[4:8])
+        if event_mid is not None and msg_bytes[11:12] == b"0":
+            for frame in self.ack_tracker.submit(event_mid, msg_bytes):
+                self._transmit(frame, hold)
+        else:
+            self._transmit(msg_bytes, hold)
+
+    def _transmit(self, msg_bytes: bytes, hold: bool = False):
+        """Send a frame, sequenced and windowed when link-level acks are active."""
         if self.client_socket:
             with self.send_lock:
-                try:
-                    self.client_socket.sendall(msg_bytes)
-                    log_msg = msg_bytes.decode('ascii', errors='ignore').replace('\x00', '')
-                    mid = log_msg[4:8]
-                    data = log_msg[20:]
-                    print(f"[Send] MID {mid} ({len(msg_bytes)} bytes): {data[:60]}...")
-                    if hasattr(self, '_gui_log_message'):
-                        self._gui_log_message("send", mid, len(msg_bytes), data)
-                except (OSError, BrokenPipeError, ConnectionResetError) as e:
-                    print(f"[Send Error] Connection issue: {e}")
-                    try: self.client_socket.close()
-                    except OSError: pass
-                    self.client_socket = None
-                    self.session_active = False
-                except Exception as e:
-                    print(f"[Send Error] Unexpected error: {e}")
-                    try: self.client_socket.close()
-                    except OSError: pass
-                    self.client_socket = None
-                    self.session_active = False
+                link = self.link_session
+                if link is not None and msg_bytes[4:8] not in LINK_LEVEL_MIDS:
+                    frames = link.submit(msg_bytes)
+                else:
+                    frames = (msg_bytes,)
+                for frame in frames:
+                    if not self._write_frame(frame, hold):
+                        break
+
+    def _flush_segments(self) -> bool:
+        """Write frames held back by coalesce mode. Caller holds send_lock."""
+        segmenter = self.frame_segmenter
+        if not self.client_socket or segmenter is None:
+            return False
+        try:
+            segmenter.flush(self.client_socket)
+            return True
+        except OSError as e:
+            print(f"[Send Error] Connection issue: {e}")
+        try: self.client_socket.close()
+        except OSError: pass
+        self.client_socket = None
+        self.session_active = False
+        return False
+
+    def _write_frame(self, msg_bytes: bytes, hold: bool = False) -> bool:
+        """
+        Write one frame to the client socket through the connection's segmenter.
+        Only the writer thread passes hold=True (it flushes coalesced frames later).
+        Caller holds send_lock.
+        """
+        if not self.client_socket:
+            return False
+        try:
+            segmenter = self.frame_segmenter
+            if segmenter is None:
+                self.client_socket.sendall(msg_bytes)
+            else:
+                segmenter.write(self.client_socket, msg_bytes, hold)
+            log_msg = msg_bytes.decode('ascii', errors='ignore').replace('\x00', '')
+            mid = log_msg[4:8]
+            data = log_msg[20:]
+            print(f"[Send] MID {mid} ({len(msg_bytes)} bytes): {data[:60]}...")
+            if hasattr(self, '_gui_log_message'):
+                self._gui_log_message("send", mid, len(msg_bytes), data)
+            return True
+        except (OSError, BrokenPipeError, ConnectionResetError) as e:
+            print(f"[Send Error] Connection issue: {e}")
+        except Exception as e:
+            print(f"[Send Error] Unexpected error: {e}")
+        try: self.client_socket.close()
+        except OSError: pass
+        self.client_socket = None
+        self.session_active = False
+        return False
+
+    def _end_link_session(self):
+        """Stop link-level acknowledgement and keep its final counters."""
+        link = self.link_session
+        if link is None:
+            return
+        self.link_session = None
+        self.last_link_stats = link.stats()
+        st = self.last_link_stats
+        print(f"[Link] Session stats: {st['frames_sent']} sent, {st['frames_acked']} acked "
+              f"({st['acked_per_second']:.1f}/s), {st['retransmits']} retransmits, "
+              f"ack RTT avg {st['ack_rtt_avg_ms']:.1f} ms / max {st['ack_rtt_max_ms']:.1f} ms")
+
+    def _print_outbound_stats(self, stats: dict):
+        for key, st in stats.items():
+            if st["dropped"] or st["coalesced"] or st["block_timeouts"]:
+                name = key if isinstance(key, str) else f"MID {key:04d}"
+                print(f"[Queue] {name}: {st['sent']} sent, {st['dropped']} dropped, {st['coalesced']} coalesced, "
+                      f"{st['block_timeouts']} block timeouts, max depth {st['max_depth']}")
+
+    def _print_queue_delays(self, delays: dict):
+        for name, st in delays.items():
+            if st["sent"]:
+                print(f"[Queue] {name} class: {st['sent']} sent, queueing delay avg {st['avg_ms']:.2f} ms, "
+                      f"max {st['max_ms']:.2f} ms")
+
+    def _end_ack_tracking(self):
+        """Keep and print the session's application-level ack statistics."""
+        if not self._ack_tracking_open:
+            return
+        self._ack_tracking_open = False
+        self.last_ack_stats = self.ack_tracker.stats()
+        self._print_ack_stats(self.last_ack_stats)
+
+    def _reap_connection(self, sock: socket.socket, addr, idle: float):
+        """Drop a connection that exceeded the link timeout; handle_client then cleans up."""
+        self.reaped_connections += 1
+        print(f"[Session] No message from {addr} for {idle:.1f}s (link timeout {self.link_timeout:g}s). Closing connection.")
+        try: sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
 
     def handle_client(self, sock: socket.socket, addr):
         """Handle messages from a connected client."""
         self.client_socket = sock
         print(f"[Client] Connection established with {addr}")
+        if self.send_timeout > 0:
+            sock.settimeout(self.send_timeout)
+        queue = OutboundQueue(self.outbound_policies, self.outbound_block_timeout)
+        self.outbound_queue = queue
+        shaper = LinkImpairment(self.impairment)
+        self.link_impairment = shaper
+        if shaper.active:
+            print(f"[Impair] Shaping connection from {addr}: {self.impairment}")
+        segmenter = FrameSegmenter(self.segmentation)
+        self.frame_segmenter = segmenter
+        if segmenter.mode != "whole":
+            try: sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError: pass  # Unix domain socket or socketpair
+            print(f"[Segment] Transmit mode for {addr}: {self.segmentation}")
+        threading.Thread(target=self._outbound_writer_loop, args=(queue, shaper, segmenter), daemon=True).start()
+        watch_key = None
+        if self.link_timeout > 0:
+            watch_key = LINK_WATCHDOG.watch(self.link_timeout, lambda idle: self._reap_connection(sock, addr, idle))
+        observer = ClientObserver(sock)
+        self.client_observer = observer
+        sample_key = None
+        if self.client_sample_interval > 0:
+            sample_key = CLIENT_SAMPLER.register(observer, self.client_sample_interval, self._state_changed)
         buffer = b""
         while True:
             try: data = sock.recv(1024)
+            except socket.timeout: continue
             except (ConnectionResetError, OSError) as e: print(f"[Recv Error] Connection issue: {e}"); break
             except Exception as e: print(f"[Recv Error] Unexpected error: {e}"); break
             if not data: print("[Client] Connection closed by peer."); break
+            if watch_key is not None:
+                LINK_WATCHDOG.touch(watch_key)
             buffer += data
             while True:
                 if len(buffer) < 4: break
@@ -1154,6 +4274,30 @@ class OpenProtocolEmulator:
                 buffer = buffer[length+1:]
                 self.process_message(full_msg)
 
+        if watch_key is not None:
+            LINK_WATCHDOG.unwatch(watch_key)
+        if sample_key is not None:
+            CLIENT_SAMPLER.unregister(sample_key)
+        if self.client_observer is observer:
+            self.last_client_stats = self.get_client_stats()
+            self.client_observer = None
+            self._print_client_stats(self.last_client_stats)
+        shaper.close()
+        if shaper.frames_delayed:
+            print(f"[Impair] Delayed {shaper.frames_delayed} frames by {shaper.added_delay:.2f}s in total.")
+        queue.close()
+        if self.outbound_queue is queue:
+            self.outbound_queue = None
+            self.last_outbound_stats = queue.stats()
+            self.last_queue_delays = queue.delay_stats()
+            self._print_outbound_stats(self.last_outbound_stats)
+            self._print_queue_delays(self.last_queue_delays)
+        if self.client_socket is not sock and self.client_socket is not None:
+            # A newer connection owns the session state; only release this socket.
+            print(f"[Client] Closing stale connection from {addr}.")
+            try: sock.close()
+            except OSError: pass
+            return
         print(f"[Client] Cleaning up connection from {addr}.")
         self.session_active = False
         self.vin_subscribed = False; self.result_subscribed = False; self.pset_subscribed = False
@@ -1163,9 +4307,13 @@ class OpenProtocolEmulator:
         self.vin_subscribed_rev = 1
         self.result_subscribed_rev = 1
         self.relay_subscriptions = {}
+        self.trace_subscriptions = {}
+        self._end_link_session()
+        self._end_ack_tracking()
         try: sock.close()
         except OSError: pass
         self.client_socket = None
+        self._state_changed()
 
     def process_message(self, msg: bytes):
         """Parse and dispatch an Open Protocol message."""
@@ -1182,10 +4330,16 @@ class OpenProtocolEmulator:
             print(f"[Error] Parse error: {e}, Message: {msg}")
             return
 
+        link = self.link_session
+        if link is not None and msg[4:8] not in LINK_LEVEL_MIDS:
+            if not self._accept_link_sequence(link, mid_int, msg):
+                return
+
         # --- MID Dispatch via Registry ---
         handler = self.mid_handlers.get(mid_int)
         if handler:
             handler(mid_int, rev, no_ack_flag, data_field, msg)
+            self._state_changed()
         else:
             error_data = self._build_mid0004_data(1, mid_int, 99)
             resp = build_message(4, rev=1, data=error_data)
@@ -1193,57 +4347,30 @@ class OpenProtocolEmulator:
             print(f"[Unknown] Received unsupported MID {mid}. Sent error.")
 
 
-    def send_single_tightening_result(self):
-        """Generate and send a single simulated MID 0061 tightening result."""
+    def send_single_tightening_result(self, force_nok: bool = None) -> bool:
+        """
+        Generate and send a single simulated MID 0061 tightening result (force_nok overrides
+        the NOK probability). Returns False if the tool is disabled or nobody is subscribed.
+        """
         if not self.tool_enabled:
             print("[Tightening] Send prevented: Tool is disabled (MID 0042/0040).")
-            return
+            return False
         if not self.session_active or not self.result_subscribed:
             print("[Tightening] Send prevented: Session inactive or not subscribed.")
-            return
+            return False
 
         self.tightening_id_counter = (self.tightening_id_counter + 1) % 10000000000
 
-        tighten_time = datetime.datetime.now()
-        timestamp_str = tighten_time.strftime("%Y-%m-%d:%H:%M:%S")
-        pset_change_ts = (self.pset_last_change.strftime("%Y-%m-%d:%H:%M:%S")
-                          if self.pset_last_change else timestamp_str)
-
-        current_pset_params = self.pset_parameters.get(self.current_pset)
-
-        if current_pset_params:
-            target_torque = current_pset_params["target_torque"]
-            torque_min = current_pset_params["torque_min"]
-            torque_max = current_pset_params["torque_max"]
-            target_angle = current_pset_params["target_angle"]
-            angle_min = current_pset_params["angle_min"]
-            angle_max = current_pset_params["angle_max"]
-            current_target_batch_size = current_pset_params["batch_size"]
-            print(f"[Tightening] Using parameters from Pset {self.current_pset}")
-        else:
-            target_torque = 50.00
-            torque_min = 47.00
-            torque_max = 53.00
-            target_angle = 90
-            angle_min = 80
-            angle_max = 100
-            current_target_batch_size = self.target_batch_size
-            print("[Tightening] Using global default parameters.")
-
-        is_nok = random.random() < self.nok_probability
+        pset_id = (self.current_pset if self.current_pset else "0").rjust(3, '0')
+        limits = self._get_pset_limits(self.current_pset)
+        current_target_batch_size = limits[6]
+        template = self._get_result_template(limits)
+        outcome, is_nok, actual_torque, actual_angle = self.result_pipeline.take(force_nok)
         status = "0" if is_nok else "1"
-        torque_status = "1"
-        angle_status = "1"
-        actual_torque = random.uniform(torque_min, torque_max)
-        actual_angle = random.uniform(angle_min, angle_max)
 
-        if is_nok:
-            if random.choice(["torque", "angle"]) == "torque":
-                torque_status = random.choice(["0", "2"])
-                actual_torque = random.uniform(torque_min - 5, torque_min - 0.1) if torque_status == "0" else random.uniform(torque_max + 0.1, torque_max + 5)
-            else:
-                angle_status = random.choice(["0", "2"])
-                actual_angle = random.uniform(angle_min - 20, angle_min - 1) if angle_status == "0" else random.uniform(angle_max + 1, angle_max + 20)
+        timestamp_str = self.clock.timestamp()
+        pset_change_ts = (self.pset_last_change.strftime("%Y-%m-%d:%H:%M:%S")
+                          if self.pset_last_change else timestamp_str)
 
         with self.state_lock:
             self.tool_number_of_tightenings += 1
@@ -1266,39 +4393,16 @@ class OpenProtocolEmulator:
                 batch_status = "1"
                 batch_completed = True
 
-        result_params = {
-            'cell_id': 1,
-            'channel_id': 1,
-            'controller_name': self.controller_name,
-            'vin': self.current_vin.ljust(25)[:25],
-            'job_id': 0,
-            'pset_id': (self.current_pset if self.current_pset else "0").rjust(3, '0'),
-            'batch_size': current_target_batch_size,
-            'batch_counter': batch_counter_val,
-            'status': status,
-            'torque_status': torque_status,
-            'angle_status': angle_status,
-            'torque_min': int(torque_min * 100),
-            'torque_max': int(torque_max * 100),
-            'torque_target': int(target_torque * 100),
-            'torque_final': int(actual_torque * 100),
-            'angle_min': int(angle_min),
-            'angle_max': int(angle_max),
-            'angle_target': int(target_angle),
-            'angle_final': int(actual_angle),
-            'timestamp': timestamp_str,
-            'pset_change_time': pset_change_ts,
-            'batch_status': batch_status,
-            'tightening_id': self.tightening_id_counter,
-        }
-
-        data = self._build_mid0061_data(self.result_subscribed_rev, result_params)
-        result_msg = build_message(61, rev=self.result_subscribed_rev, data=data, no_ack=self.result_no_ack)
+        vin = self.current_vin
+        result_msg = self._encode_result_frame(template, outcome, vin, batch_counter_val, timestamp_str,
+                                               pset_change_ts, batch_status, self.tightening_id_counter)
         self.send_to_client(result_msg)
         print(f"[Tightening] Sent result (MID 0061 rev {self.result_subscribed_rev}, ID: {self.tightening_id_counter:010d}). Status: {'OK' if status == '1' else 'NOK'}, Batch: {batch_counter_val}/{current_target_batch_size}")
 
-        if hasattr(self, '_gui_update_last_result'):
-            self._gui_update_last_result(status, actual_torque, actual_angle, self.tightening_id_counter)
+        if self.trace_subscriptions:
+            self._send_trace_curves(self.tightening_id_counter, timestamp_str)
+
+        self.last_result = (status, actual_torque, actual_angle, self.tightening_id_counter)
 
         if batch_completed:
             print("[Batch] Batch complete!")
@@ -1307,38 +4411,184 @@ class OpenProtocolEmulator:
                 self.batch_counter = 0
             print("[Batch] VIN incremented and counter reset.")
 
-    def send_multi_spindle_result(self):
-        """Generate and send a simulated MID 0101 multi-spindle result (supports Rev 1-5)."""
-        if not self.tool_enabled:
-            print("[MultiSpindle] Send prevented: Tool is disabled.")
-            return
-        if not self.session_active or not self.multi_spindle_subscribed:
-            print("[MultiSpindle] Send prevented: Session inactive or not subscribed.")
-            return
-
-        self.sync_tightening_id = (self.sync_tightening_id + 1) % 65536
-        timestamp_str = datetime.datetime.now().strftime("%Y-%m-%d:%H:%M:%S")
-        revision = self.multi_spindle_requested_rev
-
-        current_pset_params = self.pset_parameters.get(self.current_pset)
-        if current_pset_params:
-            target_torque = current_pset_params["target_torque"]
-            torque_min = current_pset_params["torque_min"]
-            torque_max = current_pset_params["torque_max"]
-            target_angle = current_pset_params["target_angle"]
-            angle_min = current_pset_params["angle_min"]
-            angle_max = current_pset_params["angle_max"]
-            batch_size = current_pset_params["batch_size"]
-        else:
-            target_torque, torque_min, torque_max = 50.00, 47.00, 53.00
-            target_angle, angle_min, angle_max = 90, 80, 100
-            batch_size = self.target_batch_size
+        if self.state_store is not None:
+            self.state_store.add_result(self.controller_name.strip(), self.tightening_id_counter, timestamp_str,
+                                        pset_id, vin.strip(),
+                                        int(status), round(actual_torque, 2), round(actual_angle, 1), batch_counter_val)
+            self._persist_state()
+        self._state_changed()
+        return True
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Apply the GUI's global settings: "vin", "batch_size", "nok_probability" (0-1),
+        "auto_loop_interval" (s), "auto_loop" (bool), "spindles". All values are checked
+        before any is applied; raises ValueError for an unknown key or bad value.
+        """
+        unknown = set(settings) - {"vin", "batch_size", "nok_probability", "auto_loop_interval", "auto_loop", "spindles"}
+        if unknown:
+            raise ValueError(f"Unknown setting(s): {', '.join(sorted(unknown))}")
+        if "vin" in settings and not self._parse_vin(str(settings["vin"])):
+            raise ValueError(f"Invalid VIN format: {settings['vin']}")
+        if int(settings.get("batch_size", 0)) < 0:
+            raise ValueError("Batch size must be >= 0")
+        if not 0 <= float(settings.get("nok_probability", 0)) <= 1:
+            raise ValueError("NOK probability must be 0-1")
+        if int(settings.get("auto_loop_interval", 1)) <= 0:
+            raise ValueError("Auto loop interval must be > 0")
+        if not 1 <= int(settings.get("spindles", 1)) <= MAX_SPINDLES:
+            raise ValueError(f"Spindle count must be 1-{MAX_SPINDLES}")
+        if "vin" in settings and settings["vin"] != self.current_vin:
+            self.set_vin(str(settings["vin"]))
+        if "batch_size" in settings:
+            self.target_batch_size = int(settings["batch_size"])
+        if "nok_probability" in settings:
+            self.nok_probability = float(settings["nok_probability"])
+        if "auto_loop_interval" in settings:
+            self.auto_loop_interval = int(settings["auto_loop_interval"])
+        if "auto_loop" in settings:
+            self.auto_send_loop_active = bool(settings["auto_loop"])
+        if "spindles" in settings:
+            self.set_num_spindles(int(settings["spindles"]))
+        print(f"[Settings] Applied {', '.join(sorted(settings))}.")
+        self._state_changed()
+
+    def get_status(self) -> dict:
+        """Snapshot of the controller state shown in the GUI status panel, as plain JSON types."""
+        last_result = self.last_result
+        return {
+            "controller_name": self.controller_name.strip(),
+            "port": self.port,
+            "session_active": self.session_active,
+            "tool_enabled": self.tool_enabled,
+            "profile": self.current_profile,
+            "pset": self.current_pset,
+            "vin": self.current_vin,
+            "batch_counter": self.batch_counter,
+            "batch_size": self.target_batch_size,
+            "nok_probability": self.nok_probability,
+            "auto_loop": self.auto_send_loop_active,
+            "auto_loop_interval": self.auto_loop_interval,
+            "spindles": self.num_spindles,
+            "tightening_id": self.tightening_id_counter,
+            "last_result": None if last_result is None else {
+                "status": "OK" if last_result[0] == "1" else "NOK",
+                "torque": round(last_result[1], 2), "angle": round(last_result[2], 1)},
+            "errors": {"command_errors": self.command_errors,
+                       "missing_acks": sum(st["missing"] for st in (self.get_ack_stats() or {}).values()),
+                       "dropped_frames": sum(st["dropped"] for st in (self.get_outbound_stats() or {}).values())},
+            "subscriptions": {"vin": self.vin_subscribed, "pset": self.pset_subscribed,
+                              "result": self.result_subscribed, "multi_spindle": self.multi_spindle_subscribed,
+                              "relays": sorted(self.relay_subscriptions)},
+            "client": self.get_client_stats(),
+        }
 
+    def set_num_spindles(self, count: int) -> None:
+        """Set the number of spindles reported in MID 0101 (1-99)."""
+        if not 1 <= count <= MAX_SPINDLES:
+            raise ValueError(f"Spindle count must be 1-{MAX_SPINDLES}, got {count}")
+        with self.state_lock:
+            self.num_spindles = count
+            self.spindle_psets = {n: p for n, p in self.spindle_psets.items() if n <= count}
+        print(f"[MultiSpindle] Spindle count set to {count}.")
+
+    def set_spindle_pset(self, spindle_num: int, pset_id) -> None:
+        """Assign a Pset whose limits apply to one spindle (None restores the current Pset)."""
+        if not 1 <= spindle_num <= MAX_SPINDLES:
+            raise ValueError(f"Spindle number must be 1-{MAX_SPINDLES}, got {spindle_num}")
+        with self.state_lock:
+            if pset_id is None:
+                self.spindle_psets.pop(spindle_num, None)
+                return
+            if pset_id not in self.pset_parameters:
+                raise ValueError(f"Unknown Pset: {pset_id}")
+            self.spindle_psets[spindle_num] = pset_id
+
+    def _get_pset_limits(self, pset_id) -> tuple:
+        """Return (target_torque, torque_min, torque_max, target_angle, angle_min, angle_max, batch_size)."""
+        limits = self.pset_parameters.limits(pset_id)
+        if limits is not None:
+            return limits
+        return (50.00, 47.00, 53.00, 90, 80, 100, self.target_batch_size)
+
+    def _get_spindle_layout(self, num_spindles: int) -> list:
+        """Return the cached spindle/channel number prefixes for a spindle count."""
+        layout = self._spindle_layouts.get(num_spindles)
+        if layout is None:
+            layout = [f"{n:02d}{n:02d}" for n in range(1, num_spindles + 1)]
+            self._spindle_layouts[num_spindles] = layout
+        return layout
+
+    def _get_spindle_limits(self, num_spindles: int) -> list:
+        """Return per-spindle (torque_min, torque_max, angle_min, angle_max) limits."""
+        default = self._get_pset_limits(self.current_pset)
+        default_limits = (default[1], default[2], default[4], default[5])
+        if not self.spindle_psets:
+            return [default_limits] * num_spindles
+        by_pset = {}
+        limits = [default_limits] * num_spindles
+        for spindle_num, pset_id in self.spindle_psets.items():
+            if spindle_num > num_spindles:
+                continue
+            if pset_id not in by_pset:
+                p = self._get_pset_limits(pset_id)
+                by_pset[pset_id] = (p[1], p[2], p[4], p[5])
+            limits[spindle_num - 1] = by_pset[pset_id]
+        return limits
+
+    def _encode_spindle_results(self, limits: list, nok_probability: float) -> tuple:
+        """Draw and encode MID 0101 field 18 for all spindles. Returns (spindle_data, all_ok).
+
+        Random samples are generated in one batch of three per spindle. A NOK draw is
+        uniform on [0, nok_probability), so it is rescaled to pick the failing quantity
+        and side without extra draws.
+        """
+        num_spindles = len(limits)
+        layout = self._get_spindle_layout(num_spindles)
+        rnd = random.random
+        draws = [rnd() for _ in range(3 * num_spindles)]
+        chunks = [None] * num_spindles
+        all_ok = True
+        for i, (torque_min, torque_max, angle_min, angle_max) in enumerate(limits):
+            u_nok = draws[3 * i]
+            u_torque = draws[3 * i + 1]
+            u_angle = draws[3 * i + 2]
+            status = torque_status = angle_status = "1"
+            if u_nok < nok_probability:
+                status = "0"
+                all_ok = False
+                v = u_nok / nok_probability
+                if v < 0.25:
+                    torque_status = "0"
+                    actual_torque = torque_min - 5 + 4.9 * u_torque
+                    actual_angle = angle_min + (angle_max - angle_min) * u_angle
+                elif v < 0.5:
+                    torque_status = "2"
+                    actual_torque = torque_max + 0.1 + 4.9 * u_torque
+                    actual_angle = angle_min + (angle_max - angle_min) * u_angle
+                elif v < 0.75:
+                    angle_status = "0"
+                    actual_torque = torque_min + (torque_max - torque_min) * u_torque
+                    actual_angle = angle_min - 20 + 19 * u_angle
+                else:
+                    angle_status = "2"
+                    actual_torque = torque_min + (torque_max - torque_min) * u_torque
+                    actual_angle = angle_max + 1 + 19 * u_angle
+            else:
+                actual_torque = torque_min + (torque_max - torque_min) * u_torque
+                actual_angle = angle_min + (angle_max - angle_min) * u_angle
+            chunks[i] = f"{layout[i]}{status}{torque_status}{int(actual_torque * 100):06d}{angle_status}{int(actual_angle):05d}"
+        return "".join(chunks), all_ok
+
+    def _build_mid0101_data(self, revision: int, num_spindles: int, sync_id: int, timestamp_str: str) -> tuple:
+        """Build MID 0101 multi-spindle result data for given revision (1-5). Returns (data, all_ok)."""
+        target_torque, torque_min, torque_max, target_angle, angle_min, angle_max, batch_size = \
+            self._get_pset_limits(self.current_pset)
         pset_change_ts = (self.pset_last_change.strftime("%Y-%m-%d:%H:%M:%S")
                           if self.pset_last_change else timestamp_str)
 
         fields = []
-        fields.append(f"01{self.num_spindles:02d}")
+        fields.append(f"01{num_spindles:02d}")
         fields.append(f"02{self.current_vin.ljust(25)[:25]}")
         fields.append(f"03{0:02d}")
         fields.append(f"04{(self.current_pset if self.current_pset else '0').rjust(3, '0')}")
@@ -1353,45 +4603,11 @@ class OpenProtocolEmulator:
         fields.append(f"13{int(target_angle):05d}")
         fields.append(f"14{pset_change_ts}")
         fields.append(f"15{timestamp_str}")
-        fields.append(f"16{self.sync_tightening_id:05d}")
-
-        spindle_results = []
-        all_ok = True
-        for spindle_num in range(1, self.num_spindles + 1):
-            is_nok = random.random() < self.nok_probability
-            status = "0" if is_nok else "1"
-            if is_nok:
-                all_ok = False
+        fields.append(f"16{sync_id:05d}")
 
-            torque_status = "1"
-            angle_status = "1"
-            actual_torque = random.uniform(torque_min, torque_max)
-            actual_angle = random.uniform(angle_min, angle_max)
-
-            if is_nok:
-                if random.choice(["torque", "angle"]) == "torque":
-                    torque_status = random.choice(["0", "2"])
-                    actual_torque = random.uniform(torque_min - 5, torque_min - 0.1) if torque_status == "0" else random.uniform(torque_max + 0.1, torque_max + 5)
-                else:
-                    angle_status = random.choice(["0", "2"])
-                    actual_angle = random.uniform(angle_min - 20, angle_min - 1) if angle_status == "0" else random.uniform(angle_max + 1, angle_max + 20)
-
-            spindle_results.append({
-                "num": spindle_num,
-                "channel": spindle_num,
-                "status": status,
-                "torque_status": torque_status,
-                "angle_status": angle_status,
-                "torque": int(actual_torque * 100),
-                "angle": int(actual_angle)
-            })
-
-        overall_status = "1" if all_ok else "0"
-        fields.append(f"17{overall_status}")
-
-        spindle_data = ""
-        for s in spindle_results:
-            spindle_data += f"{s['num']:02d}{s['channel']:02d}{s['status']}{s['torque_status']}{s['torque']:06d}{s['angle_status']}{s['angle']:05d}"
+        spindle_data, all_ok = self._encode_spindle_results(
+            self._get_spindle_limits(num_spindles), self.nok_probability)
+        fields.append(f"17{'1' if all_ok else '0'}")
         fields.append(f"18{spindle_data}")
 
         if revision >= 4:
@@ -1400,33 +4616,163 @@ class OpenProtocolEmulator:
         if revision >= 5:
             fields.append(f"20{0:05d}")
 
-        data = "".join(fields)
+        return "".join(fields), all_ok
+
+    def send_multi_spindle_result(self) -> bool:
+        """
+        Generate and send a simulated MID 0101 multi-spindle result (supports Rev 1-5).
+        Returns False if the tool is disabled or nobody is subscribed.
+        """
+        if not self.tool_enabled:
+            print("[MultiSpindle] Send prevented: Tool is disabled.")
+            return False
+        if not self.session_active or not self.multi_spindle_subscribed:
+            print("[MultiSpindle] Send prevented: Session inactive or not subscribed.")
+            return False
+
+        with self.state_lock:
+            self.sync_tightening_id = (self.sync_tightening_id + 1) % 65536
+            sync_id = self.sync_tightening_id
+            num_spindles = self.num_spindles
+        timestamp_str = self.clock.timestamp()
+        revision = self.multi_spindle_requested_rev
+
+        data, all_ok = self._build_mid0101_data(revision, num_spindles, sync_id, timestamp_str)
         result_msg = build_message(101, rev=revision, data=data, no_ack=self.multi_spindle_no_ack)
         self.send_to_client(result_msg)
-        print(f"[MultiSpindle] Sent result (MID 0101 rev {revision}, SyncID: {self.sync_tightening_id:05d}). Status: {'OK' if all_ok else 'NOK'}, Spindles: {self.num_spindles}")
+        print(f"[MultiSpindle] Sent result (MID 0101 rev {revision}, SyncID: {sync_id:05d}). Status: {'OK' if all_ok else 'NOK'}, Spindles: {num_spindles}")
+        return True
+
+    def benchmark_multi_spindle(self, spindle_counts=(2, 8, 32, 64), iterations: int = 2000) -> dict:
+        """Measure MID 0101 encoding throughput (results/s) per spindle count without sending."""
+        revision = self.revision_config.get(101, 1)
+        timestamp_str = self.clock.timestamp()
+        results = {}
+        for count in spindle_counts:
+            if not 1 <= count <= MAX_SPINDLES:
+                raise ValueError(f"Spindle count must be 1-{MAX_SPINDLES}, got {count}")
+            start = time.perf_counter()
+            for i in range(iterations):
+                data, _ = self._build_mid0101_data(revision, count, i % 65536, timestamp_str)
+                build_message(101, rev=revision, data=data)
+            elapsed = time.perf_counter() - start
+            rate = iterations / elapsed if elapsed > 0 else float("inf")
+            results[count] = rate
+            print(f"[Benchmark] MID 0101 rev {revision}, {count:2d} spindles: {rate:10.0f} results/s "
+                  f"({rate * count:12.0f} spindle results/s, {len(data) + 21} bytes/frame)")
+        return results
+
+    def benchmark_trace_curves(self, iterations: int = 2000) -> dict:
+        """Compare MID 0900 curve encoding throughput against MID 0061 result encoding."""
+        timestamp_str = self.clock.timestamp()
+        result_params = {
+            'cell_id': 1, 'channel_id': 1, 'controller_name': self.controller_name,
+            'vin': self.current_vin.ljust(25)[:25], 'job_id': 0, 'pset_id': "001",
+            'batch_size': 5, 'batch_counter': 1, 'status': "1", 'torque_status': "1",
+            'angle_status': "1", 'torque_min': 4700, 'torque_max': 5300, 'torque_target': 5000,
+            'torque_final': 5012, 'angle_min': 80, 'angle_max': 100, 'angle_target': 90,
+            'angle_final': 91, 'timestamp': timestamp_str, 'pset_change_time': timestamp_str,
+            'batch_status': "0", 'tightening_id': 1,
+        }
+        start = time.perf_counter()
+        for _ in range(iterations):
+            build_message(61, rev=7, data=self._build_mid0061_data(7, result_params))
+        scalar_rate = iterations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(iterations):
+            for trace_type in self.TRACE_TYPES:
+                parts = build_message_parts(900, data=self._build_mid0900_data(trace_type, i, timestamp_str, self.current_pset))
+        curve_rate = iterations / (time.perf_counter() - start)
+
+        frame_bytes = sum(len(p) for p in parts)
+        print(f"[Benchmark] MID 0061: {scalar_rate:10.0f} results/s")
+        print(f"[Benchmark] MID 0900: {curve_rate:10.0f} results/s ({len(self.TRACE_TYPES)} curves x "
+              f"{self.trace_num_samples} samples, {frame_bytes} bytes/curve, {scalar_rate / curve_rate:.1f}x slower)")
+        return {"scalar": scalar_rate, "curve": curve_rate}
+
+    def benchmark_result_latency(self, iterations: int = 20000) -> dict:
+        """
+        Compare per-result MID 0061 encoding latency (p50/p99/max, microseconds) of the
+        inline builder against the pre-encoded result pipeline, without sending.
+        """
+        limits = self._get_pset_limits(self.current_pset)
+        timestamp_str = self.clock.timestamp()
+        vin = self.current_vin
+        revision = self.result_subscribed_rev
+
+        def inline(i):
+            status, torque_status, angle_status, torque, angle = ResultPipeline.draw(limits, self.nok_probability)
+            result_params = {
+                'cell_id': 1, 'channel_id': 1, 'controller_name': self.controller_name,
+                'vin': vin.ljust(25)[:25], 'job_id': 0, 'pset_id': "001", 'batch_size': limits[6],
+                'batch_counter': 1, 'status': status, 'torque_status': torque_status,
+                'angle_status': angle_status, 'torque_min': int(limits[1] * 100),
+                'torque_max': int(limits[2] * 100), 'torque_target': int(limits[0] * 100),
+                'torque_final': int(torque * 100), 'angle_min': int(limits[4]), 'angle_max': int(limits[5]),
+                'angle_target': int(limits[3]), 'angle_final': int(angle), 'timestamp': timestamp_str,
+                'pset_change_time': timestamp_str, 'batch_status': "0", 'tightening_id': i,
+            }
+            return build_message(61, rev=revision, data=self._build_mid0061_data(revision, result_params))
+
+        def pipelined(i):
+            template = self._get_result_template(limits)
+            outcome = self.result_pipeline.take()[0]
+            return self._encode_result_frame(template, outcome, vin, 1, timestamp_str, timestamp_str, "0", i)
+
+        results = {}
+        for name, encode in (("inline", inline), ("pipeline", pipelined)):
+            samples = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                encode(i)
+                samples.append(time.perf_counter() - start)
+                if i % 64 == 0:
+                    time.sleep(0)  # Let the producer thread run, as between real triggers
+            samples.sort()
+            results[name] = {"p50": samples[len(samples) // 2] * 1e6, "p99": samples[int(len(samples) * 0.99)] * 1e6,
+                             "max": samples[-1] * 1e6}
+            print(f"[Benchmark] MID 0061 rev {revision} {name:8s}: p50 {results[name]['p50']:6.1f} us, "
+                  f"p99 {results[name]['p99']:6.1f} us, max {results[name]['max']:8.1f} us")
+        print(f"[Benchmark] Pipeline: {self.result_pipeline.produced} outcomes produced ahead, "
+              f"{self.result_pipeline.misses} drawn inline")
+        return results
+
+    def _session_is_current(self, generation) -> bool:
+        """True while the session that started a background loop is still the active one."""
+        with self.state_lock:
+            return self._session_active and (generation is None or generation == self.session_generation)
 
-    def send_tightening_results_loop(self):
-        """Periodically send a simulated MID 0061 tightening result."""
-        while self.session_active:
+    def send_tightening_results_loop(self, generation=None):
+        """Periodically send simulated MID 0061 (and MID 0101 when subscribed) results."""
+        while self._session_is_current(generation):
             # Use the configurable interval
             for _ in range(self.auto_loop_interval):
-                if not self.session_active: print("[Auto Loop] Session ended."); return
-                time.sleep(1)
+                if not self._session_is_current(generation): print("[Auto Loop] Session ended."); return
+                self.clock.sleep(1)
 
             # Check if loop is active AND tool is enabled by protocol
             if self.session_active and self.result_subscribed and self.auto_send_loop_active:
                  # The check for self.tool_enabled is now inside send_single_tightening_result
                  self.send_single_tightening_result()
             elif not self.session_active: print("[Auto Loop] Session ended during wait."); return
+            if self.session_active and self.multi_spindle_subscribed and self.auto_send_loop_active:
+                self.send_multi_spindle_result()
 
 
-    def start_gui(self):
-        """Start CustomTkinter GUI with tabbed configuration and persistent status/log panels."""
-        ctk.set_appearance_mode("dark")
-        ctk.set_default_color_theme("blue")
+    def start_gui(self, master=None):
+        """
+        Start CustomTkinter GUI with tabbed configuration and persistent status/log panels.
+        With `master` (the fleet dashboard's root) the view opens as a child window and the
+        window is returned instead of running a main loop.
+        """
+        _require_gui()
+        if master is None:
+            ctk.set_appearance_mode("dark")
+            ctk.set_default_color_theme("blue")
 
         window_title = f"{self.controller_name.strip()} (Port: {self.port})"
-        root = ctk.CTk()
+        root = ctk.CTk() if master is None else ctk.CTkToplevel(master)
         root.title(window_title)
         root.geometry("1200x800")
         root.minsize(1000, 700)
@@ -1451,6 +4797,7 @@ class OpenProtocolEmulator:
         batch_size_var = tk.StringVar(value=str(self.target_batch_size))
         nok_prob_var = tk.StringVar(value=str(int(self.nok_probability * 100)))
         auto_loop_interval_var = tk.StringVar(value=str(self.auto_loop_interval))
+        num_spindles_var = tk.StringVar(value=str(self.num_spindles))
         auto_send_loop_status_var = tk.StringVar(value="ACTIVE")
         pset_display_var = tk.StringVar(value="---")
         conn_display_var = tk.StringVar(value="DISCONNECTED")
@@ -1496,6 +4843,11 @@ class OpenProtocolEmulator:
         sub_multi_var = tk.StringVar(value="---")
         sub_relay_var = tk.StringVar(value="---")
 
+        client_keepalive_var = tk.StringVar(value="---")
+        client_ack_var = tk.StringVar(value="---")
+        client_rtt_var = tk.StringVar(value="---")
+        client_sendq_var = tk.StringVar(value="---")
+
         def parse_mid_fields(mid: str, data: str) -> str:
             """Parse known MID data into human-readable field breakdown."""
             try:
@@ -1661,6 +5013,15 @@ class OpenProtocolEmulator:
                 pass
             return None
 
+        # State changes and log lines arrive from network/worker threads. They are queued
+        # here and applied on the Tk thread by one coalesced refresh per `refresh_ms`.
+        refresh_ms = 100
+        log_backlog = 1000  # Log lines kept per refresh; older ones are counted, not drawn
+        pending_log = collections.deque(maxlen=log_backlog)
+        refresh_state = {"scheduled": False, "log_lines": 0}
+        refresh_lock = threading.Lock()
+        shown = {}  # Last value applied per field, so a refresh only touches what changed
+
         def log_message(direction: str, mid: str, length: int, data: str):
             if hide_keepalive_var.get() and mid == "9999":
                 return
@@ -1674,28 +5035,50 @@ class OpenProtocolEmulator:
             if parsed:
                 log_line += f"         {parsed}\n"
 
-            try:
-                log_text.configure(state='normal')
-                log_text.insert(tk.END, log_line, color_tag)
-                log_text.see(tk.END)
-                log_text.configure(state='disabled')
-
-                if log_to_file_var.get() and log_file_handle[0]:
+            if log_to_file_var.get() and log_file_handle[0]:
+                try:
                     log_file_handle[0].write(log_line)
                     log_file_handle[0].flush()
-            except tk.TclError:
-                pass
+                except (OSError, ValueError):
+                    pass
+            with refresh_lock:
+                pending_log.append((log_line, color_tag))
+                refresh_state["log_lines"] += 1
+            request_refresh()
 
         self._gui_log_message = log_message
 
-        def update_last_result(status: str, torque: float, angle: float, tightening_id: int):
-            status_text = "OK" if status == "1" else "NOK"
-            last_result_status_var.set(status_text)
-            last_result_torque_var.set(f"{torque:.2f} Nm")
-            last_result_angle_var.set(f"{angle:.0f}°")
-            last_result_id_var.set(str(tightening_id))
-
-        self._gui_update_last_result = update_last_result
+        def request_refresh():
+            """Schedule one GUI refresh; further calls before it runs are coalesced into it."""
+            with refresh_lock:
+                if refresh_state["scheduled"]:
+                    return
+                refresh_state["scheduled"] = True
+            try:
+                root.after(refresh_ms, refresh_gui)
+            except (tk.TclError, RuntimeError):  # Window closed, or main loop not running yet
+                with refresh_lock:
+                    refresh_state["scheduled"] = False
+
+        def refresh_gui():
+            with refresh_lock:
+                refresh_state["scheduled"] = False
+                lines = list(pending_log)
+                skipped = refresh_state["log_lines"] - len(lines)
+                pending_log.clear()
+                refresh_state["log_lines"] = 0
+            try:
+                if lines:
+                    log_text.configure(state='normal')
+                    if skipped:
+                        log_text.insert(tk.END, f"... {skipped} messages not shown (see log file)\n", "info")
+                    for log_line, color_tag in lines:
+                        log_text.insert(tk.END, log_line, color_tag)
+                    log_text.see(tk.END)
+                    log_text.configure(state='disabled')
+                update_labels()
+            except tk.TclError:
+                pass
 
         def apply_global_settings():
             try:
@@ -1705,6 +5088,7 @@ class OpenProtocolEmulator:
                         self.current_vin = new_vin
                         with self.state_lock:
                             self.batch_counter = 0
+                        self._persist_state()
                         log_message("info", "----", 0, f"VIN set to {self.current_vin}")
                     else:
                         messagebox.showerror("Error", f"Invalid VIN format: {new_vin}")
@@ -1735,12 +5119,22 @@ class OpenProtocolEmulator:
                     auto_loop_interval_var.set(str(self.auto_loop_interval))
                     return
 
+                new_spindles = int(num_spindles_var.get())
+                if new_spindles != self.num_spindles:
+                    try:
+                        self.set_num_spindles(new_spindles)
+                    except ValueError as e:
+                        messagebox.showerror("Error", str(e))
+                        num_spindles_var.set(str(self.num_spindles))
+                        return
+
                 update_labels()
             except ValueError:
-                messagebox.showerror("Error", "Invalid number format for Batch Size, NOK %, or Interval.")
+                messagebox.showerror("Error", "Invalid number format for Batch Size, NOK %, Interval, or Spindles.")
                 batch_size_var.set(str(self.target_batch_size))
                 nok_prob_var.set(str(int(self.nok_probability * 100)))
                 auto_loop_interval_var.set(str(self.auto_loop_interval))
+                num_spindles_var.set(str(self.num_spindles))
 
         def load_pset_settings():
             selected_pset = pset_id_var.get().strip()
@@ -1783,17 +5177,11 @@ class OpenProtocolEmulator:
                     "angle_min": int(pset_angle_min_var.get()),
                     "angle_max": int(pset_angle_max_var.get()),
                 }
-                # Basic validation (can add more specific checks)
-                if new_params["batch_size"] < 0: raise ValueError("Batch size must be >= 0")
-                if new_params["torque_min"] > new_params["torque_max"]: raise ValueError("Min Torque > Max Torque")
-                if new_params["angle_min"] > new_params["angle_max"]: raise ValueError("Min Angle > Max Angle")
-
-
-                self.pset_parameters[selected_pset] = new_params
+                self.set_pset_parameters(selected_pset, new_params)  # Validates; saved by the write-behind thread
                 self.current_pset = selected_pset
-                self.pset_last_change = datetime.datetime.now()
+                self.pset_last_change = self.clock.datetime()
                 print(f"[GUI] Applied settings for Pset {selected_pset}: {new_params}")
-                self._save_pset_parameters(self.controller_name) # Save immediately after applying, passing controller name
+                update_labels()
                 if self.pset_subscribed:
                     mid15_data = self._build_mid0015_data(self.pset_subscribed_rev)
                     mid15_msg = build_message(15, rev=self.pset_subscribed_rev, data=mid15_data)
@@ -1815,16 +5203,11 @@ class OpenProtocolEmulator:
         def manual_send_result():
             threading.Thread(target=self.send_single_tightening_result, daemon=True).start()
 
+        def manual_send_multi_spindle_result():
+            threading.Thread(target=self.send_multi_spindle_result, daemon=True).start()
+
         def toggle_relay(relay_function: int, new_status: int):
-            for device in self.io_devices.values():
-                for relay in device["relays"]:
-                    if relay["function"] == relay_function:
-                        relay["status"] = new_status
-                        print(f"[Relay] Set relay function {relay_function} to {'ON' if new_status else 'OFF'}")
-                        if relay_function in self.relay_subscriptions:
-                            self._send_relay_status(relay_function)
-                        return
-            print(f"[Relay] Relay function {relay_function} not found in any device")
+            self.set_relay_status(relay_function, new_status)
 
         def on_direction_toggle():
             is_forward = relay_direction_var.get()
@@ -1838,41 +5221,63 @@ class OpenProtocolEmulator:
             trigger_relay = self.relay_mappings.get("trigger", 20)
             toggle_relay(trigger_relay, new_status)
 
+        def show(key: str, apply, value):
+            """Apply `value` to a widget/variable only if it differs from what is displayed."""
+            if shown.get(key, shown) != value:
+                shown[key] = value
+                apply(value)
+
         def update_labels():
-            pset_display_var.set(self.current_pset if self.current_pset else "---")
-            conn_display_var.set("CONNECTED" if self.session_active else "DISCONNECTED")
+            session_active = self.session_active
+            tool_enabled = self.tool_enabled
+            show("pset", pset_display_var.set, self.current_pset if self.current_pset else "---")
+            show("conn", conn_display_var.set, "CONNECTED" if session_active else "DISCONNECTED")
             current_target_batch = self.pset_parameters.get(self.current_pset, {}).get("batch_size", self.target_batch_size)
-            with self.state_lock:
-                current_batch = self.batch_counter
-            batch_display_var.set(f"{current_batch}/{current_target_batch}")
-            vin_display_var.set(self.current_vin)
-            tool_protocol_status_var.set("ENABLED" if self.tool_enabled else "DISABLED")
-
-            sub_vin_var.set("YES" if self.vin_subscribed else "---")
-            sub_pset_var.set("YES" if self.pset_subscribed else "---")
-            sub_result_var.set("YES" if self.result_subscribed else "---")
-            sub_multi_var.set("YES" if self.multi_spindle_subscribed else "---")
+            show("batch", batch_display_var.set, f"{self.batch_counter}/{current_target_batch}")
+            show("vin", vin_display_var.set, self.current_vin)
+            show("tool", tool_protocol_status_var.set, "ENABLED" if tool_enabled else "DISABLED")
+            show("auto_loop", auto_send_loop_status_var.set, "ACTIVE" if self.auto_send_loop_active else "PAUSED")
+
+            show("sub_vin", sub_vin_var.set, "YES" if self.vin_subscribed else "---")
+            show("sub_pset", sub_pset_var.set, "YES" if self.pset_subscribed else "---")
+            show("sub_result", sub_result_var.set, "YES" if self.result_subscribed else "---")
+            show("sub_multi", sub_multi_var.set, "YES" if self.multi_spindle_subscribed else "---")
             relay_count = len(self.relay_subscriptions)
-            sub_relay_var.set(f"{relay_count}" if relay_count > 0 else "---")
-
-            conn_label.configure(text_color=COLORS["success"] if self.session_active else COLORS["error"])
-            tool_label.configure(text_color=COLORS["success"] if self.tool_enabled else COLORS["warning"])
-
-            for lbl, subscribed in sub_labels:
-                lbl.configure(text_color=COLORS["success"] if subscribed() else COLORS["text_dim"])
+            show("sub_relay", sub_relay_var.set, f"{relay_count}" if relay_count > 0 else "---")
+
+            show("conn_color", lambda c: conn_label.configure(text_color=c),
+                 COLORS["success"] if session_active else COLORS["error"])
+            show("tool_color", lambda c: tool_label.configure(text_color=c),
+                 COLORS["success"] if tool_enabled else COLORS["warning"])
+
+            for i, (lbl, subscribed) in enumerate(sub_labels):
+                show(f"sub_color_{i}", lambda c, lbl=lbl: lbl.configure(text_color=c),
+                     COLORS["success"] if subscribed() else COLORS["text_dim"])
+
+            last_result = self.last_result
+            if last_result is not None and shown.get("result") is not last_result:
+                shown["result"] = last_result
+                status, torque, angle, tightening_id = last_result
+                last_result_status_var.set("OK" if status == "1" else "NOK")
+                last_result_torque_var.set(f"{torque:.2f} Nm")
+                last_result_angle_var.set(f"{angle:.0f}°")
+                last_result_id_var.set(str(tightening_id))
 
             result_status = last_result_status_var.get()
-            if result_status == "OK":
-                result_status_label.configure(text_color=COLORS["success"])
-            elif result_status == "NOK":
-                result_status_label.configure(text_color=COLORS["error"])
-            else:
-                result_status_label.configure(text_color=COLORS["text"])
-
-            try:
-                root.after(500, update_labels)
-            except tk.TclError:
-                pass
+            show("result_color", lambda c: result_status_label.configure(text_color=c),
+                 COLORS["success"] if result_status == "OK" else COLORS["error"] if result_status == "NOK" else COLORS["text"])
+
+            client = self.get_client_stats() if self.client_observer is not None else None
+            interval = client["keepalive_interval_s"]["avg"] if client else None
+            show("client_keepalive", client_keepalive_var.set, f"{interval:.1f} s" if interval is not None else "---")
+            ack = client["event_ack_ms"]["avg"] if client else None
+            show("client_ack", client_ack_var.set, f"{ack:.1f} ms" if ack is not None else "---")
+            tcp = (client["tcp"] if client else None) or {}
+            show("client_rtt", client_rtt_var.set,
+                 f"{tcp['rtt_ms']:.2f} ms / {tcp['retransmits']}" if "rtt_ms" in tcp else "---")
+            show("client_sendq", client_sendq_var.set, f"{tcp['send_queue']} B" if "send_queue" in tcp else "---")
+            show("client_color", lambda c: client_sendq_label.configure(text_color=c),
+                 COLORS["warning"] if client and client["client_limited"] else COLORS["text"])
 
         def clear_log():
             log_text.configure(state='normal')
@@ -1924,6 +5329,7 @@ class OpenProtocolEmulator:
                 self.set_max_revision(101, int(rev_mid_0101_var.get()))
                 self.set_max_revision(215, int(rev_mid_0215_var.get()))
                 self.current_profile = "custom"
+                self._profile_source = None
                 print("[GUI] Applied revision configuration:")
                 for mid, rev in sorted(self.revision_config.items()):
                     print(f"  MID {mid:04d}: rev {rev}")
@@ -1992,9 +5398,8 @@ class OpenProtocolEmulator:
                     return
                 profile_name = profile_name.replace(" ", "-").lower()
                 try:
-                    if not os.path.exists(CONTROLLERS_DIR):
-                        os.makedirs(CONTROLLERS_DIR)
-                    filepath = os.path.join(CONTROLLERS_DIR, f"{profile_name}.json")
+                    os.makedirs(self.profile_catalogue.directory, exist_ok=True)
+                    filepath = self.profile_catalogue.path(profile_name)
                     profile_data = {
                         "name": profile_name,
                         "description": description,
@@ -2004,6 +5409,7 @@ class OpenProtocolEmulator:
                     with open(filepath, 'w') as f:
                         json.dump(profile_data, f, indent=2)
                     self.current_profile = profile_name
+                    self._profile_source = (profile_name, None)  # Reloaded from the saved file, then followed
                     profile_var.set(profile_name)
                     refresh_profile_dropdown()
                     print(f"[GUI] Saved profile '{profile_name}' to: {filepath}")
@@ -2089,16 +5495,20 @@ class OpenProtocolEmulator:
         ctk.CTkEntry(global_tab, textvariable=auto_loop_interval_var, width=80, fg_color=COLORS["bg_input"],
                      border_color=COLORS["border"], text_color=COLORS["text"]).grid(row=4, column=1, sticky=tk.W, padx=(12, 0))
 
+        ctk.CTkLabel(global_tab, text="Spindles (MID 0101)", text_color=COLORS["text_dim"]).grid(row=5, column=0, sticky=tk.W, pady=8)
+        ctk.CTkEntry(global_tab, textvariable=num_spindles_var, width=80, fg_color=COLORS["bg_input"],
+                     border_color=COLORS["border"], text_color=COLORS["text"]).grid(row=5, column=1, sticky=tk.W, padx=(12, 0))
+
         ctk.CTkButton(global_tab, text="Apply Settings", command=apply_global_settings,
                       fg_color=COLORS["accent"], hover_color=COLORS["accent_hover"],
                       text_color=COLORS["bg_dark"], font=ctk.CTkFont(weight="bold"),
-                      corner_radius=8, height=36).grid(row=5, column=0, columnspan=2, pady=(20, 12), sticky=tk.W)
+                      corner_radius=8, height=36).grid(row=6, column=0, columnspan=2, pady=(20, 12), sticky=tk.W)
 
         ctk.CTkLabel(global_tab, text="CONTROLS", font=ctk.CTkFont(family="Segoe UI", size=14, weight="bold"),
-                     text_color=COLORS["accent"]).grid(row=6, column=0, columnspan=3, sticky=tk.W, pady=(20, 12))
+                     text_color=COLORS["accent"]).grid(row=7, column=0, columnspan=3, sticky=tk.W, pady=(20, 12))
 
         control_frame = ctk.CTkFrame(global_tab, fg_color="transparent")
-        control_frame.grid(row=7, column=0, columnspan=3, sticky=tk.W)
+        control_frame.grid(row=8, column=0, columnspan=3, sticky=tk.W)
 
         ctk.CTkButton(control_frame, text="Toggle Auto Loop", command=toggle_auto_send_loop,
                       fg_color=COLORS["bg_main"], hover_color=COLORS["accent_dim"],
@@ -2111,15 +5521,20 @@ class OpenProtocolEmulator:
         auto_status_label.pack(side=tk.LEFT, padx=(0, 20))
 
         ctk.CTkButton(control_frame, text="Send Single Result", command=manual_send_result,
+                      fg_color=COLORS["bg_main"], hover_color=COLORS["accent_dim"],
+                      border_width=1, border_color=COLORS["border"],
+                      corner_radius=8, height=32).pack(side=tk.LEFT, padx=(0, 12))
+
+        ctk.CTkButton(control_frame, text="Send Multi-Spindle", command=manual_send_multi_spindle_result,
                       fg_color=COLORS["bg_main"], hover_color=COLORS["accent_dim"],
                       border_width=1, border_color=COLORS["border"],
                       corner_radius=8, height=32).pack(side=tk.LEFT)
 
         ctk.CTkLabel(global_tab, text="I/O RELAYS", font=ctk.CTkFont(family="Segoe UI", size=14, weight="bold"),
-                     text_color=COLORS["accent"]).grid(row=8, column=0, columnspan=3, sticky=tk.W, pady=(20, 12))
+                     text_color=COLORS["accent"]).grid(row=9, column=0, columnspan=3, sticky=tk.W, pady=(20, 12))
 
         relay_frame = ctk.CTkFrame(global_tab, fg_color="transparent")
-        relay_frame.grid(row=9, column=0, columnspan=3, sticky=tk.W)
+        relay_frame.grid(row=10, column=0, columnspan=3, sticky=tk.W)
 
         ctk.CTkLabel(relay_frame, text="Direction (Fwd/Rev)", text_color=COLORS["text_dim"]).pack(side=tk.LEFT, padx=(0, 8))
         ctk.CTkSwitch(relay_frame, text="", variable=relay_direction_var, command=on_direction_toggle,
@@ -2313,6 +5728,29 @@ class OpenProtocolEmulator:
             lbl.pack(side=tk.RIGHT)
             sub_labels.append((lbl, subscribed_fn))
 
+        ctk.CTkLabel(status_frame, text="", height=1, fg_color=COLORS["border"]).pack(fill=tk.X, padx=16, pady=12)
+
+        ctk.CTkLabel(status_frame, text="CLIENT", font=ctk.CTkFont(size=12, weight="bold"),
+                     text_color=COLORS["accent"]).pack(pady=(0, 8), padx=16, anchor=tk.W)
+
+        client_items = [
+            ("Keep-alive", client_keepalive_var, "keepalive"),
+            ("Ack", client_ack_var, "ack"),
+            ("RTT/Retx", client_rtt_var, "rtt"),
+            ("Send-Q", client_sendq_var, "sendq"),
+        ]
+
+        client_sendq_label = None
+        for label_text, var, key in client_items:
+            row_frame = ctk.CTkFrame(status_frame, fg_color="transparent")
+            row_frame.pack(fill=tk.X, padx=16, pady=3)
+            ctk.CTkLabel(row_frame, text=label_text, text_color=COLORS["text_dim"], width=80, anchor=tk.W).pack(side=tk.LEFT)
+            lbl = ctk.CTkLabel(row_frame, textvariable=var, text_color=COLORS["text"],
+                               font=ctk.CTkFont(weight="bold"), width=100, anchor=tk.E)
+            lbl.pack(side=tk.RIGHT)
+            if key == "sendq":
+                client_sendq_label = lbl
+
         ctk.CTkLabel(status_frame, text="").pack(pady=8)
 
         log_frame = ctk.CTkFrame(main_container, fg_color=COLORS["bg_card"], corner_radius=12)
@@ -2362,6 +5800,9 @@ class OpenProtocolEmulator:
         log_text.configure(state='disabled')
 
         def on_closing():
+            if request_refresh in self._state_listeners:
+                self._state_listeners.remove(request_refresh)
+            self.__dict__.pop('_gui_log_message', None)
             if log_file_handle[0]:
                 log_file_handle[0].close()
             self._save_pset_parameters(self.controller_name)
@@ -2371,25 +5812,642 @@ class OpenProtocolEmulator:
         pset_id_var.trace_add("write", lambda name, index, mode: load_pset_settings())
         load_pset_settings()
         update_labels()
+        self.add_state_listener(request_refresh)
+        if master is not None:
+            return root
+        root.mainloop()
+
+class FleetDashboard:
+    """
+    One window for a whole fleet: a table of connection state, result rate, last result,
+    Pset, VIN, subscriptions and error counts per controller. Only the rows that fit the
+    window exist as canvas items and scrolling re-fills them, so 100+ controllers cost
+    the same as 20. `statuses()` ({name: get_status() dict}) is called by a background
+    thread every `refresh_s`, since a FleetSupervisor has to ask its worker processes.
+    Double-clicking a row calls open_controller(name, root), which should return the
+    controller's window (in-process fleets open the regular tabbed view).
+    """
+    COLUMNS = (("Controller", 170), ("Port", 60), ("State", 110), ("Results/s", 80), ("Last result", 170),
+               ("Pset", 50), ("VIN", 150), ("Subscriptions", 120), ("Errors", 80))
+    ROW_HEIGHT = 22
+    COLORS = {"bg": "#101720", "header": "#1a2332", "text": "#e6edf3", "text_dim": "#7d8590",
+              "success": "#00f5a0", "warning": "#ffc107", "error": "#ff5757", "accent": "#00b4d8"}
+
+    def __init__(self, statuses, open_controller=None, title: str = "Open Protocol Fleet", refresh_s: float = 1.0):
+        self.statuses = statuses
+        self.open_controller = open_controller
+        self.title = title
+        self.refresh_s = refresh_s
+        self._rows = []  # [(name, ((text, color), ...)), ...] sorted by name
+        self._summary = ""
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._top = 0  # Index of the first visible row
+        self._slots = []  # Canvas text item IDs per visible row slot
+        self._drawn = {}  # Item ID -> (text, color) last drawn
+        self._windows = {}
+
+    def _poll_loop(self):
+        previous = {}
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                statuses = self.statuses()
+            except Exception as e:  # Keep polling; a restarting worker must not kill the dashboard
+                print(f"[Dashboard] Status poll failed: {e}")
+                statuses = {}
+            rows, total_rate, connected, errors = [], 0.0, 0, 0
+            for name in sorted(statuses):
+                st = statuses[name]
+                count, when = st["tightening_id"], started
+                prev_count, prev_when = previous.get(name, (count, when))
+                rate = (count - prev_count) / (when - prev_when) if when > prev_when and count >= prev_count else 0.0
+                previous[name] = (count, when)
+                total_rate += rate
+                connected += bool(st["session_active"])
+                error_count = sum(st["errors"].values())
+                errors += error_count
+                last = st["last_result"]
+                subs = st["subscriptions"]
+                sub_text = " ".join(flag for flag, on in (("VIN", subs["vin"]), ("PS", subs["pset"]),
+                                                          ("RES", subs["result"]), ("MS", subs["multi_spindle"])) if on)
+                if subs["relays"]:
+                    sub_text += f" R{len(subs['relays'])}"
+                colors = self.COLORS
+                rows.append((name, (
+                    (name, colors["text"]),
+                    (str(st["port"]), colors["text_dim"]),
+                    ("CONNECTED", colors["success"]) if st["session_active"] else ("IDLE", colors["text_dim"]),
+                    (f"{rate:.1f}", colors["text"]),
+                    (f"{last['status']} {last['torque']:.2f} Nm {last['angle']:.0f}°" if last else "---",
+                     colors["text_dim"] if not last else colors["success"] if last["status"] == "OK" else colors["error"]),
+                    (st["pset"] or "---", colors["text"]),
+                    (st["vin"], colors["text"]),
+                    (sub_text.strip() or "---", colors["accent"] if sub_text else colors["text_dim"]),
+                    (str(error_count), colors["error"] if error_count else colors["text_dim"]),
+                )))
+            with self._lock:
+                self._rows = rows
+                self._summary = (f"{len(rows)} controllers   {connected} connected   "
+                                 f"{total_rate:.1f} results/s   {errors} errors")
+                self._fresh = True
+            self._stop.wait(max(0.0, self.refresh_s - (time.monotonic() - started)))
+
+    def run(self):
+        """Build the window and run the Tk main loop until it is closed."""
+        _require_gui()
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue")
+        root = self.root = ctk.CTk()
+        root.title(self.title)
+        root.geometry("1200x700")
+        root.minsize(800, 400)
+        summary_var = self._summary_var = tk.StringVar(value="Waiting for status...")
+        ctk.CTkLabel(root, textvariable=summary_var, anchor=tk.W,
+                     font=ctk.CTkFont(size=14, weight="bold")).pack(fill=tk.X, padx=12, pady=(10, 4))
+        width = sum(w for _, w in self.COLUMNS)
+        header = tk.Canvas(root, height=self.ROW_HEIGHT + 4, bg=self.COLORS["header"], highlightthickness=0)
+        header.pack(fill=tk.X, padx=12)
+        x = 6
+        for label, col_width in self.COLUMNS:
+            header.create_text(x, (self.ROW_HEIGHT + 4) // 2, text=label, anchor=tk.W, fill=self.COLORS["text_dim"],
+                               font=("TkDefaultFont", 10, "bold"))
+            x += col_width
+        table = ctk.CTkFrame(root, fg_color="transparent")
+        table.pack(fill=tk.BOTH, expand=True, padx=12, pady=(0, 12))
+        self._body = tk.Canvas(table, bg=self.COLORS["bg"], highlightthickness=0, width=width)
+        self._scrollbar = ctk.CTkScrollbar(table, command=self._on_scrollbar)
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self._body.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self._body.bind("<Configure>", lambda event: self._layout())
+        self._body.bind("<MouseWheel>", lambda event: self._scroll_to(self._top - int(event.delta / 120) * 3))
+        self._body.bind("<Button-4>", lambda event: self._scroll_to(self._top - 3))
+        self._body.bind("<Button-5>", lambda event: self._scroll_to(self._top + 3))
+        self._body.bind("<Double-Button-1>", self._on_double_click)
+        root.protocol("WM_DELETE_WINDOW", self._close)
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+        root.after(100, self._apply)
         root.mainloop()
 
+    def _close(self):
+        self._stop.set()
+        self.root.destroy()
+
+    def _visible_count(self) -> int:
+        return max(1, self._body.winfo_height() // self.ROW_HEIGHT)
+
+    def _layout(self):
+        """Create or drop row slots so that exactly the rows fitting the canvas exist."""
+        needed = self._visible_count() + 1
+        while len(self._slots) < needed:
+            y = len(self._slots) * self.ROW_HEIGHT + self.ROW_HEIGHT // 2
+            x, items = 6, []
+            for _, col_width in self.COLUMNS:
+                items.append(self._body.create_text(x, y, text="", anchor=tk.W, fill=self.COLORS["text"]))
+                x += col_width
+            self._slots.append(items)
+        while len(self._slots) > needed:
+            for item in self._slots.pop():
+                self._body.delete(item)
+                self._drawn.pop(item, None)
+        self._scroll_to(self._top)
+
+    def _scroll_to(self, top: int):
+        self._top = max(0, min(top, len(self._rows) - self._visible_count()))
+        self._draw()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self._scroll_to(int(float(args[1]) * len(self._rows)))
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self._visible_count() if args[2] == "pages" else 1)
+            self._scroll_to(self._top + step)
+
+    def _draw(self):
+        rows = self._rows
+        for i, items in enumerate(self._slots):
+            index = self._top + i
+            cells = rows[index][1] if index < len(rows) else (("", self.COLORS["text"]),) * len(items)
+            for item, cell in zip(items, cells):
+                if self._drawn.get(item) != cell:
+                    self._drawn[item] = cell
+                    self._body.itemconfigure(item, text=cell[0], fill=cell[1])
+        total = max(1, len(rows))
+        self._scrollbar.set(self._top / total, min(1.0, (self._top + self._visible_count()) / total))
+
+    def _apply(self):
+        with self._lock:
+            fresh, self._fresh = self._fresh, False
+            summary = self._summary
+        try:
+            if fresh:
+                self._summary_var.set(summary)
+                self._scroll_to(self._top)
+            self.root.after(int(self.refresh_s * 500), self._apply)
+        except tk.TclError:
+            pass
+
+    def _on_double_click(self, event):
+        index = self._top + int(event.y // self.ROW_HEIGHT)
+        if self.open_controller is None or index >= len(self._rows):
+            return
+        name = self._rows[index][0]
+        window = self._windows.get(name)
+        if window is not None and window.winfo_exists():
+            window.lift()
+            return
+        self._windows[name] = self.open_controller(name, self.root)
+
+
 # Main entry point
+def configure_emulator(emulator: OpenProtocolEmulator, args) -> None:
+    """Apply the command-line options (an argparse namespace) to an emulator. Raises ValueError, OSError or sqlite3.Error."""
+    if args.profile:
+        emulator.apply_profile(args.profile)
+    if args.state_db:
+        emulator.use_state_store(args.state_db)
+    if args.impairment:
+        with open(args.impairment, 'r') as f:
+            emulator.set_impairment(json.load(f))
+    elif args.latency_ms or args.jitter_ms or args.bandwidth_bps:
+        emulator.set_impairment({"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms,
+                                 "distribution": args.delay_distribution, "bandwidth_bps": args.bandwidth_bps})
+    if args.import_psets:
+        emulator.import_psets_csv(args.import_psets)
+    if args.segment_mode != "whole":
+        try:
+            min_bytes, max_bytes = (int(v) for v in args.fragment_bytes.split("-", 1))
+        except ValueError:
+            raise ValueError(f"--fragment-bytes must be MIN-MAX, got {args.fragment_bytes!r}") from None
+        emulator.set_segmentation({"mode": args.segment_mode, "min_bytes": min_bytes, "max_bytes": max_bytes,
+                                   "gap_ms": args.fragment_gap_ms, "coalesce_bytes": args.coalesce_bytes,
+                                   "coalesce_ms": args.coalesce_ms, "seed": args.segment_seed})
+    if args.io_devices:
+        emulator.add_io_devices(args.io_devices, args.io_points)
+    if args.relay_stream_hz:
+        emulator.start_relay_stream(args.relay_stream_hz)
+    if args.time_warp != 1.0:
+        emulator.set_time_warp(args.time_warp)
+    emulator.set_num_spindles(args.spindles)
+    emulator.set_trace_samples(args.trace_samples)
+    emulator.set_result_prefetch(args.result_prefetch)
+    emulator.set_link_timeout(args.link_timeout)
+    emulator.set_client_sample_interval(args.client_sample_interval)
+    emulator.set_link_ack_params(window=args.link_window, ack_timeout=args.link_ack_timeout)
+    emulator.set_event_ack_params(timeout=args.ack_timeout, hold=args.hold_until_ack)
+    emulator.set_send_timeouts(send_timeout=args.send_timeout)
+    for event_mid, (policy, _) in list(emulator.outbound_policies.items()):
+        emulator.set_outbound_policy(event_mid, policy, args.queue_limit)
+
+
+def build_fleet(controllers: list, args) -> list:
+    """Create and configure one emulator per (name, port). Raises ValueError, OSError or sqlite3.Error."""
+    emulators = []
+    for name, port in controllers:
+        emulator = OpenProtocolEmulator(port=port, controller_name=name)
+        configure_emulator(emulator, args)
+        emulators.append(emulator)
+    return emulators
+
+
+def _fleet_worker(worker_id: int, controllers: list, args, conn):
+    """
+    Worker process body: run the emulators for `controllers` ([(name, port), ...]) and
+    answer supervisor commands on `conn` until told to stop or the supervisor goes away.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the supervisor stops us
+    try:
+        emulators = build_fleet(controllers, args)
+        scenario = ScenarioRunner.load(args.scenario) if args.scenario else None
+        for emulator in emulators:
+            emulator.start()  # Raises OSError if the port is taken
+    except (ValueError, OSError, sqlite3.Error) as e:
+        print(f"[Fleet] Worker {worker_id} configuration failed: {e}")
+        sys.exit(FleetSupervisor.CONFIG_ERROR)
+    by_name = {e.controller_name.strip(): e for e in emulators}
+    if scenario is not None:
+        ScenarioRunner(scenario, emulators, speed=args.scenario_speed or args.time_warp).start()
+    print(f"[Fleet] Worker {worker_id} (pid {os.getpid()}) running {len(emulators)} controller(s) "
+          f"on ports {controllers[0][1]}-{controllers[-1][1]}.")
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            if not conn.poll(1.0):
+                if parent is not None and not parent.is_alive():
+                    break  # Supervisor killed without stopping us
+                continue
+            seq, command, payload = conn.recv()
+        except (EOFError, OSError):
+            break  # Supervisor gone
+        if command == "stop":
+            break
+        if command == "status":
+            reply = {name: e.get_status() for name, e in by_name.items()}
+        elif command == "metrics":
+            reply = dict(ControlServer.local_metrics(emulators), worker=worker_id)
+        elif command == "actions":
+            names, actions = payload
+            reply = ControlServer.execute_batch([by_name[n] for n in names], actions)
+        else:
+            reply = None
+        conn.send((seq, reply))
+    for emulator in emulators:
+        emulator.stop()
+
+
+class FleetSupervisor:
+    """
+    Spreads `count` emulated controllers (ports base_port.., names <name>-001..) over
+    `workers` processes, each owning a contiguous block of ports, so a fleet is not
+    bound to one interpreter's GIL. Status, metrics and action batches are fanned out to
+    the workers over pipes and merged; a worker that dies is restarted with the same
+    controllers (at most once per `restart_delay` seconds) unless its configuration failed.
+    """
+    CONFIG_ERROR = 3  # Worker exit code for bad options; not worth restarting
+
+    def __init__(self, args, count: int, workers: int = None, restart_delay: float = 1.0):
+        workers = workers or os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"Worker count must be >= 1, got {workers}")
+        controllers = self.plan(args, count)
+        workers = min(workers, count)
+        self.args = args
+        self.restart_delay = restart_delay
+        per_worker, extra = divmod(count, workers)
+        self.assignments = []
+        start = 0
+        for w in range(workers):
+            size = per_worker + (1 if w < extra else 0)
+            self.assignments.append(controllers[start:start + size])
+            start += size
+        self.owner = {name: w for w, block in enumerate(self.assignments) for name, _ in block}
+        self.restarts = [0] * workers
+        self._procs = [None] * workers
+        self._conns = [None] * workers
+        self._locks = [threading.Lock() for _ in range(workers)]
+        self._seq = itertools.count(1)  # Request IDs, echoed in replies
+        self._last_start = [0.0] * workers
+        self._stop = threading.Event()
+        self._monitor = None
+
+    @staticmethod
+    def plan(args, count: int) -> list:
+        """Fleet controller names and ports: [("<name>-001", port), ...]."""
+        if count < 1:
+            raise ValueError(f"Fleet size must be >= 1, got {count}")
+        if not (1 <= args.port and args.port + count - 1 <= 65535):
+            raise ValueError(f"Ports {args.port}-{args.port + count - 1} are out of range")
+        return [(f"{args.name}-{i + 1:03d}", args.port + i) for i in range(count)]
+
+    def _spawn(self, w: int):
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_fleet_worker, args=(w, self.assignments[w], self.args, child),
+                                       name=f"fleet-worker-{w}", daemon=True)
+        proc.start()
+        child.close()
+        self._procs[w], self._conns[w] = proc, parent
+        self._last_start[w] = time.monotonic()
+
+    def start(self):
+        for w in range(len(self.assignments)):
+            self._spawn(w)
+        self._monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor.start()
+        print(f"[Fleet] Started {len(self.owner)} controllers on {len(self.assignments)} worker process(es).")
+
+    def _monitor_loop(self):
+        while not self._stop.wait(0.5):
+            for w, proc in enumerate(self._procs):
+                if proc.is_alive() or proc.exitcode == self.CONFIG_ERROR \
+                        or time.monotonic() - self._last_start[w] < self.restart_delay:
+                    continue
+                with self._locks[w]:
+                    if self._stop.is_set():
+                        return
+                    print(f"[Fleet] Worker {w} (pid {proc.pid}) exited with code {proc.exitcode}; restarting.")
+                    self._conns[w].close()
+                    self.restarts[w] += 1
+                    self._spawn(w)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for w, proc in enumerate(self._procs):
+            with self._locks[w]:
+                try:
+                    self._conns[w].send((0, "stop", None))
+                except (OSError, ValueError):
+                    pass
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+
+    def _call_all(self, requests: dict, timeout: float = 30.0) -> dict:
+        """
+        Send {worker: (command, payload)} to the workers at once and gather the replies
+        (None if a worker is down or misses the deadline). Each request carries an ID the
+        worker echoes, so a late reply to an earlier request is discarded, not taken as this one's.
+        """
+        replies = {}
+        held = []
+        try:
+            sent = {}
+            for w, (command, payload) in requests.items():
+                self._locks[w].acquire()
+                held.append(w)
+                sent[w] = next(self._seq)
+                try:
+                    self._conns[w].send((sent[w], command, payload))
+                except (OSError, ValueError):
+                    replies[w] = None
+            deadline = time.monotonic() + timeout
+            for w, seq in sent.items():
+                if w in replies:
+                    continue
+                replies[w] = None
+                try:
+                    while self._conns[w].poll(max(0.0, deadline - time.monotonic())):
+                        reply_seq, reply = self._conns[w].recv()
+                        if reply_seq == seq:
+                            replies[w] = reply
+                            break
+                except (EOFError, OSError):
+                    pass
+        finally:
+            for w in held:
+                self._locks[w].release()
+        return replies
+
+    def statuses(self) -> dict:
+        merged = {}
+        for reply in self._call_all({w: ("status", None) for w in range(len(self.assignments))}).values():
+            merged.update(reply or {})
+        return merged
+
+    def metrics(self) -> dict:
+        replies = self._call_all({w: ("metrics", None) for w in range(len(self.assignments))})
+        workers = []
+        for w in range(len(self.assignments)):
+            workers.append(dict(replies[w] or {"worker": w, "pid": None}, alive=replies[w] is not None,
+                                restarts=self.restarts[w]))
+        totals = {key: sum(r.get(key, 0) for r in workers if r["alive"])
+                  for key in ("controllers", "sessions", "results", "frames_sent", "prefetch_misses",
+                              "client_limited", "client_retransmits", "cpu_s")}
+        totals["client_rtt_max_ms"] = max((r.get("client_rtt_max_ms", 0.0) for r in workers if r["alive"]), default=0.0)
+        return {"totals": totals, "workers": workers}
+
+    def run_actions(self, request: dict) -> dict:
+        actions = ControlServer.check_request(request)
+        names = ControlServer.select(self.owner, request.get("controllers"))
+        per_worker = collections.defaultdict(list)
+        for name in names:
+            per_worker[self.owner[name]].append(name)
+        start = time.perf_counter()
+        replies = self._call_all({w: ("actions", (n, actions)) for w, n in per_worker.items()})
+        results = {}
+        for w, reply in replies.items():
+            if reply is None:
+                reply = {name: {"executed": 0, "error": f"worker {w} unavailable"} for name in per_worker[w]}
+            results.update(reply)
+        return {"controllers": results, "elapsed": time.perf_counter() - start}
+
+
 if __name__ == "__main__":
     # Setup argument parser
     parser = argparse.ArgumentParser(description="Open Protocol Emulator")
     parser.add_argument("-p", "--port", type=int, default=4545,
                         help="Port number to listen on (default: 4545)")
+    parser.add_argument("--unix", type=str, default=None, metavar="PATH",
+                        help="Listen on a Unix domain socket at PATH instead of TCP")
     parser.add_argument("-n", "--name", type=str, default="OpenProtocolSim",
                         help="Controller name reported in MID 0002 (default: OpenProtocolSim)")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Controller profile to apply at startup (built-in or controllers/<name>.json)")
+    parser.add_argument("--state-db", type=str, default=None, metavar="PATH",
+                        help="Keep Psets, counters, VIN and result history in a shared SQLite database instead of JSON")
+    parser.add_argument("--scenario", type=str, default=None, metavar="FILE",
+                        help="Play a scenario file (timed/rate-based result, VIN, Pset, relay and tool events) once a client connects")
+    parser.add_argument("--scenario-speed", type=float, default=None,
+                        help="Time compression for --scenario, e.g. 60 plays an hour in a minute (default: --time-warp)")
+    parser.add_argument("--time-warp", type=float, default=1.0,
+                        help="Controller clock speed for result timestamps and the auto loop, e.g. 60 (default: 1)")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Added delay before each outbound frame, in milliseconds (default: 0)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0,
+                        help="Spread of the added delay, in milliseconds (default: 0)")
+    parser.add_argument("--delay-distribution", choices=LinkImpairment.DISTRIBUTIONS, default="uniform",
+                        help="Distribution of the added delay (default: uniform)")
+    parser.add_argument("--bandwidth-bps", type=float, default=0.0,
+                        help="Outbound bandwidth cap in bits per second, 0 = unlimited (default: 0)")
+    parser.add_argument("--impairment", type=str, default=None, metavar="FILE",
+                        help="JSON impairment config with per-MID delay distributions (overrides the options above)")
+    parser.add_argument("--segment-mode", choices=FrameSegmenter.MODES, default="whole",
+                        help="Transmit mode: whole frames, random small fragments, or coalesced segments (default: whole)")
+    parser.add_argument("--fragment-bytes", type=str, default="1-16", metavar="MIN-MAX",
+                        help="Write size range for --segment-mode fragment (default: 1-16)")
+    parser.add_argument("--fragment-gap-ms", type=float, default=0.0,
+                        help="Pause between fragment writes in milliseconds (default: 0)")
+    parser.add_argument("--coalesce-bytes", type=int, default=65536,
+                        help="Segment size that triggers a write in --segment-mode coalesce (default: 65536)")
+    parser.add_argument("--coalesce-ms", type=float, default=10.0,
+                        help="Longest a frame waits for others in --segment-mode coalesce (default: 10)")
+    parser.add_argument("--segment-seed", type=int, default=None,
+                        help="Seed for the fragmentation RNG (default: random)")
+    parser.add_argument("--relay-stream-hz", type=float, default=0.0,
+                        help="Toggle the trigger/direction relays at this rate for MID 0216 subscribers, 0 = off (default: 0)")
+    parser.add_argument("--control-port", type=int, default=None,
+                        help="Serve the HTTP/JSON control API on this port (default: off)")
+    parser.add_argument("--control-host", type=str, default="127.0.0.1",
+                        help="Address for the control API (default: 127.0.0.1)")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without the GUI until interrupted")
+    parser.add_argument("--fleet", type=int, default=0, metavar="N",
+                        help="Run N controllers on ports PORT..PORT+N-1 in worker processes, headless (default: off)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for --fleet, 0 runs the fleet in this process (default: one per CPU core)")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="Show one fleet dashboard window for --fleet; with --workers 0 rows open the controller view")
+    parser.add_argument("--io-devices", type=int, default=0,
+                        help="Add this many extra I/O devices (01, 02, ...) for MID 0214 polling (default: 0)")
+    parser.add_argument("--io-points", type=int, default=32,
+                        help="Relays and digital inputs per --io-devices device, 1-99; relays get unused "
+                             "functions, up to 999 in all (default: 32)")
+    parser.add_argument("--import-psets", type=str, default=None, metavar="CSV",
+                        help="Add or update Psets from a CSV file (columns: pset_id, name, batch_size, target_torque, ...)")
+    parser.add_argument("--export-psets", type=str, default=None, metavar="CSV",
+                        help="Write all Psets to a CSV file and exit")
+    parser.add_argument("-s", "--spindles", type=int, default=2,
+                        help=f"Number of spindles reported in MID 0101, 1-{MAX_SPINDLES} (default: 2)")
+    parser.add_argument("--bench-multi-spindle", action="store_true",
+                        help="Print MID 0101 encoding throughput for 2/8/32/64 spindles and exit")
+    parser.add_argument("-t", "--link-timeout", type=float, default=DEFAULT_LINK_TIMEOUT,
+                        help=f"Seconds without any client message before the connection is dropped, 0 disables (default: {DEFAULT_LINK_TIMEOUT:g})")
+    parser.add_argument("--client-sample-interval", type=float, default=1.0,
+                        help="Seconds between TCP_INFO/send-queue samples of the client socket, 0 disables (default: 1)")
+    parser.add_argument("--link-window", type=int, default=1,
+                        help="Unacknowledged frames allowed in flight with link-level acks, 1-98 (default: 1)")
+    parser.add_argument("--link-ack-timeout", type=float, default=3.0,
+                        help="Seconds before an unacknowledged frame is retransmitted (default: 3)")
+    parser.add_argument("--ack-timeout", type=float, default=10.0,
+                        help="Seconds before an unacknowledged event (MID 0061/0052/0015/0217/0101) counts as missing (default: 10)")
+    parser.add_argument("--hold-until-ack", action="store_true",
+                        help="Hold each event type until the client acknowledges the previous one")
+    parser.add_argument("--queue-limit", type=int, default=1000,
+                        help="Frames queued per event subscription before its overflow policy applies (default: 1000)")
+    parser.add_argument("--send-timeout", type=float, default=5.0,
+                        help="Seconds a socket write may block before a non-reading client is dropped, 0 waits forever (default: 5)")
+    parser.add_argument("--trace-samples", type=int, default=500,
+                        help="Samples per MID 0900 trace curve (default: 500)")
+    parser.add_argument("--result-prefetch", type=int, default=64,
+                        help="MID 0061 result outcomes drawn and encoded ahead; 0 draws each on send (default: 64)")
+    parser.add_argument("--bench-result", action="store_true",
+                        help="Print MID 0061 encoding latency, inline vs pre-encoded pipeline, and exit")
+    parser.add_argument("--bench-trace", action="store_true",
+                        help="Print MID 0900 trace curve encoding throughput vs MID 0061 and exit")
     args = parser.parse_args()
+    if args.unix and args.fleet:
+        parser.error("--unix cannot be combined with --fleet")
+    if args.dashboard and ctk is None:
+        parser.error("--dashboard needs tkinter and customtkinter (pip install customtkinter)")
+
+    if args.fleet and args.workers == 0:
+        # Whole fleet in this process, e.g. to drill into controllers from the dashboard
+        try:
+            emulators = build_fleet(FleetSupervisor.plan(args, args.fleet), args)
+            for emulator in emulators:
+                emulator.start()  # Raises OSError if a port is taken
+            control_server = None
+            if args.control_port is not None:
+                control_server = ControlServer(emulators, host=args.control_host, port=args.control_port)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            parser.error(str(e))
+        by_name = {e.controller_name.strip(): e for e in emulators}
+        atexit.register(lambda: [e.pset_writer.flush() for e in emulators])
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if args.scenario:
+            ScenarioRunner(ScenarioRunner.load(args.scenario), emulators, speed=args.scenario_speed or args.time_warp).start()
+        if control_server is not None:
+            control_server.start()
+        if args.dashboard:
+            FleetDashboard(lambda: {name: e.get_status() for name, e in by_name.items()},
+                           open_controller=lambda name, master: by_name[name].start_gui(master=master)).run()
+        else:
+            try:
+                while True:
+                    time.sleep(1.0)
+            except KeyboardInterrupt:
+                print("[Fleet] Interrupted, shutting down.")
+        raise SystemExit(0)
+
+    if args.fleet:
+        try:
+            fleet = FleetSupervisor(args, args.fleet, workers=args.workers)
+            control_server = None
+            if args.control_port is not None:
+                control_server = ControlServer(host=args.control_host, port=args.control_port, fleet=fleet)
+        except (ValueError, OSError) as e:
+            parser.error(str(e))
+        fleet.start()
+        if control_server is not None:
+            control_server.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            if args.dashboard:
+                FleetDashboard(fleet.statuses).run()
+            else:
+                while True:
+                    time.sleep(1.0)
+        except (KeyboardInterrupt, SystemExit):
+            print("[Fleet] Stopping workers...")
+        fleet.stop()
+        raise SystemExit(0)
 
     # Create and run emulator instance with arguments
-    emulator = OpenProtocolEmulator(port=args.port, controller_name=args.name)
+    emulator = OpenProtocolEmulator(port=args.port, controller_name=args.name, unix_path=args.unix)
+    try:
+        configure_emulator(emulator, args)
+        scenario_runner = None
+        if args.scenario:
+            scenario_runner = ScenarioRunner(ScenarioRunner.load(args.scenario), [emulator], speed=args.scenario_speed or args.time_warp)
+        control_server = None
+        if args.control_port is not None:
+            control_server = ControlServer([emulator], host=args.control_host, port=args.control_port)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        parser.error(str(e))
+    if args.export_psets:
+        emulator.export_psets_csv(args.export_psets)
+        emulator.pset_writer.flush()
+        raise SystemExit(0)
+    if args.bench_multi_spindle or args.bench_trace or args.bench_result:
+        if args.bench_multi_spindle:
+            emulator.benchmark_multi_spindle()
+        if args.bench_trace:
+            emulator.benchmark_trace_curves()
+        if args.bench_result:
+            emulator.benchmark_result_latency()
+        raise SystemExit(0)
+    # Flush pending Pset edits on normal exit and on SIGTERM (e.g. a headless container stop)
+    atexit.register(lambda: emulator.pset_writer.flush())
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     server_thread = threading.Thread(target=emulator.start_server, daemon=True)
     server_thread.start()
+    if scenario_runner is not None:
+        scenario_runner.start()
+    if control_server is not None:
+        control_server.start()
+    if args.headless:
+        try:
+            while server_thread.is_alive():
+                server_thread.join(1.0)
+        except KeyboardInterrupt:
+            print("[Server] Interrupted, shutting down.")
+        raise SystemExit(0)
 
     # Start GUI only if server thread started successfully (basic check)
-    if server_thread.is_alive():
+    if ctk is None:
+        print("[GUI Error] tkinter/customtkinter is not installed; use --headless. Exiting.")
+    elif server_thread.is_alive():
         try:
             emulator.start_gui() # Runs in main thread
         except tk.TclError as e:
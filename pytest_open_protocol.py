@@ -0,0 +1,49 @@
+"""
+pytest plugin: in-process Open Protocol emulators for integration tests.
+
+Enable it with `pytest -p pytest_open_protocol` or `pytest_plugins = ["pytest_open_protocol"]`
+in a conftest.py. Each emulator binds a free port on 127.0.0.1 and keeps its Pset file in
+the test's tmp_path, so tests (and pytest-xdist workers) never share state.
+
+    def test_result(open_protocol_emulator):
+        sock = socket.create_connection(("127.0.0.1", open_protocol_emulator.port))
+        ...
+"""
+import itertools
+
+import pytest
+
+from open_protocol_emulator import OpenProtocolEmulator
+
+
+@pytest.fixture
+def open_protocol_factory(tmp_path):
+    """
+    Factory for started emulators: make(controller_name=..., profile=..., **settings), where
+    settings go to apply_settings() (e.g. nok_probability=0). All are stopped at teardown.
+    """
+    started = []
+    numbers = itertools.count(1)
+
+    def make(controller_name: str = "OpenProtocolSim", profile: str = None, **settings) -> OpenProtocolEmulator:
+        data_dir = tmp_path / f"emulator-{next(numbers)}"
+        data_dir.mkdir()
+        emulator = OpenProtocolEmulator(host="127.0.0.1", port=0, controller_name=controller_name,
+                                        data_dir=str(data_dir))
+        if profile:
+            emulator.apply_profile(profile)
+        if settings:
+            emulator.apply_settings(settings)
+        emulator.start()
+        started.append(emulator)
+        return emulator
+
+    yield make
+    for emulator in reversed(started):
+        emulator.stop()
+
+
+@pytest.fixture
+def open_protocol_emulator(open_protocol_factory) -> OpenProtocolEmulator:
+    """One started emulator on a free port (see `.port`)."""
+    return open_protocol_factory()
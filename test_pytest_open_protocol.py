@@ -0,0 +1,66 @@
+"""Tests for the pytest_open_protocol fixtures (run with `python -m pytest`)."""
+import socket
+
+import pytest
+
+from open_protocol_emulator import build_message
+
+pytest_plugins = ["pytest_open_protocol"]
+
+
+def recv_frame(sock: socket.socket, buffer: bytearray) -> bytes:
+    """Read one NUL-terminated frame, keeping any following bytes in `buffer`."""
+    while b"\x00" not in buffer:
+        data = sock.recv(4096)
+        assert data, "connection closed before a complete frame arrived"
+        buffer += data
+    end = buffer.index(b"\x00") + 1
+    frame = bytes(buffer[:end])
+    del buffer[:end]
+    return frame
+
+
+def recv_mid(sock: socket.socket, buffer: bytearray, mid: bytes) -> bytes:
+    """Read frames until one with the given MID arrives (keep-alives and events may interleave)."""
+    while True:
+        frame = recv_frame(sock, buffer)
+        if frame[4:8] == mid:
+            return frame
+
+
+def connect(emulator) -> socket.socket:
+    return socket.create_connection(("127.0.0.1", emulator.port), timeout=5)
+
+
+def test_result_round_trip(open_protocol_factory):
+    emulator = open_protocol_factory(nok_probability=0)
+    buffer = bytearray()
+    with connect(emulator) as sock:
+        sock.sendall(build_message(1, rev=1))
+        assert recv_mid(sock, buffer, b"0002")
+        sock.sendall(build_message(60, rev=1))
+        assert recv_mid(sock, buffer, b"0005")[20:24] == b"0060"
+
+        assert emulator.send_single_tightening_result()
+        frame = recv_mid(sock, buffer, b"0061")
+        assert int(frame[:4]) == len(frame) - 1
+        assert emulator.last_result[0] == "1"
+
+    emulator.stop()
+    with pytest.raises(OSError):
+        socket.create_connection(("127.0.0.1", emulator.port), timeout=1).close()
+
+
+def test_emulators_are_isolated(open_protocol_factory):
+    first = open_protocol_factory(controller_name="First")
+    second = open_protocol_factory(controller_name="Second", vin="XYZ0001")
+    assert first.port and second.port and first.port != second.port
+    assert first.pset_writer.path != second.pset_writer.path
+    assert first.current_vin != second.current_vin
+
+    buffer = bytearray()
+    with connect(second) as sock:
+        sock.sendall(build_message(1, rev=1))
+        assert b"Second" in recv_mid(sock, buffer, b"0002")
+        assert second.session_active
+        assert not first.session_active